@@ -6,6 +6,19 @@ from dotenv import load_dotenv
 import os
 import logging
 
+from .assets import StaticAssets
+from .compression import Compress
+from .metrics import Metrics
+from .slowlog import SlowRequestLog
+from .profiler import RequestProfiler
+from .changelog import ChangeArchiver
+from .changefeed import ChangeFeed
+from .stream import FleetStream
+from .invalidation import InvalidationBus
+from .cache import ResponseCache
+from .coalesce import RequestCoalescer
+from . import serialization
+
 # Configuration du logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -14,28 +27,91 @@ logger.setLevel(logging.INFO)
 load_dotenv()
 
 db = SQLAlchemy()
+assets = StaticAssets()
+compress = Compress()
+metrics = Metrics()
+slowlog = SlowRequestLog()
+profiler = RequestProfiler()
+changelog = ChangeArchiver()
+changefeed = ChangeFeed()
+stream = FleetStream()
+invalidation = InvalidationBus()
+response_cache = ResponseCache()
+coalescer = RequestCoalescer()
 
-def create_app():
-    app = Flask(__name__, static_folder='static', static_url_path='/static')
+def create_app(config=None):
+    # Les fichiers statiques sont servis par main_bp (compression et cache)
+    app = Flask(__name__, static_folder=None)
     
     # Configuration CORS
     CORS(app, resources={
         r"/api/*": {
             "origins": ["http://localhost:5173", "http://localhost:5000", "http://127.0.0.1:5000"],
-            "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-            "allow_headers": ["Content-Type", "Authorization"]
+            "methods": ["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
+            "allow_headers": ["Content-Type", "Authorization", "X-Profile"],
+            "expose_headers": ["X-Profile-Id"]
         }
     })
     
     # Configuration de la base de données
-    db_path = os.path.join('/home/Youssefaz/turo-fleet-manager/instance', 'fleet.db')
-    os.makedirs(os.path.dirname(db_path), exist_ok=True)
-    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    database_url = (config or {}).get('SQLALCHEMY_DATABASE_URI') or os.environ.get('DATABASE_URL')
+    if not database_url:
+        # Chemin par défaut, créé seulement si ni la configuration ni DATABASE_URL n'en fournit un
+        db_path = os.path.join('/home/Youssefaz/turo-fleet-manager/instance', 'fleet.db')
+        try:
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        except OSError:
+            # Hors du serveur de production : dossier instance/ de l'application
+            db_path = os.path.join(app.instance_path, 'fleet.db')
+            os.makedirs(app.instance_path, exist_ok=True)
+            logger.warning(f"Dossier de production inaccessible, base par défaut : {db_path}")
+        database_url = f'sqlite:///{db_path}'
+    elif database_url.startswith('postgres://'):
+        database_url = database_url.replace('postgres://', 'postgresql://', 1)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev_key_12345')
+    app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+    app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR')
+    app.config['SLOW_REQUEST_THRESHOLD_MS'] = float(os.environ.get('SLOW_REQUEST_THRESHOLD_MS', 500))
+    app.config['SLOW_REQUEST_BUFFER_SIZE'] = int(os.environ.get('SLOW_REQUEST_BUFFER_SIZE', 100))
+    app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR')
+    app.config['CHANGELOG_DIR'] = os.environ.get('CHANGELOG_DIR')
+    app.config['INVALIDATION_DIR'] = os.environ.get('INVALIDATION_DIR')
+    app.config['INVALIDATION_URL'] = os.environ.get('INVALIDATION_URL')
+    app.config['RESPONSE_CACHE_MAX_BYTES'] = int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    app.config['RESPONSE_CACHE_TTL'] = float(os.environ.get('RESPONSE_CACHE_TTL', 300))
+    app.config['COALESCE_DIR'] = os.environ.get('COALESCE_DIR')
+    app.config['IDEMPOTENCY_KEY_DAYS'] = int(os.environ.get('IDEMPOTENCY_KEY_DAYS', 30))
+    app.config['STREAM_MAX_SUBSCRIBERS'] = int(os.environ.get('STREAM_MAX_SUBSCRIBERS', 24))
+    app.config['ADMIN_USERNAMES'] = [
+        name.strip() for name in os.environ.get('ADMIN_USERNAMES', '').split(',') if name.strip()
+    ]
+
+    # Surcharges explicites (bancs d'essai, outils en ligne de commande)
+    if config:
+        app.config.update(config)
     
     db.init_app(app)
     migrate = Migrate(app, db)
+    assets.init_app(app)
+    # metrics avant compress : ses after_request s'exécutent en dernier et
+    # mesurent donc la taille compressée
+    metrics.init_app(app)
+    slowlog.init_app(app)
+    compress.init_app(app, blueprint='api')
+    # En dernier : le profilage couvre la vue, pas les autres hooks
+    profiler.init_app(app)
+    serialization.init_app(app)
+    changelog.init_app(app)
+    changefeed.init_app(app)
+    stream.init_app(app)
+    invalidation.init_app(app)
+    response_cache.init_app(app)
+    coalescer.init_app(app)
+
+    from .cli import fleet_cli
+    app.cli.add_command(fleet_cli)
     
     with app.app_context():
         from .routes import api_bp, main_bp
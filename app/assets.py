@@ -0,0 +1,194 @@
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+import shutil
+
+from flask import Response, abort, request, send_from_directory
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # brotli est optionnel, on se contente de gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Extensions fingerprintées et précompressées par le build
+FINGERPRINT_EXTENSIONS = ('.js', '.css', '.svg')
+HTML_PAGES = ('index.html', 'dashboard.html')
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+
+# Encodages proposés par ordre de préférence, avec le suffixe du fichier précompressé
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+_STATIC_URL_RE = re.compile(r'(["\'(])/static/([^"\')?#]+)')
+
+
+def _digest(data, length=12):
+    return hashlib.sha256(data).hexdigest()[:length]
+
+
+def _hashed_name(rel_path, data):
+    root, ext = os.path.splitext(rel_path)
+    return f"{root}.{_digest(data)}{ext}"
+
+
+def _write_compressed(path, data):
+    with open(path + '.gz', 'wb') as f:
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(path + '.br', 'wb') as f:
+            f.write(brotli.compress(data, quality=11))
+
+
+def rewrite_static_urls(html, manifest):
+    # Remplace /static/js/main.js par /static/dist/js/main.<hash>.js
+    def replace(match):
+        hashed = manifest.get(match.group(2))
+        if hashed is None:
+            return match.group(0)
+        return f"{match.group(1)}/static/{DIST_DIR}/{hashed}"
+    return _STATIC_URL_RE.sub(replace, html)
+
+
+def build_assets(static_dir):
+    """Fingerprinte et précompresse les fichiers statiques dans static/dist."""
+    dist_dir = os.path.join(static_dir, DIST_DIR)
+    if os.path.exists(dist_dir):
+        shutil.rmtree(dist_dir)
+    os.makedirs(dist_dir)
+
+    manifest = {}
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != dist_dir]
+        for name in sorted(files):
+            if not name.endswith(FINGERPRINT_EXTENSIONS):
+                continue
+            src = os.path.join(root, name)
+            rel_path = os.path.relpath(src, static_dir).replace(os.sep, '/')
+            with open(src, 'rb') as f:
+                data = f.read()
+
+            hashed = _hashed_name(rel_path, data)
+            dst = os.path.join(dist_dir, hashed)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            with open(dst, 'wb') as f:
+                f.write(data)
+            _write_compressed(dst, data)
+            manifest[rel_path] = hashed
+
+    # Les pages HTML gardent leur nom mais pointent vers les fichiers hashés
+    for page in HTML_PAGES:
+        src = os.path.join(static_dir, page)
+        if not os.path.exists(src):
+            continue
+        with open(src, 'r', encoding='utf-8') as f:
+            html = rewrite_static_urls(f.read(), manifest)
+        with open(os.path.join(dist_dir, page), 'w', encoding='utf-8') as f:
+            f.write(html)
+
+    with open(os.path.join(dist_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    logger.info(f"{len(manifest)} fichiers statiques fingerprintés dans {dist_dir}")
+    if brotli is None:
+        logger.warning("Module brotli absent : seules les variantes .gz ont été générées")
+    return manifest
+
+
+class _Page:
+    # Page HTML gardée en mémoire avec ses variantes compressées
+    def __init__(self, data):
+        self.etag = _digest(data, 16)
+        self.variants = {'identity': data, 'gzip': gzip.compress(data, mtime=0)}
+        if brotli is not None:
+            self.variants['br'] = brotli.compress(data)
+
+
+class StaticAssets:
+    def __init__(self, app=None):
+        self.static_dir = None
+        self.pages = {}
+        self._hashed = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.static_dir = os.path.join(app.root_path, 'static')
+        app.extensions['static_assets'] = self
+
+    @property
+    def dist_dir(self):
+        return os.path.join(self.static_dir, DIST_DIR)
+
+    def _load_page(self, name):
+        # On privilégie la version du build, qui référence les fichiers hashés
+        for directory in (self.dist_dir, self.static_dir):
+            path = os.path.join(directory, name)
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    return _Page(f.read())
+        raise FileNotFoundError(name)
+
+    def hashed_files(self):
+        # Chemins (relatifs à dist/) des fichiers fingerprintés, d'après le manifeste
+        if self._hashed is None:
+            try:
+                with open(os.path.join(self.dist_dir, MANIFEST_NAME), encoding='utf-8') as f:
+                    self._hashed = frozenset(json.load(f).values())
+            except FileNotFoundError:
+                return frozenset()
+        return self._hashed
+
+    def _negotiate(self, available):
+        offered = [encoding for encoding, _ in ENCODINGS if encoding in available]
+        return request.accept_encodings.best_match(offered, default='identity')
+
+    def page_response(self, name):
+        page = self.pages.get(name)
+        if page is None:
+            page = self.pages[name] = self._load_page(name)
+
+        encoding = self._negotiate(page.variants)
+        response = Response(page.variants[encoding], mimetype='text/html')
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = REVALIDATE_CACHE_CONTROL
+        response.set_etag(f"{page.etag}-{encoding}")
+        return response.make_conditional(request)
+
+    def static_response(self, filename):
+        if not filename.startswith(DIST_DIR + '/'):
+            return send_from_directory(self.static_dir, filename, max_age=0)
+
+        path = safe_join(self.static_dir, filename)
+        if path is None:
+            abort(404)
+        available = [encoding for encoding, suffix in ENCODINGS
+                     if os.path.exists(path + suffix)]
+        encoding = self._negotiate(available)
+        suffix = dict(ENCODINGS).get(encoding, '')
+
+        # Seuls les fichiers hashés sont immuables ; les pages et le manifeste
+        # de dist/ gardent leur nom d'un build à l'autre
+        immutable = filename[len(DIST_DIR) + 1:] in self.hashed_files()
+
+        # Le type MIME reste celui du fichier d'origine, pas celui du .gz/.br
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = send_from_directory(self.static_dir, filename + suffix, mimetype=mimetype,
+                                       max_age=31536000 if immutable else 0)
+        if suffix:
+            response.headers.pop('Content-Disposition', None)
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL
+        return response
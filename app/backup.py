@@ -0,0 +1,270 @@
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from sqlalchemy.engine import make_url
+
+from .serialization import dumps
+
+try:
+    import zstandard
+except ImportError:  # zstd est optionnel, gzip reste le format par défaut
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = 'manifest.json'
+DATABASE_FILE = 'fleet.db'
+DATA_DIR = 'data'
+
+# Copie par tranches de pages, avec une pause entre deux tranches pour laisser
+# passer les écritures de l'application
+STEP_PAGES = 256
+STEP_SLEEP = 0.05
+# Au-delà, la copie est terminée en une seule étape
+MAX_RESTARTS = 3
+
+# Export : lignes lues par fetchmany, tables exportées en parallèle
+EXPORT_BATCH = 5000
+EXPORT_WORKERS = 4
+# 'none' : export brut, compressé bloc par bloc par le dépôt des instantanés
+CODECS = {'gzip': '.ndjson.gz', 'zstd': '.ndjson.zst', 'none': '.ndjson'}
+
+
+class BackupError(Exception):
+    pass
+
+
+def sqlite_path(database_uri):
+    url = make_url(database_uri)
+    if url.get_backend_name() != 'sqlite' or not url.database:
+        raise BackupError(f"Sauvegarde en ligne disponible pour SQLite uniquement ({url.get_backend_name()})")
+    return url.database
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def integrity_check(path):
+    # Liste des problèmes relevés par SQLite ; vide si la base est saine
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = [row[0] for row in conn.execute('PRAGMA integrity_check')]
+    finally:
+        conn.close()
+    return [] if rows == ['ok'] else rows
+
+
+class _Restarted(Exception):
+    pass
+
+
+def online_backup(source, target, pages=STEP_PAGES, sleep=STEP_SLEEP, max_restarts=MAX_RESTARTS):
+    """Copie cohérente d'une base SQLite en service via l'API de sauvegarde."""
+    stats = {'steps': 0, 'restarts': 0}
+
+    def progress(status, remaining, total):
+        stats['steps'] += 1
+        # Une écriture d'une autre connexion fait repartir la copie du début
+        if remaining > stats.get('remaining', remaining):
+            stats['restarts'] += 1
+            if stats['restarts'] > max_restarts:
+                raise _Restarted()
+        stats['remaining'] = remaining
+        # L'API ne dort qu'en cas de verrou ; on cède aussi la main entre les tranches
+        if remaining:
+            time.sleep(sleep)
+
+    src = sqlite3.connect(source, timeout=30)
+    dst = sqlite3.connect(target)
+    try:
+        try:
+            src.backup(dst, pages=pages, progress=progress, sleep=sleep)
+        except _Restarted:
+            # Écritures trop fréquentes pour une copie par tranches : copie en une
+            # seule étape, sous un verrou de lecture (non bloquant en mode WAL)
+            logger.warning(f"Copie de {source} relancée {stats['restarts']} fois, finalisée en une étape")
+            src.backup(dst, pages=-1)
+        page_count = dst.execute('PRAGMA page_count').fetchone()[0]
+    finally:
+        dst.close()
+        src.close()
+    return {'pages': page_count, 'steps': stats['steps'], 'restarts': stats['restarts']}
+
+
+def _open_compressed(path, codec):
+    if codec == 'gzip':
+        # Niveau 6 : l'export est limité par la compression, pas par la lecture
+        return gzip.open(path, 'wb', compresslevel=6)
+    if codec == 'zstd':
+        if zstandard is None:
+            raise BackupError("Export zstd : le paquet zstandard n'est pas installé")
+        return zstandard.ZstdCompressor(level=3).stream_writer(open(path, 'wb'), closefd=True)
+    if codec == 'none':
+        return open(path, 'wb')
+    raise BackupError(f"Format de compression inconnu : {codec}")
+
+
+def open_export(path):
+    # Lecture d'un export, quel que soit son format
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if path.endswith('.ndjson'):
+        return open(path, 'rb')
+    if zstandard is None:
+        raise BackupError(f"{path} : le paquet zstandard n'est pas installé")
+    return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True))
+
+
+def table_rows(conn, table, batch=EXPORT_BATCH):
+    """(colonnes, itérateur de lignes) d'une table, lue par lots, triée par clé primaire."""
+    cursor = conn.execute(f'SELECT * FROM "{table}" ORDER BY rowid')
+    columns = [description[0] for description in cursor.description]
+
+    def rows():
+        while True:
+            chunk = cursor.fetchmany(batch)
+            if not chunk:
+                return
+            yield from chunk
+    return columns, rows()
+
+
+def export_table(source, table, directory, codec='gzip', batch=EXPORT_BATCH):
+    # Une ligne JSON (tableau de valeurs) par enregistrement ; la somme de contrôle
+    # porte sur le NDJSON décompressé, indépendamment du format
+    conn = sqlite3.connect(f"file:{source}?mode=ro", uri=True)
+    name = table + CODECS[codec]
+    digest = hashlib.sha256()
+    count = 0
+    try:
+        columns, rows = table_rows(conn, table, batch)
+        with _open_compressed(os.path.join(directory, name), codec) as f:
+            for row in rows:
+                line = dumps(row) + b'\n'
+                digest.update(line)
+                f.write(line)
+                count += 1
+    finally:
+        conn.close()
+    return {'file': f"{DATA_DIR}/{name}", 'columns': columns, 'rows': count,
+            'sha256': digest.hexdigest()}
+
+
+def export_tables(source, directory, codec='gzip', workers=EXPORT_WORKERS):
+    """Exporte toutes les tables des modèles en NDJSON compressé ; retourne {table: entrée}."""
+    from . import db, models  # noqa: F401 (tables des modèles)
+
+    data_dir = os.path.join(directory, DATA_DIR)
+    os.makedirs(data_dir, exist_ok=True)
+    tables = [table.name for table in db.metadata.sorted_tables]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {table: pool.submit(export_table, source, table, data_dir, codec)
+                   for table in tables}
+        return {table: future.result() for table, future in futures.items()}
+
+
+def write_manifest(directory, manifest):
+    path = os.path.join(directory, MANIFEST)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    return path
+
+
+def read_manifest(directory):
+    with open(os.path.join(directory, MANIFEST), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _new_directory(root, created_at):
+    # Dossier propre à chaque sauvegarde : suffixe si une autre a démarré dans la même seconde
+    os.makedirs(root, exist_ok=True)
+    name = created_at.strftime('%Y%m%d_%H%M%S')
+    for attempt in range(100):
+        directory = os.path.join(root, name if attempt == 0 else f"{name}_{attempt}")
+        try:
+            os.mkdir(directory)
+            return directory
+        except FileExistsError:
+            continue
+    raise BackupError(f"Impossible de créer un dossier de sauvegarde dans {root}")
+
+
+def backup_database(source, root, pages=STEP_PAGES, sleep=STEP_SLEEP, codec='gzip'):
+    """Sauvegarde la base dans root/<horodatage>/ ; retourne (dossier, manifeste)."""
+    if not os.path.exists(source):
+        raise BackupError(f"Base introuvable : {source}")
+
+    created_at = datetime.utcnow()
+    directory = _new_directory(root, created_at)
+    target = os.path.join(directory, DATABASE_FILE)
+
+    started = time.perf_counter()
+    copy = online_backup(source, target, pages, sleep)
+    problems = integrity_check(target)
+    if problems:
+        os.remove(target)
+        raise BackupError(f"Copie corrompue ({source}) : {'; '.join(problems[:5])}")
+
+    manifest = {
+        'created_at': created_at.isoformat(),
+        'source': os.path.abspath(source),
+        'database': {
+            'file': DATABASE_FILE,
+            'size': os.path.getsize(target),
+            'sha256': file_sha256(target),
+            'pages': copy['pages'],
+            'integrity': 'ok',
+        },
+        'restarts': copy['restarts'],
+    }
+    # Export depuis la copie : instantané cohérent, sans charger la base en service
+    if codec:
+        manifest['codec'] = codec
+        manifest['tables'] = export_tables(target, directory, codec)
+    manifest['duration'] = round(time.perf_counter() - started, 3)
+    write_manifest(directory, manifest)
+    logger.info(f"Base sauvegardée dans {directory} ({copy['pages']} pages, {copy['steps']} tranches)")
+    return directory, manifest
+
+
+def verify_database(directory):
+    # Vérifie une sauvegarde contre son manifeste ; retourne la liste des erreurs
+    manifest = read_manifest(directory)
+    entry = manifest['database']
+    path = os.path.join(directory, entry['file'])
+    if not os.path.exists(path):
+        return [f"{entry['file']} manquant"]
+    if file_sha256(path) != entry['sha256']:
+        return [f"{entry['file']} : somme de contrôle différente du manifeste"]
+    problems = integrity_check(path)
+    for table, export in manifest.get('tables', {}).items():
+        problems.extend(verify_export(directory, table, export))
+    return problems
+
+
+def verify_export(directory, table, export):
+    path = os.path.join(directory, export['file'])
+    if not os.path.exists(path):
+        return [f"{export['file']} manquant"]
+    digest = hashlib.sha256()
+    count = 0
+    with open_export(path) as f:
+        for line in f:
+            digest.update(line)
+            count += 1
+    if count != export['rows'] or digest.hexdigest() != export['sha256']:
+        return [f"{table} : {count} lignes exportées, contenu différent du manifeste"]
+    return []
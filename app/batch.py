@@ -0,0 +1,96 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.exceptions import HTTPException
+
+from . import db
+from .models import User
+from .serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+# Requêtes groupées (POST /api/batch) : chaque sous-requête est confiée à la vue
+# de l'API correspondante, sans passer par HTTP ni par les hooks de requête. Le
+# porteur du token, authentifié une fois pour le lot, est transmis dans l'environ
+# WSGI des sous-requêtes (inaccessible à un client HTTP) et repris par login_required.
+BATCH_MAX = 50
+BATCH_WORKERS = 4
+SUBREQUEST_USER = 'fleet.batch_user'
+EXCLUDED_ENDPOINTS = ('api.batch', 'api.stream_fleet')
+
+
+def _result(status, body):
+    return b'{"status":' + str(status).encode() + b',"body":' + body + b'}'
+
+
+def _error(status, message):
+    return _result(status, dumps({'error': message}))
+
+
+def dispatch(app, user, item):
+    """Exécute une sous-requête {method, path, body} ; retourne son résultat
+    sérialisé {status, body}."""
+    if not isinstance(item, dict) or not isinstance(item.get('path'), str) or not item['path'].startswith('/'):
+        return _error(400, "Sous-requête invalide : {method, path, body} attendu")
+    method = str(item.get('method', 'GET')).upper()
+    with app.test_request_context(item['path'], method=method, json=item.get('body'),
+                                  environ_overrides={SUBREQUEST_USER: user}) as ctx:
+        request = ctx.request
+        if request.routing_exception is not None:
+            exc = request.routing_exception
+            return _error(getattr(exc, 'code', 400), getattr(exc, 'description', str(exc)))
+        endpoint = request.url_rule.endpoint
+        if not endpoint.startswith('api.'):
+            return _error(404, f"Route inconnue de l'API : {item['path']}")
+        if endpoint in EXCLUDED_ENDPOINTS:
+            return _error(400, f"Route non autorisée dans un lot : {item['path']}")
+        try:
+            response = app.make_response(app.view_functions[endpoint](**request.view_args))
+        except HTTPException as e:
+            return _error(e.code, e.description)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Erreur d'une sous-requête {method} {item['path']} : {e}")
+            return _error(500, str(e))
+        if response.is_json:
+            return _result(response.status_code, response.get_data())
+        return _result(response.status_code, dumps(response.get_data(as_text=True)))
+
+
+def _dispatch_thread(app, user_id, item):
+    # Thread à part : contexte d'application et session propres. L'utilisateur est
+    # rechargé dans cette session : celui du lot appartient à la session (et à la
+    # connexion SQLite) du thread du lot, et une écriture précédente l'a expiré
+    with app.app_context():
+        return dispatch(app, User.query.get(user_id), item)
+
+
+def run_batch(app, user, items, parallel=False, workers=BATCH_WORKERS):
+    """Résultats des sous-requêtes, dans l'ordre. Avec parallel, les lectures (GET)
+    consécutives sont exécutées en parallèle ; les écritures restent séquentielles,
+    dans la session de la requête du lot."""
+    results = []
+    reads = []
+
+    def flush_reads():
+        if len(reads) > 1:
+            user_id = user.id  # lu dans ce thread : l'objet peut être expiré
+            with ThreadPoolExecutor(max_workers=min(workers, len(reads))) as executor:
+                results.extend(executor.map(lambda item: _dispatch_thread(app, user_id, item), reads))
+        elif reads:
+            results.append(dispatch(app, user, reads[0]))
+        reads.clear()
+
+    for item in items:
+        if parallel and isinstance(item, dict) and str(item.get('method', 'GET')).upper() == 'GET':
+            reads.append(item)
+            continue
+        flush_reads()
+        results.append(dispatch(app, user, item))
+    flush_reads()
+    return results
+
+
+def batch_response(app, results):
+    body = b'{"responses":[' + b','.join(results) + b']}\n'
+    return app.response_class(body, mimetype='application/json')
@@ -0,0 +1,230 @@
+import csv
+import io
+import logging
+from datetime import datetime
+
+from sqlalchemy import case, insert, update
+
+from . import db
+from .changefeed import record_changes
+from .changelog import record_rows
+from .models import Vehicle, ActionHistory
+
+logger = logging.getLogger(__name__)
+
+# Écritures groupées sur les véhicules : une instruction ensembliste par lot au
+# lieu d'une requête, d'un commit et d'une entrée d'historique par véhicule.
+# Ces écritures ne passent pas par le flush de l'ORM : flux de synchronisation
+# et journal des modifications sont alimentés explicitement.
+VEHICLE_BULK_MAX = 500
+VEHICLE_IMPORT_MAX = 5000
+INSERT_BATCH_SIZE = 500  # lignes par INSERT multi-lignes (limite de paramètres SQLite)
+
+STATUS_FIELDS = ('status', 'parking_spot')
+VEHICLE_FIELDS = ('brand', 'model', 'year', 'license_plate', 'status', 'parking_spot')
+REQUIRED_FIELDS = ('brand', 'model', 'year', 'license_plate')
+
+
+class BulkError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def insert_rows(model, rows):
+    """INSERT multi-lignes par lots dans la transaction courante, sans commit ;
+    l'identifiant attribué est ajouté à chaque ligne, qui est archivée."""
+    table = model.__table__
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        batch = rows[start:start + INSERT_BATCH_SIZE]
+        statement = insert(model).values(batch)
+        if db.engine.dialect.name == 'sqlite':
+            # Une seule instruction, base verrouillée en écriture : identifiants contigus
+            last = db.session.execute(statement).lastrowid
+            ids = range(last - len(batch) + 1, last + 1)
+        else:
+            ids = [row[0] for row in db.session.execute(statement.returning(table.c.id))]
+        for row, row_id in zip(batch, ids):
+            row['id'] = row_id
+    record_rows(db.session(), table.name, rows)
+    return rows
+
+
+def insert_audit(user, entries):
+    """Historique de entries [(action, type d'entité, id, changements)] en INSERT
+    multi-lignes, dans la transaction courante, sans commit."""
+    now = datetime.utcnow()
+    insert_rows(ActionHistory, [{'user_id': user.id, 'action_type': action_type, 'entity_type': entity_type,
+                                 'entity_id': entity_id, 'changes': changes, 'created_at': now}
+                                for action_type, entity_type, entity_id, changes in entries])
+
+
+def _parse_updates(items):
+    if not isinstance(items, list):
+        raise BulkError("Liste de modifications requise : [{id, status, parking_spot}]")
+    if len(items) > VEHICLE_BULK_MAX:
+        raise BulkError(f"{VEHICLE_BULK_MAX} véhicules au maximum par lot", 413)
+    wanted = {}
+    for item in items:
+        if not isinstance(item, dict) or not isinstance(item.get('id'), int) or isinstance(item['id'], bool):
+            raise BulkError(f"Modification invalide : {item!r}")
+        fields = {field: item[field] for field in STATUS_FIELDS if field in item}
+        if not fields:
+            raise BulkError(f"Véhicule {item['id']} : status ou parking_spot attendu")
+        for field, value in fields.items():
+            if value is not None and not isinstance(value, str):
+                raise BulkError(f"Véhicule {item['id']} : {field} invalide")
+        if fields.get('status', '') is None:
+            raise BulkError(f"Véhicule {item['id']} : status ne peut pas être vide")
+        wanted.setdefault(item['id'], {}).update(fields)
+    return wanted
+
+
+def update_vehicles(user, items):
+    """Applique [{id, status, parking_spot}] : un SELECT des valeurs actuelles, un
+    UPDATE ... WHERE id IN, un INSERT d'historique et un seul commit."""
+    wanted = _parse_updates(items)
+    table = Vehicle.__table__
+    current = {row.id: row for row in db.session.query(Vehicle.id, Vehicle.status, Vehicle.parking_spot)
+               .filter(Vehicle.id.in_(list(wanted)))}
+
+    changes = {}
+    for vehicle_id, fields in wanted.items():
+        row = current.get(vehicle_id)
+        if row is None:
+            continue
+        diff = {field: {'old': getattr(row, field), 'new': value}
+                for field, value in fields.items() if value != getattr(row, field)}
+        if diff:
+            changes[vehicle_id] = diff
+
+    if changes:
+        values = {}
+        for field in STATUS_FIELDS:
+            new = {vehicle_id: diff[field]['new'] for vehicle_id, diff in changes.items() if field in diff}
+            if not new:
+                continue
+            distinct = set(new.values())
+            if len(new) == len(changes) and len(distinct) == 1:
+                values[field] = distinct.pop()
+            else:
+                values[field] = case(new, value=table.c.id, else_=table.c[field])
+        db.session.execute(update(Vehicle).where(Vehicle.id.in_(list(changes))).values(values)
+                           .execution_options(synchronize_session=False))
+        record_changes(db.session(), [('vehicle', vehicle_id, False) for vehicle_id in changes])
+        insert_audit(user, [('update', 'vehicle', vehicle_id, diff) for vehicle_id, diff in changes.items()])
+        db.session.commit()
+
+    return {
+        'message': f"{len(changes)} véhicule(s) mis à jour",
+        'updated': [{'id': vehicle_id, 'changes': diff} for vehicle_id, diff in changes.items()],
+        'unchanged': sorted(set(current) - set(changes)),
+        'not_found': sorted(set(wanted) - set(current)),
+    }
+
+
+# Création en masse (POST /api/vehicles/bulk, flask fleet import-vehicles)
+
+def parse_vehicle_csv(text):
+    """Lignes d'un CSV de véhicules (en-tête : brand, model, year, license_plate,
+    status, parking_spot ; séparateur virgule, point-virgule ou tabulation)."""
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.DictReader(io.StringIO(text), dialect=dialect)
+    columns = [name.strip() for name in reader.fieldnames or ()]
+    missing = [field for field in REQUIRED_FIELDS if field not in columns]
+    if missing:
+        raise BulkError(f"Colonnes manquantes : {', '.join(missing)}")
+    reader.fieldnames = columns
+    return [{key: value.strip() if isinstance(value, str) else value
+             for key, value in row.items() if key in VEHICLE_FIELDS}
+            for row in reader]
+
+
+def _validate_vehicle(item):
+    # Ligne normalisée et liste d'erreurs
+    if not isinstance(item, dict):
+        return None, ['Ligne invalide : objet attendu']
+    errors = []
+    row = {}
+    columns = Vehicle.__table__.c
+    for field in VEHICLE_FIELDS:
+        value = item.get(field)
+        if isinstance(value, str):
+            value = value.strip() or None
+        if value is None:
+            if field in REQUIRED_FIELDS:
+                errors.append(f"{field} requis")
+            row[field] = 'available' if field == 'status' else None
+            continue
+        if field == 'year':
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                errors.append(f"year invalide : {value!r}")
+                continue
+            if not 1900 <= value <= datetime.utcnow().year + 1:
+                errors.append(f"year hors limites : {value}")
+        elif not isinstance(value, str):
+            errors.append(f"{field} invalide : {value!r}")
+            continue
+        elif len(value) > columns[field].type.length:
+            errors.append(f"{field} trop long ({columns[field].type.length} caractères au plus)")
+        row[field] = value
+    return row, errors
+
+
+def create_vehicles(user, items, partial=False):
+    """Valide tout le lot (champs, plaques en double dans le lot ou déjà en base,
+    en une requête), puis insère les véhicules par lots avec leur historique, en une
+    transaction. Sans partial, la moindre erreur n'insère rien ; avec partial, les
+    lignes valides sont insérées et les erreurs rapportées ligne par ligne."""
+    if not isinstance(items, list):
+        raise BulkError("Liste de véhicules requise")
+    if len(items) > VEHICLE_IMPORT_MAX:
+        raise BulkError(f"{VEHICLE_IMPORT_MAX} véhicules au maximum par lot", 413)
+
+    rows = []
+    errors = {}
+    first_index = {}
+    for index, item in enumerate(items):
+        row, row_errors = _validate_vehicle(item)
+        plate = row.get('license_plate') if row else None
+        if plate is not None:
+            if plate in first_index:
+                row_errors.append(f"license_plate en double dans le lot (index {first_index[plate]})")
+            else:
+                first_index[plate] = index
+        rows.append(row)
+        if row_errors:
+            errors[index] = row_errors
+
+    # Plaques déjà en base : une requête sur l'index unique
+    if first_index:
+        existing = {plate for plate, in db.session.query(Vehicle.license_plate)
+                    .filter(Vehicle.license_plate.in_(list(first_index)))}
+        for index, row in enumerate(rows):
+            if row and row.get('license_plate') in existing:
+                errors.setdefault(index, []).append(f"license_plate déjà utilisée : {row['license_plate']}")
+
+    report = [{'index': index, 'license_plate': rows[index].get('license_plate') if rows[index] else None,
+               'errors': row_errors} for index, row_errors in sorted(errors.items())]
+    valid = [(index, row) for index, row in enumerate(rows) if index not in errors]
+    if errors and not partial:
+        return {'message': f"{len(errors)} ligne(s) invalide(s), aucun véhicule créé",
+                'created': [], 'errors': report}
+
+    created = []
+    if valid:
+        now = datetime.utcnow()
+        inserted = insert_rows(Vehicle, [dict(row, created_at=now) for _, row in valid])
+        record_changes(db.session(), [('vehicle', row['id'], False) for row in inserted])
+        insert_audit(user, [('create', 'vehicle', row['id'], {field: row[field] for field in VEHICLE_FIELDS})
+                            for row in inserted])
+        db.session.commit()
+        created = [{'index': index, 'id': row['id'], 'license_plate': row['license_plate']}
+                   for (index, _), row in zip(valid, inserted)]
+    return {'message': f"{len(created)} véhicule(s) créé(s)", 'created': created, 'errors': report}
@@ -0,0 +1,214 @@
+import collections
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, request
+from sqlalchemy import inspect as sa_inspect
+
+from .invalidation import ALL
+from .serialization import dumps
+
+# Cache des réponses des routes de lecture. Chaque réponse est étiquetée avec ce
+# dont elle dépend : une table entière (« vehicle ») ou des lignes (« vehicle:42 »,
+# « notes:vehicle:42 »). Les écritures validées sont remises par le bus
+# d'invalidation, qui évince les réponses portant une de leurs étiquettes. Une
+# réponse qui dépend de lignes porte aussi « <table>:* », diffusée par les
+# UPDATE / DELETE en masse dont les lignes ne sont pas connues.
+MAX_BYTES = 64 * 1024 * 1024
+TTL = 300
+ENTRY_OVERHEAD = 256  # estimation de la place prise par la clé et l'entrée
+MAX_EPOCH_TAGS = 10000
+
+
+def row_tags(table, *ids):
+    """Étiquettes d'une réponse qui dépend de lignes de table."""
+    return [f'{table}:{id}' for id in ids] + [f'{table}:*']
+
+
+class _Entry:
+    __slots__ = ('body', 'mimetype', 'tags', 'expires', 'size')
+
+    def __init__(self, body, mimetype, tags, expires):
+        self.body = body
+        self.mimetype = mimetype
+        self.tags = tags
+        self.expires = expires
+        self.size = len(body) + ENTRY_OVERHEAD
+
+
+class ResponseCache:
+    def __init__(self, app=None):
+        self.max_bytes = MAX_BYTES
+        self.ttl = TTL
+        self.size = 0
+        self._entries = collections.OrderedDict()  # ordre LRU, le plus ancien en tête
+        self._by_tag = {}
+        self._lock = threading.Lock()
+        # Numéro de la dernière invalidation de chaque étiquette : une réponse
+        # calculée pendant une invalidation de ses étiquettes n'est pas gardée
+        self._epoch = 0
+        self._tag_epochs = {}
+        self._cleared = 0
+        self._metrics = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # RESPONSE_CACHE_MAX_BYTES=0 désactive le cache
+        self.max_bytes = app.config.get('RESPONSE_CACHE_MAX_BYTES', MAX_BYTES)
+        self.ttl = app.config.get('RESPONSE_CACHE_TTL', TTL)
+        self._metrics = app.extensions.get('metrics')
+        app.extensions['response_cache'] = self
+        # Bus d'invalidation initialisé avant
+        bus = app.extensions['invalidation']
+        bus.subscribe(self.invalidate)
+        bus.tagger(_note_tags)
+
+    def cached(self, tags, scope='shared', ttl=None):
+        """Met en cache les réponses 200 d'une route GET (sous login_required).
+        tags(**view_args) -> étiquettes de la réponse ; scope='user' garde une
+        réponse par utilisateur, 'shared' une seule pour tous."""
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                if request.method != 'GET' or not self.max_bytes:
+                    return f(*args, **kwargs)
+                user = request.current_user.id if scope == 'user' else None
+                key = (request.endpoint, user, tuple(sorted(kwargs.items())),
+                       tuple(sorted(request.args.items(multi=True))))
+                entry = self._get(key, request.endpoint)
+                if entry is not None:
+                    response = current_app.response_class(entry.body, mimetype=entry.mimetype)
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+                entry_tags = frozenset(tags(**kwargs))
+                epoch = self._epoch
+                response = current_app.make_response(f(*args, **kwargs))
+                # Réponse d'un calcul regroupé commencé avant epoch : pas gardée
+                if response.status_code == 200 and not response.is_streamed \
+                        and 'X-Coalesced' not in response.headers:
+                    self._set(key, _Entry(response.get_data(), response.mimetype, entry_tags,
+                                          time.monotonic() + (self.ttl if ttl is None else ttl)), epoch)
+                response.headers['X-Cache'] = 'MISS'
+                return response
+            return decorated_function
+        return decorator
+
+    def fetch(self, name, tags, compute, ttl=None):
+        """JSON (octets) de compute(), gardé sous name pour tous les utilisateurs ;
+        pour les fragments qu'une route assemble elle-même. Utilisable hors requête."""
+        if not self.max_bytes:
+            return dumps(compute())
+        key = ('fragment', name)
+        entry = self._get(key, name)
+        if entry is not None:
+            return entry.body
+        epoch = self._epoch
+        body = dumps(compute())
+        self._set(key, _Entry(body, 'application/json', frozenset(tags),
+                              time.monotonic() + (self.ttl if ttl is None else ttl)), epoch)
+        return body
+
+    def invalidate(self, tags):
+        """Évince les réponses portant une des étiquettes (ALL : toutes)."""
+        with self._lock:
+            self._epoch += 1
+            if ALL in tags:
+                self._cleared = self._epoch
+                self._tag_epochs.clear()
+                keys = list(self._entries)
+            else:
+                if len(self._tag_epochs) > MAX_EPOCH_TAGS:
+                    # Borne la mémoire : équivaut à une invalidation de toutes les
+                    # réponses en cours de calcul, pas de celles déjà en cache
+                    self._cleared = self._epoch
+                    self._tag_epochs.clear()
+                keys = set()
+                for tag in tags:
+                    self._tag_epochs[tag] = self._epoch
+                    keys.update(self._by_tag.get(tag, ()))
+            for key in keys:
+                self._remove(key)
+        self._count_evictions('invalidation', len(keys))
+
+    def clear(self):
+        self.invalidate([ALL])
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self.size, 'max_bytes': self.max_bytes}
+
+    def _get(self, key, endpoint):
+        with self._lock:
+            entry = self._entries.get(key)
+            expired = entry is not None and entry.expires <= time.monotonic()
+            if expired:
+                self._remove(key)
+                entry = None
+            elif entry is not None:
+                self._entries.move_to_end(key)
+        if expired:
+            self._count_evictions('ttl', 1)
+        self._count(endpoint, 'hit' if entry is not None else 'miss')
+        return entry
+
+    def _set(self, key, entry, epoch):
+        if entry.size > self.max_bytes:
+            return
+        evicted = 0
+        with self._lock:
+            if self._cleared > epoch or any(self._tag_epochs.get(tag, 0) > epoch for tag in entry.tags):
+                return  # invalidée pendant le calcul : peut-être déjà périmée
+            self._remove(key)
+            self._entries[key] = entry
+            self.size += entry.size
+            for tag in entry.tags:
+                self._by_tag.setdefault(tag, set()).add(key)
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                evicted += 1
+        self._count_evictions('lru', evicted)
+        self._gauge()
+
+    def _remove(self, key):
+        # Appelé sous self._lock
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.size -= entry.size
+        for tag in entry.tags:
+            keys = self._by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_tag[tag]
+
+    # Compteurs exportés par /api/_metrics
+
+    def _count(self, endpoint, result):
+        if self._metrics is not None and endpoint:
+            self._metrics.registry.inc('fleet_cache_requests_total', {'endpoint': endpoint, 'result': result})
+
+    def _count_evictions(self, reason, count):
+        if self._metrics is not None and count:
+            self._metrics.registry.inc('fleet_cache_evictions_total', {'reason': reason}, count)
+            self._gauge()
+
+    def _gauge(self):
+        if self._metrics is not None:
+            self._metrics.registry.set('fleet_cache_bytes', {}, self.size)
+
+
+def _note_tags(obj):
+    # Notes d'un véhicule : « notes:vehicle:<id> », y compris l'ancien véhicule
+    # d'une note déplacée
+    from .models import Note
+
+    if not isinstance(obj, Note):
+        return ()
+    history = sa_inspect(obj).attrs.vehicle_id.history
+    vehicle_ids = set(history.added or ()) | set(history.deleted or ()) | set(history.unchanged or ())
+    if obj.vehicle_id is not None:
+        vehicle_ids.add(obj.vehicle_id)
+    return [f'notes:vehicle:{vehicle_id}' for vehicle_id in vehicle_ids if vehicle_id is not None]
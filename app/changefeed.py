@@ -0,0 +1,198 @@
+import logging
+from datetime import datetime
+
+from sqlalchemy import and_, event, exists, func, inspect as sa_inspect, literal, select, text
+from sqlalchemy.orm import Session
+
+from .changelog import archiving, record_deletes, record_rows
+
+logger = logging.getLogger(__name__)
+
+# Flux « tout ce qui a changé depuis le curseur X » (GET /api/sync/changes) : la
+# table sync_change est tenue à jour au flush, dans la transaction de l'écriture.
+# Chaque écriture remplace la ligne de l'entité par une nouvelle, de seq plus
+# grand : la table ne grossit qu'avec le nombre d'entités, pas d'écritures.
+TRACKED = ('vehicle', 'note', 'rental', 'maintenance', 'cleaning', 'reminder')
+CHANGES_LIMIT = 500
+CHANGES_MAX = 5000
+
+# Verrou transactionnel PostgreSQL : les numéros de séquence sont attribués dans
+# l'ordre des commits, un curseur ne peut pas sauter une écriture validée plus tard
+_PG_LOCK_ID = 7340041
+
+
+class ChangeFeed:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['changefeed'] = self
+        _listen_session_events()
+
+
+def _models():
+    from .models import Vehicle, Note, Rental, Maintenance, Cleaning, Reminder
+    return {model.__tablename__: model for model in (Vehicle, Note, Rental, Maintenance, Cleaning, Reminder)}
+
+
+def record_changes(session, changes):
+    """Enregistre [(entity_type, entity_id, deleted)] dans le flux, dans la
+    transaction de session. Pour les écritures faites hors de l'ORM (UPDATE en
+    masse...), à appeler explicitement. Les lignes du flux sont archivées comme
+    les autres : une restauration à un instant donné les retrouve."""
+    from .models import SyncChange
+
+    latest = {}
+    for entity_type, entity_id, deleted in changes:
+        latest[(entity_type, entity_id)] = deleted
+    if not latest:
+        return
+    table = SyncChange.__table__
+    conn = session.connection()
+    if conn.dialect.name == 'postgresql':
+        conn.execute(text('SELECT pg_advisory_xact_lock(:id)'), {'id': _PG_LOCK_ID})
+    by_type = {}
+    for entity_type, entity_id in latest:
+        by_type.setdefault(entity_type, []).append(entity_id)
+    for entity_type, ids in by_type.items():
+        conn.execute(table.delete().where(and_(table.c.entity_type == entity_type, table.c.entity_id.in_(ids))))
+    now = datetime.utcnow()
+    conn.execute(table.insert(), [
+        {'entity_type': entity_type, 'entity_id': entity_id, 'deleted': deleted, 'changed_at': now}
+        for (entity_type, entity_id), deleted in latest.items()])
+    if archiving(session):
+        # seq attribués par la base : relus pour l'archive (une requête par type)
+        record_deletes(session, table.name, [{'entity_type': entity_type, 'entity_id': entity_id}
+                                             for entity_type, entity_id in latest])
+        rows = []
+        for entity_type, ids in by_type.items():
+            rows.extend(dict(row._mapping) for row in conn.execute(table.select().where(
+                and_(table.c.entity_type == entity_type, table.c.entity_id.in_(ids)))))
+        record_rows(session, table.name, rows)
+
+
+def backfill_changes(conn):
+    """Ajoute au flux les lignes existantes qui n'y figurent pas (données insérées
+    hors de l'ORM, base antérieure au flux) ; retourne le nombre de lignes ajoutées."""
+    from .models import SyncChange
+
+    table = SyncChange.__table__
+    now = datetime.utcnow()
+    added = 0
+    for entity_type, model in _models().items():
+        source = model.__table__
+        missing = select(literal(entity_type), source.c.id, literal(False), literal(now)).where(
+            ~exists().where(and_(table.c.entity_type == entity_type, table.c.entity_id == source.c.id)))
+        result = conn.execute(table.insert().from_select(
+            ['entity_type', 'entity_id', 'deleted', 'changed_at'], missing))
+        added += result.rowcount
+    return added
+
+
+def resync_after_recovery(conn, high, rolled_back):
+    """Après une restauration à un instant passé : chaque entrée du flux reçoit un
+    seq supérieur à high (plus grand seq déjà diffusé) et les entités écrites après
+    cet instant (rolled_back : [(entity_type, entity_id)]) qui n'existent plus une
+    pierre tombale. Quel que soit son curseur, un client reçoit à nouveau l'état
+    restauré, et aucune écriture ne reprend un seq déjà lu. Retourne le nouveau
+    plus grand seq."""
+    from .models import SyncChange
+
+    table = SyncChange.__table__
+    current = conn.execute(select(func.max(table.c.seq))).scalar() or 0
+    # Décalage au-delà de tous les seq existants : pas de collision pendant l'UPDATE
+    offset = max(high, current) + 1
+    conn.execute(table.update().values(seq=table.c.seq + offset))
+    if conn.dialect.name == 'postgresql':
+        conn.execute(text("SELECT setval(pg_get_serial_sequence('sync_change', 'seq'), "
+                          "(SELECT MAX(seq) FROM sync_change))"))
+
+    by_type = {}
+    for entity_type, entity_id in set(rolled_back):
+        by_type.setdefault(entity_type, []).append(entity_id)
+    now = datetime.utcnow()
+    for entity_type, ids in by_type.items():
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            present = set(conn.execute(select(table.c.entity_id).where(
+                and_(table.c.entity_type == entity_type, table.c.entity_id.in_(chunk)))).scalars())
+            missing = [entity_id for entity_id in chunk if entity_id not in present]
+            if missing:
+                conn.execute(table.insert(), [{'entity_type': entity_type, 'entity_id': entity_id,
+                                               'deleted': True, 'changed_at': now} for entity_id in missing])
+    return conn.execute(select(func.max(table.c.seq))).scalar() or 0
+
+
+def _row(obj):
+    mapper = sa_inspect(obj).mapper
+    return {prop.key: getattr(obj, prop.key) for prop in mapper.column_attrs}
+
+
+def changes_since(since=0, limit=CHANGES_LIMIT):
+    """Modifications de seq > since, dans l'ordre : lignes complètes, ou pierres
+    tombales ; cursor est le seq à passer à l'appel suivant."""
+    from .models import SyncChange
+
+    entries = (SyncChange.query.filter(SyncChange.seq > since)
+               .order_by(SyncChange.seq).limit(limit + 1).all())
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    # Lignes chargées en une requête par type d'entité
+    models = _models()
+    ids = {}
+    for entry in entries:
+        if not entry.deleted:
+            ids.setdefault(entry.entity_type, []).append(entry.entity_id)
+    rows = {}
+    for entity_type, entity_ids in ids.items():
+        model = models[entity_type]
+        for obj in model.query.filter(model.id.in_(entity_ids)):
+            rows[(entity_type, obj.id)] = _row(obj)
+
+    changes = []
+    for entry in entries:
+        data = rows.get((entry.entity_type, entry.entity_id))
+        change = {'seq': entry.seq, 'entity': entry.entity_type, 'id': entry.entity_id,
+                  'deleted': entry.deleted or data is None}
+        if data is not None and not entry.deleted:
+            change['data'] = data
+        changes.append(change)
+    return {
+        'changes': changes,
+        'cursor': entries[-1].seq if entries else since,
+        'has_more': has_more,
+    }
+
+
+def _after_flush(session, flush_context):
+    app = getattr(session, 'app', None)
+    if app is None or 'changefeed' not in app.extensions:
+        return
+    changes = []
+    for obj in session.new:
+        table = sa_inspect(obj).mapper.local_table.name
+        if table in TRACKED:
+            changes.append((table, obj.id, False))
+    for obj in session.dirty:
+        table = sa_inspect(obj).mapper.local_table.name
+        if table in TRACKED and session.is_modified(obj, include_collections=False):
+            changes.append((table, obj.id, False))
+    for obj in session.deleted:
+        state = sa_inspect(obj)
+        if state.mapper.local_table.name in TRACKED and state.identity:
+            changes.append((state.mapper.local_table.name, state.identity[0], True))
+    if changes:
+        record_changes(session, changes)
+
+
+_listening = False
+
+
+def _listen_session_events():
+    global _listening
+    if _listening:
+        return
+    _listening = True
+    event.listen(Session, 'after_flush', _after_flush)
@@ -0,0 +1,339 @@
+import atexit
+import glob
+import gzip
+import itertools
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import date, datetime, timezone
+
+from sqlalchemy import DateTime, Date, event, inspect as sa_inspect
+from sqlalchemy.orm import Session
+
+from .serialization import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+# Journal logique des modifications, pour la restauration à un instant donné :
+# les lignes écrites par chaque transaction sont capturées au flush, remises
+# au commit dans une file en mémoire, puis écrites par un thread dans des
+# segments NDJSON compressés. Le commit de la requête n'attend jamais le disque.
+FLUSH_INTERVAL = 1.0
+BATCH_SIZE = 1000
+SEGMENT_SIZE = 16 * 1024 * 1024
+SEGMENT_AGE = 3600
+QUEUE_SIZE = 100000
+
+_SESSION_KEY = 'fleet_changes'
+_SAVEPOINTS_KEY = 'fleet_changes_savepoints'
+
+
+class ChangeArchiver:
+    def __init__(self, app=None):
+        self.directory = None
+        self.flush_interval = FLUSH_INTERVAL
+        self.queue = None
+        self.dropped = 0
+        self._pid = None
+        self._writer = None
+        self._worker_lock = threading.Lock()
+        self._seq = itertools.count(1)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # CHANGELOG_DIR : dossier d'archive partagé par les workers (un segment par pid)
+        self.directory = app.config.get('CHANGELOG_DIR')
+        self.flush_interval = app.config.get('CHANGELOG_FLUSH_INTERVAL', FLUSH_INTERVAL)
+        app.extensions['changelog'] = self
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        _listen_session_events()
+
+    # Capture (thread de la requête)
+
+    def enqueue(self, changes):
+        self._ensure_worker()
+        try:
+            self.queue.put_nowait((time.time(), os.getpid(), next(self._seq), changes))
+        except queue.Full:
+            # Jamais de blocage du commit : la perte est signalée et comptée
+            self.dropped += 1
+            logger.error("Journal des modifications saturé, transaction non archivée")
+
+    def _ensure_worker(self):
+        if self._pid == os.getpid():
+            return
+        # Premier commit de ce worker (après le fork) : file et thread d'écriture
+        with self._worker_lock:
+            if self._pid == os.getpid():
+                return
+            self.queue = queue.Queue(maxsize=QUEUE_SIZE)
+            self._writer = _SegmentWriter(self.directory, self.queue, self.flush_interval)
+            self._writer.start()
+            atexit.register(self._writer.stop)
+            self._pid = os.getpid()
+
+    def flush(self):
+        if self._writer is not None and self._pid == os.getpid():
+            self._writer.flush_now()
+
+
+class _SegmentWriter(threading.Thread):
+    # Regroupe les transactions en lots ; chaque lot est ajouté au segment courant
+    # comme un membre gzip complet, lisible même si le processus s'arrête ensuite
+    def __init__(self, directory, source, interval):
+        super().__init__(name='changelog-writer', daemon=True)
+        self.directory = directory
+        self.source = source
+        self.interval = interval
+        self.path = None
+        self.opened_at = 0
+        self._flushed = threading.Event()
+        self._flush_requested = threading.Event()
+        self._stopping = False
+
+    def run(self):
+        while not self._stopping:
+            batch = self._collect()
+            if batch:
+                self._append(batch)
+            if self._flush_requested.is_set() and self.source.empty():
+                self._flush_requested.clear()
+                self._flushed.set()
+
+    def _collect(self):
+        batch = []
+        deadline = time.monotonic() + self.interval
+        while len(batch) < BATCH_SIZE:
+            timeout = deadline - time.monotonic()
+            if self._flush_requested.is_set():
+                timeout = 0
+            try:
+                batch.append(self.source.get(timeout=max(timeout, 0)) if timeout > 0
+                             else self.source.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _append(self, batch):
+        now = time.time()
+        if (self.path is None or now - self.opened_at > SEGMENT_AGE
+                or os.path.getsize(self.path) > SEGMENT_SIZE):
+            stamp = datetime.utcfromtimestamp(batch[0][0]).strftime('%Y%m%d_%H%M%S')
+            self.path = os.path.join(self.directory, f"changes-{stamp}-{os.getpid()}.ndjson.gz")
+            self.opened_at = now
+        data = b''.join(dumps({'ts': ts, 'pid': pid, 'seq': seq, 'changes': changes}) + b'\n'
+                        for ts, pid, seq, changes in batch)
+        try:
+            with open(self.path, 'ab') as f:
+                f.write(gzip.compress(data, compresslevel=6))
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError as e:
+            logger.error(f"Écriture du journal des modifications impossible : {e}")
+
+    def flush_now(self, timeout=10):
+        self._flushed.clear()
+        self._flush_requested.set()
+        self._flushed.wait(timeout)
+
+    def stop(self):
+        self.flush_now()
+        self._stopping = True
+
+
+# Capture au flush, remise au commit
+
+def _row(state, mapper):
+    # Valeurs déjà chargées uniquement (pas de SELECT pendant le flush) ; les
+    # dates sont sérialisées en ISO 8601 et relues selon le type de la colonne
+    values = {}
+    for prop in mapper.column_attrs:
+        if prop.key in state.dict:
+            for column in prop.columns:
+                values[column.name] = state.dict[prop.key]
+    return values
+
+
+def archiving(session):
+    """Vrai si les transactions de session sont archivées (CHANGELOG_DIR)."""
+    archiver = _archiver(session)
+    return archiver is not None and bool(archiver.directory)
+
+
+def record_rows(session, table, rows):
+    """Archive, avec la transaction de session, des lignes insérées hors de l'ORM
+    (INSERT multi-lignes) ; rows : valeurs par colonne, clé primaire comprise."""
+    if archiving(session):
+        session.info.setdefault(_SESSION_KEY, []).extend(['upsert', table, row] for row in rows)
+
+
+def record_deletes(session, table, keys):
+    """Archive des DELETE faits hors de l'ORM ; keys : valeurs par colonne qui
+    désignent les lignes supprimées (pas forcément la clé primaire)."""
+    if archiving(session):
+        session.info.setdefault(_SESSION_KEY, []).extend(['delete', table, key] for key in keys)
+
+
+def _after_flush(session, flush_context):
+    # Appelé après l'exécution du flush : clés primaires et défauts Python connus,
+    # session.new / dirty / deleted pas encore remis à zéro
+    if _archiver(session) is None:
+        return
+    changes = session.info.setdefault(_SESSION_KEY, [])
+    for obj in session.new:
+        state = sa_inspect(obj)
+        changes.append(['upsert', state.mapper.local_table.name, _row(state, state.mapper)])
+    for obj in session.dirty:
+        if session.is_modified(obj, include_collections=False):
+            state = sa_inspect(obj)
+            changes.append(['upsert', state.mapper.local_table.name, _row(state, state.mapper)])
+    for obj in session.deleted:
+        state = sa_inspect(obj)
+        changes.append(['delete', state.mapper.local_table.name,
+                        dict(zip((column.name for column in state.mapper.primary_key),
+                                 state.identity or ()))])
+
+
+def _do_orm_execute(state):
+    # UPDATE / DELETE en masse (Query.update, Query.delete) : pas d'objets au
+    # flush, la requête est archivée telle quelle, avec ses paramètres en littéraux
+    if not (state.is_update or state.is_delete) or _archiver(state.session) is None:
+        return
+    bind = state.session.get_bind()
+    try:
+        sql = str(state.statement.compile(dialect=bind.dialect, compile_kwargs={'literal_binds': True}))
+    except Exception as e:
+        logger.error(f"Requête en masse non archivable : {e}")
+        return
+    state.session.info.setdefault(_SESSION_KEY, []).append(['sql', None, sql])
+
+
+def _after_transaction_create(session, transaction):
+    # Début d'un SAVEPOINT : position dans la liste, pour l'annuler avec lui
+    if transaction.nested:
+        session.info.setdefault(_SAVEPOINTS_KEY, {})[transaction] = len(session.info.get(_SESSION_KEY, ()))
+
+
+def _after_commit(session):
+    changes = session.info.pop(_SESSION_KEY, None)
+    session.info.pop(_SAVEPOINTS_KEY, None)
+    archiver = _archiver(session)
+    if changes and archiver is not None:
+        archiver.enqueue(changes)
+
+
+def _after_soft_rollback(session, previous_transaction):
+    if previous_transaction.nested:
+        mark = session.info.get(_SAVEPOINTS_KEY, {}).pop(previous_transaction, None)
+        if mark is not None and _SESSION_KEY in session.info:
+            del session.info[_SESSION_KEY][mark:]
+    elif previous_transaction.parent is None:
+        session.info.pop(_SESSION_KEY, None)
+        session.info.pop(_SAVEPOINTS_KEY, None)
+
+
+def _archiver(session):
+    app = getattr(session, 'app', None)
+    return app.extensions.get('changelog') if app is not None else None
+
+
+_listening = False
+
+
+def _listen_session_events():
+    global _listening
+    if _listening:
+        return
+    _listening = True
+    event.listen(Session, 'after_flush', _after_flush)
+    event.listen(Session, 'do_orm_execute', _do_orm_execute)
+    event.listen(Session, 'after_transaction_create', _after_transaction_create)
+    event.listen(Session, 'after_commit', _after_commit)
+    event.listen(Session, 'after_soft_rollback', _after_soft_rollback)
+
+
+# Relecture
+
+def utc_timestamp(value):
+    # created_at des sauvegardes : ISO 8601 en UTC, sans fuseau
+    return datetime.fromisoformat(value).replace(tzinfo=timezone.utc).timestamp()
+
+
+def read_changes(directory, since=None, until=None):
+    """Transactions archivées entre since et until (timestamps), dans l'ordre des commits."""
+    transactions = []
+    for path in glob.glob(os.path.join(directory, 'changes-*.ndjson.gz')):
+        try:
+            with gzip.open(path, 'rb') as f:
+                for line in f:
+                    transactions.append(loads(line))
+        except (EOFError, OSError):
+            # Dernier membre tronqué (arrêt brutal pendant l'écriture) : ce qui
+            # précède reste valide
+            logger.warning(f"Segment tronqué : {path}")
+    transactions = [t for t in transactions
+                    if (since is None or t['ts'] > since) and (until is None or t['ts'] <= until)]
+    transactions.sort(key=lambda t: (t['ts'], t['pid'], t['seq']))
+    return transactions
+
+
+def _coerce(table, row):
+    values = {}
+    for key, value in row.items():
+        column = table.c.get(key)
+        if column is None:
+            continue
+        if isinstance(value, str) and isinstance(column.type, DateTime):
+            value = datetime.fromisoformat(value)
+        elif isinstance(value, str) and isinstance(column.type, Date):
+            value = date.fromisoformat(value)
+        values[key] = value
+    return values
+
+
+def _upsert(conn, table, row):
+    pk = [column.name for column in table.primary_key]
+    if conn.dialect.name in ('sqlite', 'postgresql'):
+        if conn.dialect.name == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        statement = insert(table).values(row)
+        update = {key: statement.excluded[key] for key in row if key not in pk}
+        conn.execute(statement.on_conflict_do_update(index_elements=pk, set_=update)
+                     if update else statement.on_conflict_do_nothing(index_elements=pk))
+        return
+    conn.execute(table.delete().where(*[table.c[key] == row[key] for key in pk]))
+    conn.execute(table.insert().values(row))
+
+
+def replay(engine, directory, since=None, until=None):
+    """Rejoue les transactions archivées sur engine ; opérations idempotentes (upsert,
+    delete par clé) : rejouer une transaction déjà présente dans la sauvegarde est sans effet."""
+    from . import db, models  # noqa: F401 (tables des modèles)
+
+    tables = db.metadata.tables
+    transactions = read_changes(directory, since, until)
+    applied = 0
+    with engine.begin() as conn:
+        if conn.dialect.name == 'sqlite':
+            conn.exec_driver_sql('PRAGMA foreign_keys=OFF')
+        for transaction in transactions:
+            for operation, table_name, payload in transaction['changes']:
+                if operation == 'sql':
+                    conn.exec_driver_sql(payload)
+                    continue
+                table = tables[table_name]
+                if operation == 'upsert':
+                    _upsert(conn, table, _coerce(table, payload))
+                else:
+                    conn.execute(table.delete().where(
+                        *[table.c[key] == value for key, value in payload.items()]))
+            applied += 1
+    last = transactions[-1]['ts'] if transactions else None
+    return applied, last
@@ -0,0 +1,303 @@
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+# Commandes d'administration : flask fleet <commande>
+fleet_cli = AppGroup('fleet', help="Commandes d'administration de la flotte.")
+
+
+@fleet_cli.command('assets')
+def build_assets_command():
+    """Fingerprinte et précompresse les fichiers statiques."""
+    from .assets import build_assets
+
+    manifest = build_assets(current_app.extensions['static_assets'].static_dir)
+    for source, hashed in sorted(manifest.items()):
+        click.echo(f"{source} -> {hashed}")
+
+
+@fleet_cli.command('seed')
+@click.option('--vehicles', default=100, show_default=True, help="Nombre de véhicules.")
+@click.option('--years', default=1.0, show_default=True, help="Années d'historique à générer.")
+@click.option('--users', default=5, show_default=True, help="Nombre d'utilisateurs.")
+@click.option('--seed', 'seed_value', default=42, show_default=True, help="Graine du générateur.")
+@click.option('--until', type=click.DateTime(['%Y-%m-%d']),
+              help="Fin de l'historique (défaut : maintenant) ; fixée, la génération est reproductible.")
+@click.option('--reset', is_flag=True, help="Supprime et recrée toutes les tables avant.")
+def seed_command(vehicles, years, users, seed_value, until, reset):
+    """Génère une flotte synthétique (locations, entretiens, notes, historique...)."""
+    from . import db
+    from .seed import DEFAULT_PASSWORD, seed_database
+
+    counts, elapsed = seed_database(db.engine, vehicles, years, reset=reset,
+                                    users=users, seed=seed_value, now=until)
+    total = sum(counts.values())
+    for table, count in counts.items():
+        click.echo(f"{table:<16}{count:>12}")
+    click.echo(f"{total} lignes en {elapsed:.1f} s ({total / elapsed:,.0f} lignes/s)")
+    click.echo(f"Connexion : user<id> / {DEFAULT_PASSWORD}")
+
+
+@fleet_cli.command('sync-backfill')
+def sync_backfill_command():
+    """Ajoute au flux de synchronisation les lignes qui n'y figurent pas encore
+    (base antérieure au flux, insertions hors de l'application)."""
+    from . import db
+    from .changefeed import backfill_changes
+
+    with db.engine.begin() as conn:
+        added = backfill_changes(conn)
+    click.echo(f"{added} entité(s) ajoutée(s) au flux de synchronisation")
+
+
+@fleet_cli.command('prune-keys')
+@click.option('--days', default=30, show_default=True, help="Âge au-delà duquel une clé est supprimée.")
+def prune_keys_command(days):
+    """Supprime les clés d'idempotence des actions hors ligne plus anciennes que --days."""
+    from .sync import prune_idempotency_keys
+
+    click.echo(f"{prune_idempotency_keys(days)} clé(s) d'idempotence supprimée(s)")
+
+
+@fleet_cli.command('import-vehicles')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--user', 'username', required=True, help="Utilisateur auquel l'historique est attribué.")
+@click.option('--partial', is_flag=True, help="Importe les lignes valides malgré les lignes en erreur.")
+def import_vehicles_command(path, username, partial):
+    """Importe des véhicules depuis un CSV (brand, model, year, license_plate,
+    status, parking_spot) : tout le fichier est validé avant l'insertion."""
+    from .bulk import BulkError, create_vehicles, parse_vehicle_csv
+    from .models import User
+
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.ClickException(f"Utilisateur inconnu : {username}")
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        text = f.read()
+    try:
+        result = create_vehicles(user, parse_vehicle_csv(text), partial=partial)
+    except BulkError as e:
+        raise click.ClickException(e.message)
+    for error in result['errors']:
+        # Ligne 1 : en-tête
+        click.echo(f"ligne {error['index'] + 2} ({error['license_plate'] or '?'}) : {'; '.join(error['errors'])}",
+                   err=True)
+    click.echo(result['message'])
+    if result['errors'] and not partial:
+        raise click.ClickException("Import annulé (--partial pour importer les lignes valides)")
+
+
+@fleet_cli.command('check-queries')
+@click.option('--vehicles', default=50, show_default=True, help="Taille de la flotte de test.")
+@click.option('--max-repeats', default=3, show_default=True,
+              help="Répétitions tolérées d'une même requête SQL dans une requête HTTP.")
+@click.option('--on-disk', is_flag=True,
+              help="Copie sur disque, une connexion par thread comme en production (lots parallèles).")
+def check_queries_command(vehicles, max_repeats, on_disk):
+    """Vérifie chaque route de l'API contre les N+1, sur une copie d'une base de test."""
+    from datetime import datetime
+
+    from .seed import DEFAULT_PASSWORD
+    from .testing import check_routes, template_app
+
+    spec = {'vehicles': vehicles, 'years': 0.25, 'now': datetime(2024, 12, 1)}
+    with template_app(spec, memory=not on_disk, ADMIN_USERNAMES=['user1']) as app:
+        results = check_routes(app, 'user1', DEFAULT_PASSWORD, max_repeats)
+
+    for endpoint, status, count, error in results:
+        click.echo(f"{endpoint:<28}{status:>5}{count:>6} SQL  {'ÉCHEC' if error else 'ok'}")
+    failures = [(endpoint, error) for endpoint, _, _, error in results if error]
+    for endpoint, error in failures:
+        click.echo(f"\n{endpoint} : {error}", err=True)
+    if failures:
+        raise click.ClickException(f"{len(failures)} route(s) en échec")
+
+
+@fleet_cli.command('backup')
+@click.option('--output', type=click.Path(file_okay=False),
+              help="Dépôt des sauvegardes (défaut : backups/store).")
+@click.option('--step-pages', default=256, show_default=True, help="Pages copiées par tranche.")
+@click.option('--sleep', default=0.05, show_default=True, help="Pause entre deux tranches (s).")
+@click.option('--codec', type=click.Choice(['gzip', 'zstd']), default='gzip', show_default=True,
+              help="Compression des blocs de l'export NDJSON par table.")
+@click.option('--keep-daily', default=7, show_default=True, help="Jours conservés (un instantané par jour).")
+@click.option('--keep-weekly', default=4, show_default=True, help="Semaines conservées (un instantané par semaine).")
+@click.option('--list', 'list_snapshots', is_flag=True, help="Liste les instantanés du dépôt.")
+@click.option('--verify', 'verify_id', metavar='SNAPSHOT',
+              help="Vérifie un instantané (ou un dossier de sauvegarde) au lieu d'en créer un.")
+def backup_command(output, step_pages, sleep, codec, keep_daily, keep_weekly, list_snapshots, verify_id):
+    """Sauvegarde incrémentale : base SQLite copiée en ligne, export par table et fichiers
+    du projet, dédupliqués dans un dépôt de blocs avec rétention."""
+    import os
+
+    from .backup import BackupError, sqlite_path, verify_database
+    from .snapshots import ChunkStore, create_snapshot, verify_snapshot
+
+    project_root = os.path.dirname(current_app.root_path)
+    store = ChunkStore(output or os.path.join(project_root, 'backups', 'store'))
+
+    if list_snapshots:
+        for snapshot_id in store.snapshots():
+            manifest = store.load(snapshot_id)
+            click.echo(f"{snapshot_id:<20}{manifest['size']:>14} octets{manifest['written']:>14} écrits")
+        return
+
+    if verify_id:
+        if os.path.isdir(verify_id):
+            problems = verify_database(verify_id)
+        else:
+            problems = verify_snapshot(store, verify_id)
+        if problems:
+            raise click.ClickException(f"{verify_id} : " + '; '.join(problems[:5]))
+        click.echo(f"{verify_id} : sommes de contrôle et intégrité ok")
+        return
+
+    try:
+        source = sqlite_path(current_app.config['SQLALCHEMY_DATABASE_URI'])
+        manifest = create_snapshot(store, source, project_root, codec=codec, keep_daily=keep_daily,
+                                   keep_weekly=keep_weekly, pages=step_pages, sleep=sleep)
+    except BackupError as e:
+        raise click.ClickException(str(e))
+    backup = manifest['backup']
+    for table, export in backup['tables'].items():
+        click.echo(f"{table:<16}{export['rows']:>12}  {export['sha256'][:16]}…")
+    click.echo(f"Instantané {manifest['id']} : {manifest['size']} octets, {manifest['written']} écrits "
+               f"({manifest['reused_tables']} tables et {manifest['reused_files']} fichiers inchangés), intégrité {backup['database']['integrity']}")
+    if manifest['pruned']:
+        click.echo(f"Rétention : {len(manifest['pruned'])} instantané(s) supprimé(s), "
+                   f"{manifest['freed']} octets libérés")
+
+
+@fleet_cli.command('restore')
+@click.argument('snapshot')
+@click.option('--target', help="URL de la base à reconstruire (défaut : celle de l'application).")
+@click.option('--store', type=click.Path(file_okay=False), help="Dépôt des sauvegardes (défaut : backups/store).")
+@click.option('--workers', default=4, show_default=True, help="Tables lues ou chargées en parallèle.")
+@click.option('--yes', is_flag=True, help="Ne pas demander de confirmation.")
+def restore_command(snapshot, target, store, workers, yes):
+    """Reconstruit la base depuis l'export d'une sauvegarde (instantané ou dossier), puis
+    vérifie lignes et empreintes de chaque table contre le manifeste."""
+    import os
+    import shutil
+
+    from .backup import BackupError
+    from .restore import resolve_backup, restore_database
+    from .snapshots import ChunkStore
+
+    target = target or current_app.config['SQLALCHEMY_DATABASE_URI']
+    if not yes:
+        click.confirm(f"Remplacer toutes les données de {target} ?", abort=True)
+
+    project_root = os.path.dirname(current_app.root_path)
+    chunk_store = ChunkStore(store or os.path.join(project_root, 'backups', 'store'))
+    try:
+        directory, temporary = resolve_backup(snapshot, chunk_store)
+        try:
+            counts, elapsed = restore_database(directory, target, workers)
+        finally:
+            if temporary:
+                shutil.rmtree(temporary, ignore_errors=True)
+    except BackupError as e:
+        raise click.ClickException(str(e))
+    total = sum(counts.values())
+    for table, count in counts.items():
+        click.echo(f"{table:<16}{count:>12}")
+    click.echo(f"{total} lignes restaurées et vérifiées en {elapsed:.1f} s "
+               f"({total / max(elapsed, 1e-9):,.0f} lignes/s)")
+
+
+@fleet_cli.command('recover')
+@click.argument('snapshot', required=False)
+@click.option('--until', 'until', required=True,
+              help="Instant à atteindre, ISO 8601 (heure locale sans fuseau), ex. 2024-12-22T15:00.")
+@click.option('--archive', type=click.Path(file_okay=False),
+              help="Journal des modifications (défaut : CHANGELOG_DIR).")
+@click.option('--target', help="URL de la base à reconstruire (défaut : celle de l'application).")
+@click.option('--store', type=click.Path(file_okay=False), help="Dépôt des sauvegardes (défaut : backups/store).")
+@click.option('--workers', default=4, show_default=True, help="Tables lues ou chargées en parallèle.")
+@click.option('--yes', is_flag=True, help="Ne pas demander de confirmation.")
+def recover_command(snapshot, until, archive, target, store, workers, yes):
+    """Restauration à un instant donné : restaure un instantané (par défaut le dernier
+    antérieur à --until) puis rejoue le journal des modifications jusqu'à --until."""
+    import os
+    import shutil
+    from datetime import datetime
+
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.exc import SQLAlchemyError
+
+    from .backup import BackupError, read_manifest
+    from .changefeed import resync_after_recovery
+    from .changelog import read_changes, replay, utc_timestamp
+    from .restore import resolve_backup, restore_database
+    from .snapshots import ChunkStore
+
+    try:
+        until_ts = datetime.fromisoformat(until).timestamp()
+    except ValueError:
+        raise click.BadParameter(f"date invalide : {until}", param_hint='--until')
+    archive = archive or current_app.config.get('CHANGELOG_DIR')
+    if not archive or not os.path.isdir(archive):
+        raise click.ClickException("Journal des modifications introuvable (--archive ou CHANGELOG_DIR)")
+    target = target or current_app.config['SQLALCHEMY_DATABASE_URI']
+
+    project_root = os.path.dirname(current_app.root_path)
+    chunk_store = ChunkStore(store or os.path.join(project_root, 'backups', 'store'))
+    if snapshot is None:
+        candidates = [snapshot_id for snapshot_id in chunk_store.snapshots()
+                      if utc_timestamp(chunk_store.load(snapshot_id)['created_at']) <= until_ts]
+        if not candidates:
+            raise click.ClickException(f"Aucun instantané antérieur à {until}")
+        snapshot = candidates[-1]
+    if not yes:
+        click.confirm(f"Remplacer toutes les données de {target} par l'état au {until} "
+                      f"(instantané {snapshot}) ?", abort=True)
+
+    # Plus grand seq du flux de synchronisation déjà diffusé (base actuelle et
+    # archive, au-delà de --until compris) : les clients ont pu le lire
+    engine = create_engine(target)
+    try:
+        with engine.connect() as conn:
+            high = conn.execute(text('SELECT MAX(seq) FROM sync_change')).scalar() or 0
+    except SQLAlchemyError:
+        high = 0  # base absente ou antérieure au flux
+    finally:
+        engine.dispose()
+    rolled_back = []
+    for transaction in read_changes(archive):
+        for operation, table_name, payload in transaction['changes']:
+            if operation == 'upsert' and table_name == 'sync_change':
+                high = max(high, payload['seq'])
+                if transaction['ts'] > until_ts:
+                    rolled_back.append((payload['entity_type'], payload['entity_id']))
+
+    try:
+        directory, temporary = resolve_backup(snapshot, chunk_store)
+        try:
+            # Les transactions validées avant le début de la sauvegarde y sont déjà ;
+            # celles validées pendant la copie sont rejouées sans effet (upserts)
+            since = utc_timestamp(read_manifest(directory)['created_at'])
+            if since > until_ts:
+                raise BackupError(f"L'instantané {snapshot} est postérieur à {until}")
+            counts, elapsed = restore_database(directory, target, workers)
+        finally:
+            if temporary:
+                shutil.rmtree(temporary, ignore_errors=True)
+    except BackupError as e:
+        raise click.ClickException(str(e))
+
+    engine = create_engine(target)
+    try:
+        applied, last = replay(engine, archive, since, until_ts)
+        with engine.begin() as conn:
+            cursor = resync_after_recovery(conn, high, rolled_back)
+    finally:
+        engine.dispose()
+    click.echo(f"Instantané {snapshot} restauré ({sum(counts.values())} lignes en {elapsed:.1f} s)")
+    if last is None:
+        click.echo("Aucune modification archivée à rejouer")
+    else:
+        click.echo(f"{applied} transaction(s) rejouée(s), dernière validée le "
+                   f"{datetime.fromtimestamp(last).isoformat(timespec='seconds')}")
+    click.echo(f"Flux de synchronisation renuméroté au-delà du seq {high} (curseur actuel : {cursor}) : "
+               f"les clients rechargent l'état restauré")
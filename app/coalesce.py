@@ -0,0 +1,180 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, request
+
+try:
+    import fcntl
+except ImportError:  # Windows : regroupement limité aux threads d'un worker
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Regroupement des lectures identiques simultanées (même route, mêmes paramètres,
+# même portée d'autorisation) : la première calcule la réponse, les suivantes
+# attendent et la partagent. Avec COALESCE_DIR, un fichier verrou par requête
+# étend le regroupement aux autres workers : celui qui obtient le verrou après un
+# calcul en cours reprend la réponse écrite à côté au lieu de la recalculer.
+# Une réponse n'est partagée qu'avec les requêtes arrivées avant toute écriture
+# postérieure au début de son calcul : après une invalidation, ou pour un calcul
+# d'un autre worker commencé avant notre arrivée, on recalcule.
+TIMEOUT = 30.0
+LOCK_POLL_INTERVAL = 0.01
+
+
+class _Flight:
+    __slots__ = ('epoch', 'done', 'result')
+
+    def __init__(self, epoch):
+        self.epoch = epoch  # invalidations reçues au début du calcul
+        self.done = threading.Event()
+        self.result = None  # (corps, statut, type), None si le calcul a échoué
+
+
+class RequestCoalescer:
+    def __init__(self, app=None):
+        self.directory = None
+        self.timeout = TIMEOUT
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._epoch = 0
+        self._metrics = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.directory = app.config.get('COALESCE_DIR')
+        self.timeout = app.config.get('COALESCE_TIMEOUT', TIMEOUT)
+        if self.directory:
+            if fcntl is None:
+                logger.warning("Verrous de fichiers indisponibles : regroupement limité au worker")
+                self.directory = None
+            else:
+                os.makedirs(self.directory, exist_ok=True)
+        self._metrics = app.extensions.get('metrics')
+        app.extensions['coalescer'] = self
+        # Bus d'invalidation initialisé avant
+        bus = app.extensions.get('invalidation')
+        if bus is not None:
+            bus.subscribe(self._invalidated)
+
+    def coalesce(self, scope='shared'):
+        """Regroupe les appels identiques simultanés d'une route GET (sous
+        login_required) ; scope='user' ne regroupe que ceux d'un même utilisateur."""
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                if request.method != 'GET':
+                    return f(*args, **kwargs)
+                user = request.current_user.id if scope == 'user' else None
+                key = json.dumps([request.endpoint, user, sorted(kwargs.items()),
+                                  sorted(request.args.items(multi=True))])
+
+                def compute():
+                    response = current_app.make_response(f(*args, **kwargs))
+                    return response.get_data(), response.status_code, response.mimetype
+
+                (body, status, mimetype), source = self._run(key, compute)
+                response = current_app.response_class(body, status=status, mimetype=mimetype)
+                if source != 'leader':
+                    response.headers['X-Coalesced'] = source
+                return response
+            return decorated_function
+        return decorator
+
+    def _run(self, key, compute):
+        arrival = time.time()
+        with self._lock:
+            flight = self._flights.get(key)
+            # Calcul commencé avant une écriture validée depuis : pas pour nous
+            leader = flight is None or flight.epoch != self._epoch
+            if leader:
+                flight = self._flights[key] = _Flight(self._epoch)
+        if not leader:
+            if flight.done.wait(self.timeout) and flight.result is not None:
+                self._count('follower')
+                return flight.result, 'follower'
+            # Calcul en échec ou trop long : chacun pour soi
+            return compute(), 'leader'
+        source = 'leader'
+        try:
+            if self.directory:
+                flight.result, source = self._run_shared(key, compute, arrival)
+            else:
+                flight.result = compute()
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.done.set()
+        return flight.result, source
+
+    def _invalidated(self, tags):
+        with self._lock:
+            self._epoch += 1
+
+    # Entre workers : verrou et dernière réponse dans COALESCE_DIR
+
+    def _run_shared(self, key, compute, arrival):
+        path = os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest())
+        with open(f"{path}.lock", 'a+b') as lock:
+            locked = self._acquire(lock)
+            try:
+                # Réponse d'un calcul commencé après notre arrivée (le précédent
+                # détenteur du verrou attendait comme nous)
+                result = _read_result(f"{path}.result", arrival)
+                if result is not None:
+                    self._count('worker')
+                    return result, 'worker'
+                started = time.time()
+                result = compute()
+                _write_result(f"{path}.result", result, started)
+                return result, 'leader'
+            finally:
+                if locked:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _acquire(self, lock):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                if time.monotonic() > deadline:
+                    return False  # l'autre worker est bloqué : calcul sans lui
+                time.sleep(LOCK_POLL_INTERVAL)
+
+    def _count(self, source):
+        if self._metrics is not None:
+            self._metrics.registry.inc('fleet_coalesced_requests_total',
+                                       {'endpoint': request.endpoint, 'source': source})
+
+
+def _read_result(path, arrival):
+    try:
+        with open(path, 'rb') as f:
+            meta = json.loads(f.readline())
+            if meta['started'] < arrival:
+                return None  # commencé avant notre arrivée : peut-être périmé
+            return f.read(), meta['status'], meta['mimetype']
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _write_result(path, result, started):
+    body, status, mimetype = result
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(json.dumps({'started': started, 'status': status, 'mimetype': mimetype}).encode())
+            f.write(b'\n')
+            f.write(body)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.error(f"Écriture de la réponse partagée impossible : {e}")
@@ -0,0 +1,123 @@
+import gzip
+import logging
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # brotli est optionnel, on se contente de gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Valeurs par défaut, surchargeables via app.config
+DEFAULT_MIN_SIZE = 1024
+DEFAULT_LEVELS = {
+    'application/json': 6,
+    'text/csv': 6,
+    'text/plain': 6,
+    # Les flux SSE sont envoyés par petits morceaux : on privilégie la latence
+    'text/event-stream': 1,
+}
+
+
+class _GzipStream:
+    def __init__(self, level):
+        # wbits=31 : en-tête et somme de contrôle gzip
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, chunk):
+        # Z_SYNC_FLUSH pour que chaque morceau soit décodable dès réception
+        return self._compressor.compress(chunk) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _BrotliStream:
+    def __init__(self, level):
+        # Brotli va de 0 à 11, on ramène le niveau zlib (1-9) sur cette échelle
+        self._compressor = brotli.Compressor(quality=min(11, level + 1))
+
+    def compress(self, chunk):
+        return self._compressor.process(chunk) + self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+def _compress(data, encoding, level):
+    if encoding == 'br':
+        return brotli.compress(data, quality=min(11, level + 1))
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def _stream(iterable, encoding, level):
+    stream = _BrotliStream(level) if encoding == 'br' else _GzipStream(level)
+    try:
+        for chunk in iterable:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            if chunk:
+                yield stream.compress(chunk)
+        yield stream.finish()
+    finally:
+        if hasattr(iterable, 'close'):
+            iterable.close()
+
+
+class Compress:
+    def __init__(self, app=None, blueprint=None):
+        self.min_size = DEFAULT_MIN_SIZE
+        self.levels = dict(DEFAULT_LEVELS)
+        self.blueprint = None
+        if app is not None:
+            self.init_app(app, blueprint)
+
+    def init_app(self, app, blueprint=None):
+        self.min_size = app.config.get('COMPRESS_MIN_SIZE', DEFAULT_MIN_SIZE)
+        self.levels.update(app.config.get('COMPRESS_LEVELS', {}))
+        # Compression limitée à un blueprint (ex: 'api') ou à toute l'application
+        self.blueprint = blueprint
+        if brotli is None:
+            logger.warning("Module brotli absent (voir requirements.txt) : réponses compressées en gzip uniquement")
+        app.extensions['compress'] = self
+        app.after_request(self.after_request)
+
+    def _choose_encoding(self):
+        offered = ['br', 'gzip'] if brotli is not None else ['gzip']
+        return request.accept_encodings.best_match(offered)
+
+    def after_request(self, response):
+        if self.blueprint and request.blueprint != self.blueprint:
+            return response
+
+        level = self.levels.get(response.mimetype)
+        if (level is None
+                or response.status_code < 200
+                or response.status_code in (204, 206, 304)
+                or 'Content-Encoding' in response.headers
+                or request.method == 'HEAD'):
+            return response
+
+        # Le cache doit distinguer les réponses selon l'encodage accepté
+        response.vary.add('Accept-Encoding')
+        encoding = self._choose_encoding()
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = _stream(response.response, encoding, level)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+            response.set_data(_compress(data, encoding, level))
+
+        response.headers['Content-Encoding'] = encoding
+        if response.get_etag()[0]:
+            # La représentation compressée est différente : ETag faible
+            response.set_etag(response.get_etag()[0], weak=True)
+        return response
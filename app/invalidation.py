@@ -0,0 +1,296 @@
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+
+from sqlalchemy import event, inspect as sa_inspect
+from sqlalchemy.orm import Session
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou entre processus, bus limité au processus
+    fcntl = None
+
+try:
+    import redis
+except ImportError:  # redis est optionnel (INVALIDATION_URL=redis://...)
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# Bus d'invalidation entre workers : à chaque commit, les tables et lignes écrites
+# (« vehicle », « vehicle:42 ») sont remises aux caches du worker, puis diffusées
+# aux autres workers. Par défaut un anneau de messages en mémoire partagée (fichier
+# projeté en mémoire, compteur de séquence en tête) que chaque worker surveille ;
+# avec INVALIDATION_URL=redis://..., un canal Redis pub/sub.
+ALL = '*'  # tout invalider (messages perdus, débordement de l'anneau)
+
+POLL_INTERVAL = 0.02
+SLOTS = 4096
+SLOT_SIZE = 1024
+_HEADER = struct.Struct('<Q')
+_SLOT_HEADER = struct.Struct('<QI')
+_FILE_NAME = 'invalidation.bus'
+_CHANNEL = 'fleet:invalidation'
+
+_SESSION_KEY = 'fleet_invalidation'
+
+
+class _RingBackend:
+    # Anneau de SLOTS messages : en-tête = numéro du dernier message publié. Un
+    # emplacement porte son numéro avant et après le message (remis à 0 pendant
+    # l'écriture) : un lecteur doublé par les écrivains le détecte.
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, _FILE_NAME)
+        size = _HEADER.size + SLOTS * SLOT_SIZE
+        self.path = path
+        self.file = open(path, 'a+b')
+        if os.path.getsize(path) < size:
+            self.file.truncate(size)
+        self.map = mmap.mmap(self.file.fileno(), size)
+        self._lock_file = None
+        self._lock_pid = None
+
+    def _lock(self):
+        # flock porte sur le fichier ouvert, partagé avec le master après un fork :
+        # chaque worker ouvre le sien pour que le verrou les exclue entre eux
+        if self._lock_pid != os.getpid():
+            self._lock_file = open(self.path, 'rb')
+            self._lock_pid = os.getpid()
+        return self._lock_file
+
+    def head(self):
+        return _HEADER.unpack_from(self.map, 0)[0]
+
+    def publish(self, payload):
+        if len(payload) > SLOT_SIZE - _SLOT_HEADER.size:
+            payload = json.dumps({'ts': time.time(), 'pid': os.getpid(), 'tags': [ALL]}).encode()
+        lock = self._lock()
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            seq = self.head() + 1
+            offset = _HEADER.size + (seq % SLOTS) * SLOT_SIZE
+            _SLOT_HEADER.pack_into(self.map, offset, 0, 0)
+            self.map[offset + _SLOT_HEADER.size:offset + _SLOT_HEADER.size + len(payload)] = payload
+            _SLOT_HEADER.pack_into(self.map, offset, seq, len(payload))
+            _HEADER.pack_into(self.map, 0, seq)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def listen(self, deliver, interval):
+        last = self.head()
+        while True:
+            time.sleep(interval)
+            head = self.head()
+            if head == last:
+                continue
+            if head - last >= SLOTS:
+                deliver(None)  # messages écrasés avant d'avoir été lus
+                last = head
+                continue
+            for seq in range(last + 1, head + 1):
+                offset = _HEADER.size + (seq % SLOTS) * SLOT_SIZE
+                slot_seq, length = _SLOT_HEADER.unpack_from(self.map, offset)
+                payload = self.map[offset + _SLOT_HEADER.size:offset + _SLOT_HEADER.size + length]
+                if slot_seq != seq or _SLOT_HEADER.unpack_from(self.map, offset)[0] != seq:
+                    deliver(None)
+                    break
+                deliver(payload)
+            last = head
+
+
+class _RedisBackend:
+    def __init__(self, url):
+        self.client = redis.Redis.from_url(url)
+
+    def publish(self, payload):
+        self.client.publish(_CHANNEL, payload)
+
+    def listen(self, deliver, interval):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(_CHANNEL)
+                # (Re)connexion : ce qui a été publié entre-temps est perdu
+                deliver(None)
+                for message in pubsub.listen():
+                    deliver(message['data'])
+            except redis.RedisError as e:
+                logger.error(f"Bus d'invalidation Redis indisponible : {e}")
+                time.sleep(1)
+
+
+class InvalidationBus:
+    def __init__(self, app=None):
+        self.backend = None
+        self.poll_interval = POLL_INTERVAL
+        self._subscribers = []
+        self._taggers = []
+        self._metrics = None
+        self._pid = None
+        self._listener = None
+        self._worker_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # INVALIDATION_DIR : dossier de l'anneau partagé par les workers gunicorn ;
+        # sans lui (ni INVALIDATION_URL), les invalidations restent dans le processus
+        url = app.config.get('INVALIDATION_URL')
+        directory = app.config.get('INVALIDATION_DIR')
+        self.poll_interval = app.config.get('INVALIDATION_POLL_INTERVAL', POLL_INTERVAL)
+        if url:
+            if redis is None:
+                logger.warning("Paquet redis absent : INVALIDATION_URL ignorée")
+            else:
+                self.backend = _RedisBackend(url)
+        elif directory:
+            if fcntl is None:
+                logger.warning("Verrous de fichiers indisponibles : invalidations limitées au processus")
+            else:
+                self.backend = _RingBackend(directory)
+        # Compteurs et retard exportés par /api/_metrics (extension initialisée avant)
+        self._metrics = app.extensions.get('metrics')
+        app.extensions['invalidation'] = self
+        app.before_request(self._ensure_listener)
+        _listen_session_events()
+
+    # API des caches
+
+    def subscribe(self, callback):
+        """callback(tags) est appelé dans chaque worker pour chaque invalidation ;
+        tags contient ALL quand tout doit être invalidé."""
+        self._subscribers.append(callback)
+
+    def tagger(self, func):
+        """func(obj) -> étiquettes supplémentaires pour un objet écrit (décorateur)."""
+        self._taggers.append(func)
+        return func
+
+    def invalidate(self, *tags):
+        """Invalide immédiatement, dans ce worker puis dans les autres."""
+        tags = sorted(set(tags))
+        if not tags:
+            return
+        self._deliver_local(tags, 'local')
+        if self.backend is not None:
+            self._ensure_listener()
+            try:
+                self.backend.publish(json.dumps({'ts': time.time(), 'pid': os.getpid(), 'tags': tags}).encode())
+            except Exception as e:
+                logger.error(f"Publication d'une invalidation impossible : {e}")
+
+    def tags_for(self, obj):
+        state = sa_inspect(obj)
+        table = state.mapper.local_table.name
+        tags = {table}
+        # Identité pas encore attribuée aux objets insérés par ce flush
+        pk = state.mapper.primary_key_from_instance(obj)
+        if pk and pk[0] is not None:
+            tags.add(f"{table}:{pk[0]}")
+        for tagger in self._taggers:
+            tags.update(tagger(obj) or ())
+        return tags
+
+    # Réception
+
+    def _deliver_local(self, tags, origin):
+        if self._metrics is not None:
+            self._metrics.registry.inc('fleet_invalidations_total', {'origin': origin})
+        for callback in self._subscribers:
+            try:
+                callback(tags)
+            except Exception as e:
+                logger.error(f"Erreur d'un abonné au bus d'invalidation : {e}")
+
+    def _receive(self, payload):
+        if payload is None:
+            self._deliver_local([ALL], 'overflow')
+            return
+        message = json.loads(payload)
+        if message['pid'] == os.getpid():
+            return  # déjà appliqué localement au commit
+        if self._metrics is not None:
+            self._metrics.registry.observe('fleet_invalidation_lag_seconds', {},
+                                           max(time.time() - message['ts'], 0))
+        self._deliver_local(message['tags'], 'remote')
+
+    def _ensure_listener(self):
+        if self.backend is None or self._pid == os.getpid():
+            return
+        # Premier passage dans ce worker (après le fork) : thread d'écoute du bus
+        with self._worker_lock:
+            if self._pid == os.getpid():
+                return
+            self._listener = threading.Thread(target=self._listen, name='invalidation-bus', daemon=True)
+            self._listener.start()
+            self._pid = os.getpid()
+
+    def _listen(self):
+        try:
+            self.backend.listen(self._receive, self.poll_interval)
+        except Exception as e:
+            logger.error(f"Écoute du bus d'invalidation interrompue : {e}")
+
+
+# Étiquettes collectées au flush, diffusées au commit
+
+def _bus(session):
+    app = getattr(session, 'app', None)
+    return app.extensions.get('invalidation') if app is not None else None
+
+
+def _after_flush(session, flush_context):
+    bus = _bus(session)
+    if bus is None:
+        return
+    tags = session.info.setdefault(_SESSION_KEY, set())
+    for obj in session.new | session.deleted:
+        tags.update(bus.tags_for(obj))
+    for obj in session.dirty:
+        if session.is_modified(obj, include_collections=False):
+            tags.update(bus.tags_for(obj))
+
+
+def _do_orm_execute(state):
+    # UPDATE / DELETE en masse : lignes inconnues, toute la table est invalidée
+    # (« <table>:* » pour ce qui dépend de lignes de la table). INSERT en masse :
+    # lignes nouvelles, seul ce qui porte sur toute la table est concerné
+    if not (state.is_update or state.is_delete or state.is_insert) or _bus(state.session) is None:
+        return
+    table = state.statement.table.name
+    tags = state.session.info.setdefault(_SESSION_KEY, set())
+    tags.add(table)
+    if not state.is_insert:
+        tags.add(f'{table}:*')
+
+
+def _after_commit(session):
+    tags = session.info.pop(_SESSION_KEY, None)
+    bus = _bus(session)
+    if tags and bus is not None:
+        bus.invalidate(*tags)
+
+
+def _after_soft_rollback(session, previous_transaction):
+    # Un SAVEPOINT annulé garde ses étiquettes : invalider en trop est sans risque
+    if previous_transaction.parent is None:
+        session.info.pop(_SESSION_KEY, None)
+
+
+_listening = False
+
+
+def _listen_session_events():
+    global _listening
+    if _listening:
+        return
+    _listening = True
+    event.listen(Session, 'after_flush', _after_flush)
+    event.listen(Session, 'do_orm_execute', _do_orm_execute)
+    event.listen(Session, 'after_commit', _after_commit)
+    event.listen(Session, 'after_soft_rollback', _after_soft_rollback)
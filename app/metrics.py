@@ -0,0 +1,297 @@
+import glob
+import json
+import os
+import threading
+import time
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (128, 1024, 10 * 1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024)
+SQL_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+# name: (type, aide, buckets)
+METRICS = {
+    'fleet_http_requests_total': ('counter', "Requêtes HTTP traitées", None),
+    'fleet_http_request_duration_seconds': ('histogram', "Latence des requêtes", LATENCY_BUCKETS),
+    'fleet_http_response_size_bytes': ('histogram', "Taille des réponses", SIZE_BUCKETS),
+    'fleet_http_requests_in_flight': ('gauge', "Requêtes en cours", None),
+    'fleet_sql_statements_per_request': ('histogram', "Requêtes SQL par requête HTTP", SQL_COUNT_BUCKETS),
+    'fleet_sql_duration_seconds_per_request': ('histogram', "Temps SQL par requête HTTP", LATENCY_BUCKETS),
+    'fleet_sql_statements_total': ('counter', "Requêtes SQL exécutées", None),
+    'fleet_invalidations_total': ('counter', "Invalidations de cache reçues (local, remote, overflow)", None),
+    'fleet_invalidation_lag_seconds': ('histogram', "Délai entre le commit et l'invalidation dans un autre worker",
+                                       LAG_BUCKETS),
+    'fleet_cache_requests_total': ('counter', "Lectures du cache de réponses (hit, miss)", None),
+    'fleet_cache_evictions_total': ('counter', "Réponses évincées du cache (invalidation, lru, ttl)", None),
+    'fleet_cache_bytes': ('gauge', "Taille estimée du cache de réponses", None),
+    'fleet_coalesced_requests_total': ('counter', "Requêtes servies par le calcul d'une requête identique "
+                                                  "(follower : même worker, worker : autre worker)", None),
+}
+
+_FILE_PREFIX = 'metrics_'
+
+
+def _key(name, labels):
+    return json.dumps([name, sorted(labels.items())])
+
+
+class Registry:
+    # Registre d'un worker ; les valeurs sont agrégées entre workers au scrape
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}
+        self.dirty = False
+
+    def inc(self, name, labels, amount=1):
+        key = _key(name, labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+            self.dirty = True
+
+    def set(self, name, labels, value):
+        key = _key(name, labels)
+        with self.lock:
+            self.values[key] = value
+            self.dirty = True
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        key = _key(name, labels)
+        with self.lock:
+            hist = self.values.get(key)
+            if hist is None:
+                hist = self.values[key] = {'buckets': [0] * (len(buckets) + 1), 'sum': 0, 'count': 0}
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    break
+            else:
+                i = len(buckets)
+            hist['buckets'][i] += 1
+            hist['sum'] += value
+            hist['count'] += 1
+            self.dirty = True
+
+    def snapshot(self):
+        with self.lock:
+            self.dirty = False
+            return json.loads(json.dumps(self.values))
+
+
+def _merge(total, values, include_gauges=True):
+    for key, value in values.items():
+        name = json.loads(key)[0]
+        kind = METRICS[name][0]
+        if kind == 'gauge' and not include_gauges:
+            continue
+        if kind == 'histogram':
+            hist = total.setdefault(key, {'buckets': [0] * len(value['buckets']), 'sum': 0, 'count': 0})
+            hist['buckets'] = [a + b for a, b in zip(hist['buckets'], value['buckets'])]
+            hist['sum'] += value['sum']
+            hist['count'] += value['count']
+        else:
+            total[key] = total.get(key, 0) + value
+
+
+def _format_labels(labels, extra=None):
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def render(values):
+    by_name = {}
+    for key, value in values.items():
+        name, labels = json.loads(key)
+        by_name.setdefault(name, []).append((labels, value))
+
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in sorted(by_name.get(name, [])):
+            if kind != 'histogram':
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(list(buckets) + ['+Inf'], value['buckets']):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels, ('le', bound))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {value['sum']}")
+            lines.append(f"{name}_count{_format_labels(labels)} {value['count']}")
+    return '\n'.join(lines) + '\n'
+
+
+class Metrics:
+    def __init__(self, app=None):
+        self.registry = Registry()
+        self.directory = None
+        self.flush_interval = 1.0
+        self._pid = None
+        self._flusher = None
+        self._worker_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # METRICS_DIR : dossier partagé par les workers gunicorn (un fichier par pid)
+        self.directory = app.config.get('METRICS_DIR')
+        self.flush_interval = app.config.get('METRICS_FLUSH_INTERVAL', 1.0)
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+        app.extensions['metrics'] = self
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        _listen_sql_events()
+
+    # Cycle de vie de la requête
+
+    def _before_request(self):
+        self._ensure_worker()
+        g.metrics_start = time.perf_counter()
+        g.sql_count = 0
+        g.sql_time = 0.0
+        g.metrics_endpoint = request.endpoint or 'unmatched'
+        self.registry.inc('fleet_http_requests_in_flight', {'endpoint': g.metrics_endpoint})
+
+    def _after_request(self, response):
+        start = g.get('metrics_start')
+        if start is None:
+            return response
+        endpoint = g.metrics_endpoint
+        registry = self.registry
+        registry.inc('fleet_http_requests_total', {
+            'endpoint': endpoint, 'method': request.method, 'status': str(response.status_code)})
+        registry.observe('fleet_http_request_duration_seconds', {'endpoint': endpoint},
+                         time.perf_counter() - start)
+        if not response.is_streamed:
+            registry.observe('fleet_http_response_size_bytes', {'endpoint': endpoint},
+                             response.calculate_content_length() or 0)
+        registry.observe('fleet_sql_statements_per_request', {'endpoint': endpoint}, g.sql_count)
+        registry.observe('fleet_sql_duration_seconds_per_request', {'endpoint': endpoint}, g.sql_time)
+        registry.inc('fleet_sql_statements_total', {'endpoint': endpoint}, g.sql_count)
+        return response
+
+    def _teardown_request(self, exc):
+        # Sous-requête de POST /api/batch (app/batch.py) : g est celui du lot
+        if 'fleet.batch_user' in request.environ:
+            return
+        if g.get('metrics_start') is not None:
+            self.registry.inc('fleet_http_requests_in_flight', {'endpoint': g.metrics_endpoint}, -1)
+
+    # Agrégation multi-workers
+
+    def _ensure_worker(self):
+        if not self.directory or self._pid == os.getpid():
+            return
+        # Premier passage dans ce worker (après le fork) : registre vierge et
+        # thread d'écriture périodique du fichier du worker
+        with self._worker_lock:
+            if self._pid == os.getpid():
+                return
+            self.registry = Registry()
+            self._flusher = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+            self._flusher.start()
+            self._pid = os.getpid()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            if self.registry.dirty:
+                self.flush()
+
+    def flush(self):
+        path = _worker_path(self.directory, os.getpid())
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.registry.snapshot(), f)
+        os.replace(tmp_path, path)
+
+    def collect(self):
+        if not self.directory:
+            return self.registry.snapshot()
+        self.flush()
+        total = {}
+        for path in glob.glob(os.path.join(self.directory, f"{_FILE_PREFIX}*.json")):
+            try:
+                with open(path) as f:
+                    _merge(total, json.load(f))
+            except (OSError, ValueError):
+                continue  # fichier en cours de remplacement
+        return total
+
+    def response(self):
+        return Response(render(self.collect()), content_type=CONTENT_TYPE)
+
+
+def _worker_path(directory, pid):
+    return os.path.join(directory, f"{_FILE_PREFIX}{pid}.json")
+
+
+def mark_process_dead(directory, pid):
+    # Appelé par gunicorn (child_exit) : on garde les compteurs et histogrammes
+    # du worker mort dans une archive commune, ses jauges sont abandonnées
+    path = _worker_path(directory, pid)
+    try:
+        with open(path) as f:
+            values = json.load(f)
+    except (OSError, ValueError):
+        return
+    kept = {}
+    _merge(kept, values, include_gauges=False)
+    archive = os.path.join(directory, f"{_FILE_PREFIX}dead.json")
+    if os.path.exists(archive):
+        with open(archive) as f:
+            _merge(kept, json.load(f))
+    with open(f"{archive}.tmp", 'w') as f:
+        json.dump(kept, f)
+    os.replace(f"{archive}.tmp", archive)
+    os.remove(path)
+
+
+def clear_directory(directory):
+    # Au démarrage du master : les fichiers d'une exécution précédente sont obsolètes
+    for path in glob.glob(os.path.join(directory, f"{_FILE_PREFIX}*")):
+        os.remove(path)
+
+
+_sql_listening = False
+
+
+def _listen_sql_events():
+    global _sql_listening
+    if _sql_listening:
+        return
+    _sql_listening = True
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Début gardé sur le contexte d'exécution, propre à la requête SQL : rien ne
+    # s'accumule sur la connexion si l'exécution échoue avant after_cursor_execute
+    if context is not None:
+        context._fleet_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, '_fleet_start', None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    if has_request_context() and 'sql_count' in g:
+        g.sql_count += 1
+        g.sql_time += elapsed
+        # Détail des requêtes, collecté seulement si un consommateur l'a demandé (slowlog)
+        statements = g.get('sql_statements')
+        if statements is not None and len(statements) < g.sql_statements_limit:
+            statements.append((statement, parameters, elapsed))
@@ -50,8 +50,9 @@ class Cleaning(db.Model):
 class Rental(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     vehicle_id = db.Column(db.Integer, db.ForeignKey('vehicle.id'), nullable=False)
-    start_date = db.Column(db.DateTime, nullable=False)
-    end_date = db.Column(db.DateTime, nullable=False)
+    # Indexées : échéances lues à chaque passage du flux /api/stream/fleet
+    start_date = db.Column(db.DateTime, nullable=False, index=True)
+    end_date = db.Column(db.DateTime, nullable=False, index=True)
     turo_booking_id = db.Column(db.String(50), unique=True)
     status = db.Column(db.String(20), default='upcoming')  # upcoming, active, completed, cancelled
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -61,7 +62,7 @@ class Reminder(db.Model):
     vehicle_id = db.Column(db.Integer, db.ForeignKey('vehicle.id'), nullable=False)
     type = db.Column(db.String(50), nullable=False)  # maintenance, cleaning, insurance, etc.
     description = db.Column(db.Text)
-    due_date = db.Column(db.DateTime, nullable=False)
+    due_date = db.Column(db.DateTime, nullable=False, index=True)
     status = db.Column(db.String(20), default='pending')  # pending, completed, cancelled
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
@@ -77,8 +78,8 @@ class Note(db.Model):
             'id': self.id,
             'vehicle_id': self.vehicle_id,
             'content': self.content,
-            'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat()
+            'created_at': self.created_at,
+            'updated_at': self.updated_at
         }
 
 class User(db.Model):
@@ -102,7 +103,7 @@ class User(db.Model):
             'id': self.id,
             'username': self.username,
             'email': self.email,
-            'created_at': self.created_at.isoformat()
+            'created_at': self.created_at
         }
 
 class ActionHistory(db.Model):
@@ -122,5 +123,28 @@ class ActionHistory(db.Model):
             'entity_type': self.entity_type,
             'entity_id': self.entity_id,
             'changes': self.changes,
-            'created_at': self.created_at.isoformat()
+            'created_at': self.created_at
         }
+
+class IdempotencyKey(db.Model):
+    # Actions hors ligne déjà appliquées par POST /api/sync/batch : une action
+    # renvoyée avec la même clé n'est pas rejouée, son résultat est renvoyé
+    __table_args__ = (db.UniqueConstraint('user_id', 'key'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    key = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.Integer, nullable=False)
+    response = db.Column(db.JSON)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class SyncChange(db.Model):
+    # Flux de synchronisation : une ligne par entité suivie, renumérotée (seq) à
+    # chaque écriture ; deleted = pierre tombale d'une entité supprimée
+    __table_args__ = (db.UniqueConstraint('entity_type', 'entity_id'), {'sqlite_autoincrement': True})
+
+    seq = db.Column(db.Integer, primary_key=True)
+    entity_type = db.Column(db.String(20), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    deleted = db.Column(db.Boolean, nullable=False, default=False)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
@@ -0,0 +1,108 @@
+import collections
+import cProfile
+import logging
+import os
+import sys
+import threading
+import uuid
+from datetime import datetime
+
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+# En-tête de requête qui déclenche le profilage : "cprofile" (défaut) ou "sample"
+PROFILE_HEADER = 'X-Profile'
+PROFILE_ID_HEADER = 'X-Profile-Id'
+MODES = ('cprofile', 'sample')
+
+
+class _StackSampler:
+    # Échantillonne la pile d'un thread et produit des piles repliées (flamegraph)
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def enable(self):
+        self._thread.start()
+
+    def disable(self):
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class RequestProfiler:
+    def __init__(self, app=None):
+        self.directory = None
+        self.sample_interval = 0.001
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.directory = app.config.get('PROFILE_DIR') or os.path.join(app.instance_path, 'profiles')
+        self.sample_interval = app.config.get('PROFILE_SAMPLE_INTERVAL_MS', 1) / 1000
+        app.extensions['profiler'] = self
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    def _before_request(self):
+        # Aucun coût sans l'en-tête ; le token admin n'est vérifié qu'en sa présence
+        mode = request.headers.get(PROFILE_HEADER)
+        if not mode:
+            return
+        mode = mode.lower() if mode.lower() in MODES else 'cprofile'
+
+        from .routes import current_admin
+        if current_admin() is None:
+            return
+
+        if mode == 'sample':
+            profiler = _StackSampler(threading.get_ident(), self.sample_interval)
+        else:
+            profiler = cProfile.Profile()
+        g.profiler = (mode, profiler)
+        profiler.enable()
+
+    def _after_request(self, response):
+        mode, profiler = g.pop('profiler', (None, None))
+        if profiler is None:
+            return response
+        profiler.disable()
+
+        profile_id = '{}-{}-{}'.format(
+            datetime.utcnow().strftime('%Y%m%d%H%M%S'),
+            (request.endpoint or 'unmatched').replace('.', '_'),
+            uuid.uuid4().hex[:8],
+        )
+        extension = 'collapsed' if mode == 'sample' else 'pstats'
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            if mode == 'sample':
+                profiler.dump(os.path.join(self.directory, f"{profile_id}.{extension}"))
+            else:
+                profiler.dump_stats(os.path.join(self.directory, f"{profile_id}.{extension}"))
+        except OSError as e:
+            logger.error(f"Impossible d'écrire le profil {profile_id}: {str(e)}")
+            return response
+
+        response.headers[PROFILE_ID_HEADER] = f"{profile_id}.{extension}"
+        return response
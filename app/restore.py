@@ -0,0 +1,287 @@
+import csv
+import hashlib
+import io
+import logging
+import os
+import queue
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from sqlalchemy import Integer, create_engine, text
+from sqlalchemy.engine import make_url
+
+from .backup import BackupError, open_export, read_manifest, table_rows, verify_export
+from .serialization import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+# Lignes par executemany / par transaction de chargement
+LOAD_BATCH = 20000
+LOAD_WORKERS = 4
+
+
+def resolve_backup(snapshot, store=None):
+    """Dossier de sauvegarde (manifest.json + data/) à restaurer.
+
+    snapshot : dossier de sauvegarde, ou identifiant d'instantané du dépôt ; dans ce
+    cas seuls le manifeste et les exports sont reconstruits, dans un dossier
+    temporaire (second élément retourné, à supprimer par l'appelant)."""
+    if os.path.isdir(snapshot):
+        return snapshot, None
+    if store is None:
+        raise BackupError(f"Sauvegarde introuvable : {snapshot}")
+    target = tempfile.mkdtemp(prefix='restore-', dir=store.root)
+    try:
+        store.checkout(snapshot, target, prefix='database/', exclude=('database/fleet.db',))
+    except Exception:
+        shutil.rmtree(target, ignore_errors=True)
+        raise
+    return os.path.join(target, 'database'), target
+
+
+def load_levels(tables):
+    # Tables regroupées par niveau de dépendance : celles d'un même niveau ne
+    # se référencent pas entre elles et peuvent être chargées en parallèle
+    levels = {}
+    for table in tables:  # sorted_tables : parents avant enfants
+        parents = [fk.column.table.name for fk in table.foreign_keys if fk.column.table is not table]
+        levels[table.name] = 1 + max((levels[p] for p in parents), default=-1)
+    grouped = {}
+    for table in tables:
+        grouped.setdefault(levels[table.name], []).append(table)
+    return [grouped[level] for level in sorted(grouped)]
+
+
+def _batches(directory, export, batch=LOAD_BATCH):
+    # Lecture en flux d'un export : lots de tuples prêts pour executemany
+    rows = []
+    with open_export(os.path.join(directory, export['file'])) as f:
+        for line in f:
+            rows.append(tuple(loads(line)))
+            if len(rows) >= batch:
+                yield rows
+                rows = []
+    if rows:
+        yield rows
+
+
+# SQLite : un seul écrivain ; décompression et décodage en parallèle dans des
+# threads qui alimentent l'écrivain par une file bornée
+
+def _restore_sqlite(path, directory, manifest, metadata, workers):
+    from sqlalchemy.schema import CreateIndex
+
+    engine = create_engine(f"sqlite:///{path}")
+    metadata.create_all(engine)
+    # Index créés après le chargement (les contraintes UNIQUE restent dans la table)
+    deferred = []
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            for index in table.indexes:
+                deferred.append(str(CreateIndex(index).compile(dialect=engine.dialect)))
+                conn.exec_driver_sql(f'DROP INDEX "{index.name}"')
+    engine.dispose()
+
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=OFF')
+    conn.execute('PRAGMA synchronous=OFF')
+    conn.execute('PRAGMA cache_size=-262144')
+    # Tables chargées dans un ordre quelconque : clés étrangères vérifiées à la fin
+    conn.execute('PRAGMA foreign_keys=OFF')
+
+    batches = queue.Queue(maxsize=8)
+    abort = threading.Event()
+    tables = [table.name for table in metadata.sorted_tables if table.name in manifest['tables']]
+
+    def read(table):
+        export = manifest['tables'][table]
+        sql = 'INSERT INTO "{}" ({}) VALUES ({})'.format(
+            table, ', '.join(f'"{c}"' for c in export['columns']), ', '.join('?' * len(export['columns'])))
+        for rows in _batches(directory, export):
+            if abort.is_set():
+                return
+            batches.put((table, sql, rows))
+
+    counts = dict.fromkeys(tables, 0)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(read, table) for table in tables]
+        # Fin de flux une fois tous les lecteurs terminés, en erreur ou non
+        threading.Thread(target=lambda: (wait(futures), batches.put(None)), daemon=True).start()
+        try:
+            conn.execute('BEGIN')
+            while True:
+                item = batches.get()
+                if item is None:
+                    break
+                table, sql, rows = item
+                conn.executemany(sql, rows)
+                counts[table] += len(rows)
+            for future in futures:
+                future.result()
+            for statement in deferred:
+                conn.execute(statement)
+            conn.execute('COMMIT')
+        except BaseException:
+            abort.set()
+            while batches.get() is not None:
+                pass
+            conn.close()
+            raise
+
+    violations = conn.execute('PRAGMA foreign_key_check').fetchall()
+    conn.close()
+    if violations:
+        raise BackupError(f"Clés étrangères invalides après restauration : {violations[:5]}")
+    return counts
+
+
+# PostgreSQL : COPY, une connexion par table, niveau de dépendance par niveau
+
+class _CsvStream(io.RawIOBase):
+    # Fichier en lecture produisant le CSV d'un export à la demande, pour copy_expert
+    def __init__(self, rows):
+        self._rows = rows
+        self._buffer = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        while len(self._buffer) < len(target):
+            try:
+                batch = next(self._rows)
+            except StopIteration:
+                break
+            out = io.StringIO()
+            writer = csv.writer(out)
+            writer.writerows([['\\N' if value is None else value for value in row] for row in batch])
+            self._buffer += out.getvalue().encode('utf-8')
+        size = min(len(target), len(self._buffer))
+        target[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+def _copy_table(engine, directory, table, export):
+    columns = ', '.join(f'"{c}"' for c in export['columns'])
+    raw = engine.raw_connection()
+    try:
+        with raw.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY "{table.name}" ({columns}) FROM STDIN WITH (FORMAT csv, NULL \'\\N\')',
+                io.BufferedReader(_CsvStream(_batches(directory, export)), 1024 * 1024))
+        raw.commit()
+    finally:
+        raw.close()
+    return export['rows']
+
+
+def _restore_postgres(url, directory, manifest, metadata, workers):
+    engine = create_engine(url, pool_size=workers)
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+    counts = {}
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for level in load_levels(metadata.sorted_tables):
+                futures = {table.name: pool.submit(_copy_table, engine, directory, table,
+                                                   manifest['tables'][table.name])
+                           for table in level if table.name in manifest['tables']}
+                counts.update({name: future.result() for name, future in futures.items()})
+        with engine.begin() as conn:
+            for table in metadata.sorted_tables:
+                pk = list(table.primary_key.columns)
+                if len(pk) == 1 and isinstance(pk[0].type, Integer):
+                    # Séquences recalées après un chargement avec identifiants explicites
+                    # (id, ou seq pour sync_change)
+                    conn.execute(text(
+                        f"SELECT setval(pg_get_serial_sequence('\"{table.name}\"', '{pk[0].name}'), "
+                        f"COALESCE((SELECT MAX(\"{pk[0].name}\") FROM \"{table.name}\"), 0) + 1, false)"))
+                conn.execute(text(f'ANALYZE "{table.name}"'))
+    finally:
+        engine.dispose()
+    return counts
+
+
+def verify_restore(database_url, manifest):
+    # Lignes et empreinte de chaque table restaurée, comparées au manifeste. Sur
+    # SQLite le NDJSON relu est identique octet pour octet à l'export ; ailleurs
+    # les types diffèrent (dates...), seuls les nombres de lignes sont comparés
+    url = make_url(database_url)
+    problems = []
+    if url.get_backend_name() == 'sqlite':
+        conn = sqlite3.connect(f"file:{url.database}?mode=ro", uri=True)
+        try:
+            for table, export in manifest['tables'].items():
+                digest = hashlib.sha256()
+                count = 0
+                _, rows = table_rows(conn, table)
+                for row in rows:
+                    digest.update(dumps(row) + b'\n')
+                    count += 1
+                if count != export['rows'] or digest.hexdigest() != export['sha256']:
+                    problems.append(f"{table} : {count}/{export['rows']} lignes, empreinte différente")
+        finally:
+            conn.close()
+        return problems
+
+    engine = create_engine(url)
+    try:
+        with engine.connect() as conn:
+            for table, export in manifest['tables'].items():
+                count = conn.execute(text(f'SELECT COUNT(*) FROM "{table}"')).scalar()
+                if count != export['rows']:
+                    problems.append(f"{table} : {count}/{export['rows']} lignes")
+    finally:
+        engine.dispose()
+    return problems
+
+
+def restore_database(directory, database_url, workers=LOAD_WORKERS):
+    """Reconstruit la base database_url depuis les exports d'une sauvegarde.
+
+    Retourne ({table: lignes}, durée en secondes). La base existante est remplacée."""
+    from . import db, models  # noqa: F401 (tables des modèles)
+
+    manifest = read_manifest(directory)
+    if 'tables' not in manifest:
+        raise BackupError(f"{directory} : sauvegarde sans export des tables")
+    missing = [t.name for t in db.metadata.sorted_tables if t.name not in manifest['tables']]
+    if missing:
+        # Tables ajoutées au modèle depuis la sauvegarde : recréées vides
+        logger.warning(f"Tables absentes de la sauvegarde, laissées vides : {', '.join(missing)}")
+    problems = [p for table, export in manifest['tables'].items()
+                for p in verify_export(directory, table, export)]
+    if problems:
+        raise BackupError('; '.join(problems[:5]))
+
+    started = time.perf_counter()
+    url = make_url(database_url)
+    if url.get_backend_name() == 'sqlite':
+        # Reconstruite à côté puis substituée : la base en place reste intacte en cas d'échec
+        path = url.database
+        tmp_path = f"{path}.restoring"
+        for suffix in ('', '-journal', '-wal', '-shm'):
+            if os.path.exists(tmp_path + suffix):
+                os.remove(tmp_path + suffix)
+        try:
+            counts = _restore_sqlite(tmp_path, directory, manifest, db.metadata, workers)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    elif url.get_backend_name() == 'postgresql':
+        counts = _restore_postgres(url, directory, manifest, db.metadata, workers)
+    else:
+        raise BackupError(f"Restauration non prise en charge pour {url.get_backend_name()}")
+    elapsed = time.perf_counter() - started
+
+    problems = verify_restore(database_url, manifest)
+    if problems:
+        raise BackupError("Vérification échouée : " + '; '.join(problems[:5]))
+    logger.info(f"{sum(counts.values())} lignes restaurées en {elapsed:.1f} s")
+    return counts, elapsed
@@ -1,11 +1,22 @@
-from flask import jsonify, request, send_from_directory, Blueprint
+from flask import current_app, request, Blueprint, Response
 from .models import Vehicle, Maintenance, Cleaning, Rental, Reminder, Note, User, ActionHistory
-from . import db
+from . import db, assets, metrics, slowlog, stream, response_cache, coalescer
+from .cache import row_tags
+from .serialization import dumps, jsonify
+from .sync import SYNC_BATCH_MAX, apply_actions
+from .changefeed import CHANGES_LIMIT, CHANGES_MAX, changes_since
+from .bulk import BulkError, create_vehicles as bulk_create_vehicles, parse_vehicle_csv, \
+    update_vehicles as bulk_update_vehicles
+from .batch import BATCH_MAX, BATCH_WORKERS, SUBREQUEST_USER, batch_response, run_batch
+from .stream import RETRY_AFTER as STREAM_RETRY_AFTER
 import logging
 from datetime import datetime, timedelta
 import jwt
 import os
 from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
 
 # Création des blueprints
 api_bp = Blueprint('api', __name__)
@@ -21,26 +32,58 @@ def get_token_from_header():
         return auth_header.split(' ')[1]
     return None
 
+def authenticate(token):
+    # Utilisateur porteur du token, ou (None, réponse d'erreur)
+    if not token:
+        return None, (jsonify({'error': 'Token manquant'}), 401)
+    try:
+        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=['HS256'])
+        user = User.query.get(payload['user_id'])
+        if not user:
+            return None, (jsonify({'error': 'Utilisateur non trouvé'}), 401)
+        return user, None
+    except jwt.ExpiredSignatureError:
+        return None, (jsonify({'error': 'Token expiré'}), 401)
+    except jwt.InvalidTokenError:
+        return None, (jsonify({'error': 'Token invalide'}), 401)
+    except Exception as e:
+        return None, (jsonify({'error': str(e)}), 500)
+
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        token = get_token_from_header()
-        
-        if not token:
-            return jsonify({'error': 'Token manquant'}), 401
-            
-        try:
-            payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=['HS256'])
-            request.current_user = User.query.get(payload['user_id'])
-            if not request.current_user:
-                return jsonify({'error': 'Utilisateur non trouvé'}), 401
-        except jwt.ExpiredSignatureError:
-            return jsonify({'error': 'Token expiré'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'error': 'Token invalide'}), 401
-        except Exception as e:
-            return jsonify({'error': str(e)}), 500
-            
+        # Sous-requête de POST /api/batch : lot déjà authentifié
+        user = request.environ.get(SUBREQUEST_USER)
+        if user is None:
+            user, error = authenticate(get_token_from_header())
+            if error:
+                return error
+        request.current_user = user
+        return f(*args, **kwargs)
+    return decorated_function
+
+def is_admin(user):
+    return user is not None and user.username in current_app.config['ADMIN_USERNAMES']
+
+def current_admin():
+    # Administrateur porteur du token de la requête, ou None (sans réponse d'erreur)
+    token = get_token_from_header()
+    if not token:
+        return None
+    try:
+        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=['HS256'])
+    except jwt.InvalidTokenError:
+        return None
+    user = User.query.get(payload.get('user_id'))
+    return user if is_admin(user) else None
+
+def admin_required(f):
+    # Réservé aux utilisateurs listés dans ADMIN_USERNAMES
+    @wraps(f)
+    @login_required
+    def decorated_function(*args, **kwargs):
+        if not is_admin(request.current_user):
+            return jsonify({'error': 'Accès réservé aux administrateurs'}), 403
         return f(*args, **kwargs)
     return decorated_function
 
@@ -93,7 +136,7 @@ def log_action(user_id, action_type, entity_type, entity_id, changes=None):
 @main_bp.route('/login')
 def login_page():
     try:
-        return send_from_directory('static', 'index.html')
+        return assets.page_response('index.html')
     except Exception as e:
         logging.error(f"Error serving login page: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -101,7 +144,7 @@ def login_page():
 @main_bp.route('/dashboard')
 def dashboard_page():
     try:
-        return send_from_directory('static', 'dashboard.html')
+        return assets.page_response('dashboard.html')
     except Exception as e:
         logging.error(f"Error serving dashboard page: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -114,8 +157,8 @@ def catch_all(path):
         if path.startswith('api/'):
             return jsonify({'error': 'Not found'}), 404
             
-        # Pour toutes les autres routes, on sert index.html
-        return send_from_directory('static', 'index.html')
+        # Pour toutes les autres routes, on sert index.html (gardé en mémoire)
+        return assets.page_response('index.html')
     except Exception as e:
         logging.error(f"Error in catch_all route: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -123,7 +166,8 @@ def catch_all(path):
 # Route pour servir les fichiers statiques
 @main_bp.route('/static/<path:filename>')
 def serve_static(filename):
-    return send_from_directory('static', filename)
+    # Fichiers hashés de static/dist : précompressés et cache immutable
+    return assets.static_response(filename)
 
 # Route de test pour vérifier que l'API fonctionne
 @main_bp.route('/test')
@@ -134,6 +178,21 @@ def test():
         logging.error(f"Error in test: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+# Métriques au format Prometheus (agrégées sur tous les workers)
+@api_bp.route('/_metrics', methods=['GET'])
+def get_metrics():
+    return metrics.response()
+
+# Requêtes lentes récentes de ce worker (tampon circulaire en mémoire)
+@api_bp.route('/_debug/slow', methods=['GET'])
+@admin_required
+def get_slow_requests():
+    limit = request.args.get('limit', type=int)
+    return jsonify({
+        'threshold_ms': slowlog.threshold * 1000,
+        'requests': slowlog.entries(limit)
+    })
+
 # Routes d'authentification
 @api_bp.route('/auth/register', methods=['POST'])
 def register():
@@ -204,29 +263,25 @@ def login():
         logging.error(f"Error in login: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def user_data(user):
+    return {
+        'id': user.id,
+        'username': user.username,
+        'email': user.email
+    }
+
 @api_bp.route('/user', methods=['GET'])
 @login_required
 def get_current_user():
-    return jsonify({
-        'id': request.current_user.id,
-        'name': request.current_user.name,
-        'email': request.current_user.email
-    })
+    return jsonify(user_data(request.current_user))
 
 # Routes pour l'historique
 @api_bp.route('/history', methods=['GET'])
 @login_required
 def get_history():
     try:
-        history = ActionHistory.query.filter_by(user_id=request.current_user.id).order_by(ActionHistory.timestamp.desc()).all()
-        return jsonify([{
-            'id': action.id,
-            'action_type': action.action_type,
-            'entity_type': action.entity_type,
-            'entity_id': action.entity_id,
-            'changes': action.changes,
-            'timestamp': action.timestamp.isoformat()
-        } for action in history])
+        history = ActionHistory.query.filter_by(user_id=request.current_user.id).order_by(ActionHistory.created_at.desc()).all()
+        return jsonify([action.to_dict() for action in history])
     except Exception as e:
         logging.error(f"Error in get_history: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -244,34 +299,29 @@ def clear_history():
         return jsonify({'error': str(e)}), 500
 
 # Routes pour les véhicules
+def vehicles_data():
+    # Notes chargées en une requête pour tous les véhicules (to_dict les inclut)
+    vehicles = Vehicle.query.options(selectinload(Vehicle.notes)).all()
+    return [vehicle.to_dict() for vehicle in vehicles]
+
 @api_bp.route('/vehicles', methods=['GET'])
 @login_required
+@response_cache.cached(tags=lambda: ['vehicle', 'note'])
+@coalescer.coalesce()
 def get_vehicles():
     try:
-        vehicles = Vehicle.query.all()
-        return jsonify([{
-            'id': vehicle.id,
-            'name': vehicle.name,
-            'model': vehicle.model,
-            'year': vehicle.year,
-            'status': vehicle.status
-        } for vehicle in vehicles])
+        return jsonify(vehicles_data())
     except Exception as e:
         logging.error(f"Error in get_vehicles: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 @api_bp.route('/vehicles/<int:id>', methods=['GET'])
 @login_required
+@response_cache.cached(tags=lambda id: row_tags('vehicle', id) + [f'notes:vehicle:{id}', 'note:*'])
 def get_vehicle(id):
     try:
         vehicle = Vehicle.query.get_or_404(id)
-        return jsonify({
-            'id': vehicle.id,
-            'name': vehicle.name,
-            'model': vehicle.model,
-            'year': vehicle.year,
-            'status': vehicle.status
-        })
+        return jsonify(vehicle.to_dict())
     except Exception as e:
         logging.error(f"Error in get_vehicle: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -282,15 +332,17 @@ def create_vehicle():
     try:
         data = request.get_json()
         
-        required_fields = ['name', 'model', 'year']
+        required_fields = ['brand', 'model', 'year', 'license_plate']
         if not all(field in data for field in required_fields):
             return jsonify({'error': 'Tous les champs requis doivent être remplis'}), 400
             
         new_vehicle = Vehicle(
-            name=data['name'],
+            brand=data['brand'],
             model=data['model'],
             year=data['year'],
-            status=data.get('status', 'available')
+            license_plate=data['license_plate'],
+            status=data.get('status', 'available'),
+            parking_spot=data.get('parking_spot')
         )
         
         db.session.add(new_vehicle)
@@ -303,22 +355,18 @@ def create_vehicle():
             entity_type='vehicle',
             entity_id=new_vehicle.id,
             changes={
-                'name': new_vehicle.name,
+                'brand': new_vehicle.brand,
                 'model': new_vehicle.model,
                 'year': new_vehicle.year,
-                'status': new_vehicle.status
+                'license_plate': new_vehicle.license_plate,
+                'status': new_vehicle.status,
+                'parking_spot': new_vehicle.parking_spot
             }
         )
         
         return jsonify({
             'message': 'Véhicule créé avec succès',
-            'vehicle': {
-                'id': new_vehicle.id,
-                'name': new_vehicle.name,
-                'model': new_vehicle.model,
-                'year': new_vehicle.year,
-                'status': new_vehicle.status
-            }
+            'vehicle': new_vehicle.to_dict()
         }), 201
         
     except Exception as e:
@@ -337,33 +385,13 @@ def update_vehicle(vehicle_id):
         changes = {}
         
         # Update only if field is present in request
-        if 'name' in data and data['name'] != vehicle.name:
-            changes['name'] = {
-                'old': vehicle.name,
-                'new': data['name']
-            }
-            vehicle.name = data['name']
-            
-        if 'model' in data and data['model'] != vehicle.model:
-            changes['model'] = {
-                'old': vehicle.model,
-                'new': data['model']
-            }
-            vehicle.model = data['model']
-            
-        if 'year' in data and data['year'] != vehicle.year:
-            changes['year'] = {
-                'old': vehicle.year,
-                'new': data['year']
-            }
-            vehicle.year = data['year']
-            
-        if 'status' in data and data['status'] != vehicle.status:
-            changes['status'] = {
-                'old': vehicle.status,
-                'new': data['status']
-            }
-            vehicle.status = data['status']
+        for field in ['brand', 'model', 'year', 'license_plate', 'status', 'parking_spot']:
+            if field in data and data[field] != getattr(vehicle, field):
+                changes[field] = {
+                    'old': getattr(vehicle, field),
+                    'new': data[field]
+                }
+                setattr(vehicle, field, data[field])
         
         # Only commit if there are changes
         if changes:
@@ -380,13 +408,7 @@ def update_vehicle(vehicle_id):
             
             return jsonify({
                 'message': 'Véhicule mis à jour avec succès',
-                'vehicle': {
-                    'id': vehicle.id,
-                    'name': vehicle.name,
-                    'model': vehicle.model,
-                    'year': vehicle.year,
-                    'status': vehicle.status
-                },
+                'vehicle': vehicle.to_dict(),
                 'changes': changes
             })
         else:
@@ -397,6 +419,50 @@ def update_vehicle(vehicle_id):
         logging.error(f"Error in update_vehicle: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+# Statut et place de plusieurs véhicules : [{id, status, parking_spot}], en une
+# instruction UPDATE, une insertion d'historique et un seul commit
+@api_bp.route('/vehicles', methods=['PATCH'])
+@login_required
+def update_vehicles():
+    data = request.get_json(silent=True)
+    items = data.get('vehicles') if isinstance(data, dict) else data
+    try:
+        return jsonify(bulk_update_vehicles(request.current_user, items))
+    except BulkError as e:
+        return jsonify({'error': e.message}), e.status
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error in update_vehicles: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+# Création de véhicules en masse : JSON {"vehicles": [...], "partial": true}, ou
+# CSV (Content-Type: text/csv, ?partial=1)
+@api_bp.route('/vehicles/bulk', methods=['POST'])
+@login_required
+def create_vehicles():
+    partial = request.args.get('partial', '').lower() in ('1', 'true', 'yes')
+    try:
+        if request.mimetype == 'text/csv':
+            items = parse_vehicle_csv(request.get_data().decode('utf-8-sig'))
+        else:
+            data = request.get_json(silent=True)
+            items = data.get('vehicles') if isinstance(data, dict) else data
+            partial = partial or (isinstance(data, dict) and bool(data.get('partial')))
+        result = bulk_create_vehicles(request.current_user, items, partial=partial)
+        return jsonify(result), 201 if result['created'] else (422 if result['errors'] else 200)
+    except BulkError as e:
+        return jsonify({'error': e.message}), e.status
+    except UnicodeDecodeError:
+        return jsonify({'error': 'CSV attendu en UTF-8'}), 400
+    except IntegrityError:
+        # Plaque insérée par une autre requête depuis la validation
+        db.session.rollback()
+        return jsonify({'error': 'Conflit avec une écriture concurrente, réessayer'}), 409
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error in create_vehicles: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @api_bp.route('/vehicles/<int:vehicle_id>', methods=['DELETE'])
 @login_required
 def delete_vehicle(vehicle_id):
@@ -405,9 +471,10 @@ def delete_vehicle(vehicle_id):
         
         # Store vehicle info before deletion for history
         vehicle_info = {
-            'name': vehicle.name,
+            'brand': vehicle.brand,
             'model': vehicle.model,
             'year': vehicle.year,
+            'license_plate': vehicle.license_plate,
             'status': vehicle.status
         }
         
@@ -440,8 +507,9 @@ def get_maintenances():
             'id': maintenance.id,
             'vehicle_id': maintenance.vehicle_id,
             'type': maintenance.type,
-            'date': maintenance.date.isoformat(),
-            'notes': maintenance.notes
+            'date': maintenance.date,
+            'description': maintenance.description,
+            'status': maintenance.status
         } for maintenance in maintenances])
     except Exception as e:
         logging.error(f"Error in get_maintenances: {str(e)}")
@@ -461,7 +529,8 @@ def create_maintenance():
             vehicle_id=data['vehicle_id'],
             type=data['type'],
             date=datetime.fromisoformat(data['date'].replace('Z', '+00:00')),
-            notes=data.get('notes', '')
+            description=data.get('description', ''),
+            status=data.get('status', 'scheduled')
         )
         
         db.session.add(new_maintenance)
@@ -473,8 +542,9 @@ def create_maintenance():
                 'id': new_maintenance.id,
                 'vehicle_id': new_maintenance.vehicle_id,
                 'type': new_maintenance.type,
-                'date': new_maintenance.date.isoformat(),
-                'notes': new_maintenance.notes
+                'date': new_maintenance.date,
+                'description': new_maintenance.description,
+                'status': new_maintenance.status
             }
         }), 201
         
@@ -484,64 +554,135 @@ def create_maintenance():
         return jsonify({'error': str(e)}), 500
 
 # Routes pour les locations
+def rentals_data():
+    rentals = Rental.query.all()
+    return [{
+        'id': rental.id,
+        'vehicle_id': rental.vehicle_id,
+        'start_date': rental.start_date,
+        'end_date': rental.end_date,
+        'status': rental.status
+    } for rental in rentals]
+
 @api_bp.route('/rentals', methods=['GET'])
 @login_required
+@response_cache.cached(tags=lambda: ['rental'])
 def get_rentals():
     try:
-        rentals = Rental.query.all()
-        return jsonify([{
-            'id': rental.id,
-            'vehicle_id': rental.vehicle_id,
-            'start_date': rental.start_date.isoformat(),
-            'end_date': rental.end_date.isoformat() if rental.end_date else None,
-            'status': rental.status
-        } for rental in rentals])
+        return jsonify(rentals_data())
     except Exception as e:
         logging.error(f"Error in get_rentals: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 # Routes pour les rappels
+def reminders_data():
+    reminders = Reminder.query.all()
+    return [{
+        'id': reminder.id,
+        'vehicle_id': reminder.vehicle_id,
+        'type': reminder.type,
+        'description': reminder.description,
+        'due_date': reminder.due_date,
+        'status': reminder.status
+    } for reminder in reminders]
+
 @api_bp.route('/reminders', methods=['GET'])
 @login_required
+@response_cache.cached(tags=lambda: ['reminder'])
 def get_reminders():
     try:
-        reminders = Reminder.query.all()
-        return jsonify([{
-            'id': reminder.id,
-            'vehicle_id': reminder.vehicle_id,
-            'title': reminder.title,
-            'description': reminder.description,
-            'due_date': reminder.due_date.isoformat()
-        } for reminder in reminders])
+        return jsonify(reminders_data())
     except Exception as e:
         logging.error(f"Error in get_reminders: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 # Route pour le tableau de bord
+def dashboard_stats():
+    total_vehicles = Vehicle.query.count()
+    available_vehicles = Vehicle.query.filter_by(status='available').count()
+    active_rentals = Rental.query.filter_by(status='active').count()
+    pending_maintenances = Maintenance.query.filter(
+        Maintenance.date > datetime.utcnow()
+    ).count()
+
+    return {
+        'total_vehicles': total_vehicles,
+        'available_vehicles': available_vehicles,
+        'active_rentals': active_rentals,
+        'pending_maintenances': pending_maintenances
+    }
+
 @api_bp.route('/dashboard/stats', methods=['GET'])
 @login_required
+@coalescer.coalesce()
 def get_dashboard_stats():
     try:
-        total_vehicles = Vehicle.query.count()
-        available_vehicles = Vehicle.query.filter_by(status='available').count()
-        active_rentals = Rental.query.filter_by(status='active').count()
-        pending_maintenances = Maintenance.query.filter(
-            Maintenance.date > datetime.utcnow()
-        ).count()
-        
-        return jsonify({
-            'total_vehicles': total_vehicles,
-            'available_vehicles': available_vehicles,
-            'active_rentals': active_rentals,
-            'pending_maintenances': pending_maintenances
-        })
+        return jsonify(dashboard_stats())
     except Exception as e:
         logging.error(f"Error in get_dashboard_stats: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+# Données d'une page en un seul aller-retour : une authentification, et les
+# sections indépendantes calculées en parallèle (un thread et une session chacune)
+BOOTSTRAP_SECTIONS = {
+    # nom: (calcul, étiquettes du cache de réponses, None si non mis en cache)
+    'vehicles': (vehicles_data, ['vehicle', 'note']),
+    'stats': (dashboard_stats, None),
+    'rentals': (rentals_data, ['rental']),
+    'reminders': (reminders_data, ['reminder']),
+}
+BOOTSTRAP_WORKERS = 4
+
+def bootstrap_section(name):
+    compute, tags = BOOTSTRAP_SECTIONS[name]
+    if tags is None:
+        return dumps(compute())
+    return response_cache.fetch(f'bootstrap.{name}', tags, compute)
+
+def _bootstrap_section_thread(app, name):
+    with app.app_context():
+        try:
+            return bootstrap_section(name)
+        finally:
+            db.session.remove()
+
+@api_bp.route('/bootstrap', methods=['GET'])
+@login_required
+def get_bootstrap():
+    default = ','.join(['user', *BOOTSTRAP_SECTIONS])
+    names = list(dict.fromkeys(name.strip() for name in request.args.get('sections', default).split(',')
+                               if name.strip()))
+    unknown = [name for name in names if name != 'user' and name not in BOOTSTRAP_SECTIONS]
+    if unknown:
+        return jsonify({'error': f"Sections inconnues : {', '.join(unknown)}",
+                        'sections': ['user', *BOOTSTRAP_SECTIONS]}), 400
+    try:
+        queries = [name for name in names if name != 'user']
+        workers = current_app.config.get('BOOTSTRAP_WORKERS')
+        if workers is None:
+            # SQLite : requêtes dans le processus, limitées par le GIL, le parallélisme
+            # n'y gagne rien ; il masque la latence réseau d'un serveur de base
+            workers = 1 if db.engine.dialect.name == 'sqlite' else BOOTSTRAP_WORKERS
+        workers = min(workers, len(queries))
+        if workers > 1:
+            app = current_app._get_current_object()
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {name: executor.submit(_bootstrap_section_thread, app, name) for name in queries}
+                sections = {name: future.result() for name, future in futures.items()}
+        else:
+            sections = {name: bootstrap_section(name) for name in queries}
+        sections['user'] = dumps(user_data(request.current_user))
+        # Sections déjà sérialisées (éventuellement en cache) : assemblées telles quelles
+        body = b'{' + b','.join(dumps(name) + b':' + sections[name] for name in names) + b'}\n'
+        return current_app.response_class(body, mimetype='application/json')
+    except Exception as e:
+        logging.error(f"Error in get_bootstrap: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 # Routes pour les notes
 @api_bp.route('/vehicles/<int:vehicle_id>/notes', methods=['GET'])
 @login_required
+@response_cache.cached(tags=lambda vehicle_id: [f'notes:vehicle:{vehicle_id}', 'note:*'])
 def get_vehicle_notes(vehicle_id):
     notes = Note.query.filter_by(vehicle_id=vehicle_id).all()
     return jsonify([note.to_dict() for note in notes])
@@ -557,8 +698,7 @@ def add_vehicle_note(vehicle_id):
             
         new_note = Note(
             vehicle_id=vehicle_id,
-            content=data['content'],
-            user_id=request.current_user.id
+            content=data['content']
         )
         
         db.session.add(new_note)
@@ -647,3 +787,69 @@ def delete_vehicle_note(vehicle_id, note_id):
         db.session.rollback()
         logging.error(f"Error in delete_vehicle_note: {str(e)}")
         return jsonify({'error': str(e)}), 500
+
+# Synchronisation des actions effectuées hors ligne, en une requête
+@api_bp.route('/sync/batch', methods=['POST'])
+@login_required
+def sync_batch():
+    data = request.get_json(silent=True) or {}
+    actions = data.get('actions')
+    if not isinstance(actions, list):
+        return jsonify({'error': 'Liste d\'actions requise'}), 400
+    if len(actions) > SYNC_BATCH_MAX:
+        return jsonify({'error': f'{SYNC_BATCH_MAX} actions au maximum par lot'}), 413
+    try:
+        return jsonify({'results': apply_actions(request.current_user, actions)})
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error in sync_batch: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+# Plusieurs appels de l'API en une requête : {"requests": [{method, path, body}],
+# "parallel": true}, réponses dans l'ordre
+@api_bp.route('/batch', methods=['POST'])
+@login_required
+def batch():
+    data = request.get_json(silent=True) or {}
+    items = data.get('requests')
+    if not isinstance(items, list):
+        return jsonify({'error': 'Liste de requêtes requise'}), 400
+    limit = current_app.config.get('BATCH_MAX_REQUESTS', BATCH_MAX)
+    if len(items) > limit:
+        return jsonify({'error': f'{limit} requêtes au maximum par lot'}), 413
+    app = current_app._get_current_object()
+    results = run_batch(app, request.current_user, items, parallel=bool(data.get('parallel')),
+                        workers=current_app.config.get('BATCH_WORKERS', BATCH_WORKERS))
+    return batch_response(app, results)
+
+# Modifications depuis un curseur (seq) : lignes modifiées et pierres tombales
+@api_bp.route('/sync/changes', methods=['GET'])
+@login_required
+def get_sync_changes():
+    since = request.args.get('since', 0, type=int)
+    limit = min(max(request.args.get('limit', CHANGES_LIMIT, type=int), 1), CHANGES_MAX)
+    try:
+        return jsonify(changes_since(since, limit))
+    except Exception as e:
+        logging.error(f"Error in get_sync_changes: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+# Flux SSE de l'état de la flotte. EventSource ne permet pas d'en-têtes : le token
+# peut aussi être passé en paramètre (?token=)
+@api_bp.route('/stream/fleet', methods=['GET'])
+def stream_fleet():
+    user, error = authenticate(get_token_from_header() or request.args.get('token'))
+    if error:
+        return error
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    subscriber, replay = stream.subscribe(current_app._get_current_object(), last_event_id)
+    # La session est rendue dès la fin de la vue : le flux ne garde pas de connexion
+    db.session.remove()
+    if subscriber is None:
+        # Threads du worker réservés aux autres routes : le client réessaie plus tard
+        return jsonify({'error': "Trop d'abonnés au flux, réessayez plus tard"}), 503, \
+            {'Retry-After': str(STREAM_RETRY_AFTER)}
+    return Response(stream.events(subscriber, replay), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
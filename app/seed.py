@@ -0,0 +1,244 @@
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+from werkzeug.security import generate_password_hash
+
+from .models import (ActionHistory, Cleaning, Maintenance, Note, Reminder, Rental, User,
+                     Vehicle)
+
+# Taille des lots envoyés en un seul executemany
+BATCH_SIZE = 50000
+DEFAULT_PASSWORD = 'fleet-password'
+
+BRANDS = {
+    'Tesla': ['Model 3', 'Model Y', 'Model S'],
+    'BMW': ['X5', 'Série 3', 'i4'],
+    'Mercedes': ['C300', 'GLC', 'Classe A'],
+    'Audi': ['Q7', 'A4', 'e-tron'],
+    'Porsche': ['911', 'Macan', 'Taycan'],
+    'Toyota': ['Corolla', 'RAV4', 'Yaris'],
+    'Peugeot': ['208', '3008', '508'],
+    'Renault': ['Clio', 'Mégane', 'Captur'],
+}
+# Répartition des statuts actuels (somme = 1)
+STATUS_WEIGHTS = {
+    'available': 0.55, 'rented': 0.25, 'needs_cleaning': 0.1,
+    'maintenance': 0.06, 'needs_repair': 0.04,
+}
+MAINTENANCE_TYPES = [('Révision', 'Révision périodique'), ('Pneus', 'Changement des pneus'),
+                     ('Freins', 'Changement des plaquettes de frein'), ('Vidange', 'Vidange moteur')]
+REMINDER_TYPES = [('insurance', "Renouvellement de l'assurance"),
+                  ('inspection', 'Contrôle technique'), ('maintenance', 'Entretien annuel')]
+NOTE_CONTENTS = [
+    'Excellent état général, très populaire sur Turo',
+    'Client régulier - préfère cette voiture',
+    'Prévoir changement des plaquettes de frein au prochain entretien',
+    'Problème de suspension à vérifier',
+    'Nettoyage complet nécessaire après dernière location',
+    'Rayure légère sur le pare-choc arrière',
+]
+_LETTERS = 'ABCDEFGHJKLMNPQRSTVWXYZ'
+
+
+def license_plate(index):
+    # Format AB-123-CD, bijectif sur l'index : unicité garantie sans vérification
+    index, digits = divmod(index, 1000)
+    index, last = divmod(index, len(_LETTERS) ** 2)
+    first = index % (len(_LETTERS) ** 2)
+    pair = lambda n: _LETTERS[n // len(_LETTERS)] + _LETTERS[n % len(_LETTERS)]
+    return f"{pair(first)}-{digits:03d}-{pair(last)}"
+
+
+class _Writer:
+    # Insertion par lots via executemany. Sur SQLite on passe directement par le
+    # driver avec des tuples déjà formatés, sans traitement ligne à ligne côté SQLAlchemy
+    def __init__(self, conn):
+        self.conn = conn
+        self.raw = conn.dialect.name == 'sqlite'
+        self.counts = {}
+
+    def write(self, model, columns, rows):
+        table = model.__table__
+        sql = None
+        if self.raw:
+            sql = 'INSERT INTO "{}" ({}) VALUES ({})'.format(
+                table.name, ', '.join(f'"{c}"' for c in columns), ', '.join('?' * len(columns)))
+        batch = []
+        for row in rows:
+            batch.append(row if self.raw else dict(zip(columns, row)))
+            if len(batch) >= BATCH_SIZE:
+                self._flush(table, sql, batch)
+                batch = []
+        if batch:
+            self._flush(table, sql, batch)
+
+    def _flush(self, table, sql, batch):
+        if sql is not None:
+            self.conn.exec_driver_sql(sql, batch)
+        else:
+            self.conn.execute(table.insert(), batch)
+        self.counts[table.name] = self.counts.get(table.name, 0) + len(batch)
+
+
+class _Clock(dict):
+    # Les dates sont manipulées en heures depuis le début de l'historique ;
+    # clock[heure] donne la valeur à écrire (chaîne pour SQLite, datetime sinon),
+    # calculée une seule fois par heure
+    def __init__(self, start, raw):
+        super().__init__()
+        self.start = start
+        self.raw = raw
+
+    def __missing__(self, hour):
+        value = self.start + timedelta(hours=hour)
+        if self.raw:
+            value = value.isoformat(' ', 'microseconds')
+        self[hour] = value
+        return value
+
+
+def _next_id(conn, model):
+    return (conn.execute(select(func.max(model.id))).scalar() or 0) + 1
+
+
+def generate(conn, vehicles, years=1.0, users=5, seed=42, now=None, password=DEFAULT_PASSWORD):
+    """Génère une flotte synthétique reproductible ; retourne le nombre de lignes par table."""
+    rng = random.Random(seed)
+    rand = rng.random
+    choice = rng.choice
+
+    def randint(a, b):
+        # Plus rapide que rng.randint, qui domine sinon le temps de génération
+        return a + int(rand() * (b - a + 1))
+
+    now = (now or datetime.utcnow()).replace(minute=0, second=0, microsecond=0)
+    now_hour = int(24 * 365 * years)
+    writer = _Writer(conn)
+    ts = _Clock(now - timedelta(hours=now_hour), writer.raw)
+    as_json = json.dumps if writer.raw else (lambda value: value)
+
+    ids = {model: _next_id(conn, model) for model in (User, Vehicle, Rental)}
+
+    # Utilisateurs : un seul hachage de mot de passe, partagé
+    password_hash = generate_password_hash(password)
+    user_ids = list(range(ids[User], ids[User] + users))
+    writer.write(User, ('id', 'username', 'email', 'password_hash', 'created_at'), [
+        (user_id, f"user{user_id}", f"user{user_id}@fleet.example", password_hash, ts[0])
+        for user_id in user_ids])
+
+    vehicle_ids = range(ids[Vehicle], ids[Vehicle] + vehicles)
+    statuses, weights = list(STATUS_WEIGHTS), list(STATUS_WEIGHTS.values())
+    brands = list(BRANDS)
+    spots = [f"{row}{n}" for row in 'ABCDEFGH' for n in range(1, 81)]
+
+    def vehicle_rows():
+        for vehicle_id in vehicle_ids:
+            brand = choice(brands)
+            yield (vehicle_id, brand, choice(BRANDS[brand]), randint(2016, now.year),
+                   license_plate(vehicle_id), rng.choices(statuses, weights)[0],
+                   choice(spots), ts[0])
+    writer.write(Vehicle, ('id', 'brand', 'model', 'year', 'license_plate', 'status',
+                           'parking_spot', 'created_at'), vehicle_rows())
+
+    # Locations successives par véhicule, donc sans chevauchement, et un
+    # nettoyage après chaque location terminée
+    cleanings = []
+    cleaning_columns = ('vehicle_id', 'type', 'date', 'status', 'created_at')
+    horizon = now_hour + 24 * 30
+
+    def rental_rows():
+        rental_id = ids[Rental]
+        for vehicle_id in vehicle_ids:
+            start = randint(0, 24 * 7)
+            while start < horizon:
+                end = start + randint(24, 240) + randint(0, 12)
+                if rand() < 0.03:
+                    status = 'cancelled'
+                elif end < now_hour:
+                    status = 'completed'
+                elif start <= now_hour:
+                    status = 'active'
+                else:
+                    status = 'upcoming'
+                yield (rental_id, vehicle_id, ts[start], ts[end], f"TURO{rental_id:010d}",
+                       status, ts[start])
+                if status == 'completed':
+                    kind = 'deep' if rand() < 0.15 else 'basic'
+                    cleanings.append((vehicle_id, kind, ts[end + 2], 'completed', ts[end]))
+                    if len(cleanings) >= BATCH_SIZE:
+                        writer.write(Cleaning, cleaning_columns, cleanings)
+                        del cleanings[:]
+                rental_id += 1
+                # Temps d'immobilisation entre deux locations : 3 jours en moyenne
+                start = end + int(rng.expovariate(1 / 72)) + randint(1, 12)
+
+    writer.write(Rental, ('id', 'vehicle_id', 'start_date', 'end_date', 'turo_booking_id',
+                          'status', 'created_at'), rental_rows())
+    writer.write(Cleaning, cleaning_columns, cleanings)
+
+    def maintenance_rows():
+        for vehicle_id in vehicle_ids:
+            day = randint(0, 90) * 24
+            while day < now_hour + 24 * 60:
+                kind, description = choice(MAINTENANCE_TYPES)
+                status = 'completed' if day < now_hour else 'scheduled'
+                yield (vehicle_id, kind, description, ts[day], status, ts[day - 24 * 7])
+                day += randint(60, 120) * 24
+    writer.write(Maintenance, ('vehicle_id', 'type', 'description', 'date', 'status',
+                               'created_at'), maintenance_rows())
+
+    def reminder_rows():
+        for vehicle_id in vehicle_ids:
+            for kind, description in rng.sample(REMINDER_TYPES, randint(1, len(REMINDER_TYPES))):
+                due = now_hour + randint(-30, 365) * 24
+                status = 'completed' if due < now_hour and rand() < 0.8 else 'pending'
+                yield (vehicle_id, kind, description, ts[due], status, ts[due - 24 * 60])
+    writer.write(Reminder, ('vehicle_id', 'type', 'description', 'due_date', 'status',
+                            'created_at'), reminder_rows())
+
+    def note_rows():
+        for vehicle_id in vehicle_ids:
+            for _ in range(rng.choices((0, 1, 2, 3), (0.4, 0.35, 0.15, 0.1))[0]):
+                created = ts[randint(0, now_hour)]
+                yield (vehicle_id, choice(NOTE_CONTENTS), created, created)
+    writer.write(Note, ('vehicle_id', 'content', 'created_at', 'updated_at'), note_rows())
+
+    # Historique : création de chaque véhicule puis changements de statut
+    changes = [as_json({'status': {'old': old, 'new': new}})
+               for old in statuses for new in statuses if old != new]
+
+    def history_rows():
+        for vehicle_id in vehicle_ids:
+            yield (choice(user_ids), 'create', 'vehicle', vehicle_id, None, ts[0])
+            for _ in range(max(1, int(randint(2, 8) * years))):
+                yield (choice(user_ids), 'update', 'vehicle', vehicle_id,
+                       choice(changes), ts[randint(0, now_hour)])
+    writer.write(ActionHistory, ('user_id', 'action_type', 'entity_type', 'entity_id',
+                                 'changes', 'created_at'), history_rows())
+
+    return writer.counts
+
+
+def seed_database(engine, vehicles, years=1.0, reset=False, **kwargs):
+    # Retourne (lignes par table, durée en secondes)
+    from . import db
+    from .changefeed import backfill_changes
+
+    if reset:
+        db.metadata.drop_all(engine)
+    db.metadata.create_all(engine)
+    started = time.perf_counter()
+    with engine.connect() as conn:
+        if conn.dialect.name == 'sqlite':
+            # Tout est écrit dans une seule transaction : inutile de synchroniser
+            # le disque, et un cache plus large pour la construction des index
+            conn.exec_driver_sql('PRAGMA synchronous=OFF')
+            conn.exec_driver_sql('PRAGMA cache_size=-262144')
+        with conn.begin():
+            counts = generate(conn, vehicles, years, **kwargs)
+            # Insertions hors ORM : ajoutées au flux de synchronisation
+            counts['sync_change'] = backfill_changes(conn)
+    return counts, time.perf_counter() - started
@@ -0,0 +1,98 @@
+import dataclasses
+import json
+import uuid
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from flask import current_app
+from flask.json import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # orjson est optionnel, repli sur le module json standard
+    orjson = None
+
+
+def to_json_compatible(o):
+    # Types non gérés nativement : dates ISO 8601, Decimal, lignes de modèles
+    if isinstance(o, (datetime, date, time)):
+        return o.isoformat()
+    if isinstance(o, Decimal):
+        return str(o)
+    if isinstance(o, uuid.UUID):
+        return str(o)
+    if hasattr(o, 'to_dict'):
+        return o.to_dict()
+    if hasattr(o, '_mapping'):  # sqlalchemy.engine.Row
+        return dict(o._mapping)
+    if dataclasses.is_dataclass(o):
+        return dataclasses.asdict(o)
+    if isinstance(o, (set, frozenset)):
+        return list(o)
+    raise TypeError(f"Type {type(o).__name__} non sérialisable en JSON")
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj):
+        return orjson.dumps(obj, default=to_json_compatible, option=_ORJSON_OPTIONS)
+
+    def loads(data):
+        return orjson.loads(data)
+else:
+    def dumps(obj):
+        return json.dumps(obj, default=to_json_compatible, ensure_ascii=False,
+                          separators=(',', ':')).encode('utf-8')
+
+    def loads(data):
+        return json.loads(data)
+
+
+def jsonify(*args, **kwargs):
+    # Même signature que flask.jsonify, mais via l'encodeur rapide
+    if args and kwargs:
+        raise TypeError("jsonify() behavior undefined when passed both args and kwargs")
+    elif len(args) == 1:
+        data = args[0]
+    else:
+        data = args or kwargs
+
+    return current_app.response_class(
+        dumps(data) + b"\n",
+        mimetype=current_app.config.get('JSONIFY_MIMETYPE', 'application/json'),
+    )
+
+
+class FleetJSONEncoder(JSONEncoder):
+    # Utilisé par flask.jsonify et flask.json.dumps (Flask < 2.2)
+    def default(self, o):
+        try:
+            return to_json_compatible(o)
+        except TypeError:
+            return super().default(o)
+
+
+try:
+    from flask.json.provider import JSONProvider
+except ImportError:  # Flask < 2.2 : seul json_encoder est configurable
+    JSONProvider = None
+
+if JSONProvider is not None:
+    class FleetJSONProvider(JSONProvider):
+        mimetype = 'application/json'
+
+        def dumps(self, obj, **kwargs):
+            return dumps(obj).decode('utf-8')
+
+        def loads(self, s, **kwargs):
+            return loads(s)
+
+        def response(self, *args, **kwargs):
+            return jsonify(*args, **kwargs)
+
+
+def init_app(app):
+    app.json_encoder = FleetJSONEncoder
+    if JSONProvider is not None:
+        app.json = FleetJSONProvider(app)
@@ -0,0 +1,153 @@
+import collections
+import itertools
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime
+
+from flask import g, request
+
+# Clés masquées dans les paramètres enregistrés
+REDACTED_KEYS = ('password', 'token', 'secret')
+MAX_PARAM_LENGTH = 200
+MAX_STACK_SAMPLES = 50
+
+
+def _truncate(value):
+    text = value if isinstance(value, str) else repr(value)
+    if len(text) > MAX_PARAM_LENGTH:
+        return text[:MAX_PARAM_LENGTH] + '...'
+    return text
+
+
+def _redact(data):
+    if not isinstance(data, dict):
+        return _truncate(data) if data is not None else None
+    return {key: '***' if any(s in key.lower() for s in REDACTED_KEYS) else _truncate(value)
+            for key, value in data.items()}
+
+
+class _ActiveRequest:
+    __slots__ = ('thread_id', 'start', 'samples')
+
+    def __init__(self, thread_id, start):
+        self.thread_id = thread_id
+        self.start = start
+        self.samples = collections.Counter()
+
+
+class SlowRequestLog:
+    def __init__(self, app=None):
+        self.threshold = 0.5
+        self.sample_interval = 0.05
+        self.max_statements = 500
+        self.records = collections.deque(maxlen=100)
+        self._active = {}
+        self._ids = itertools.count(1)
+        self._sampler = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.threshold = app.config.get('SLOW_REQUEST_THRESHOLD_MS', 500) / 1000
+        self.sample_interval = app.config.get('SLOW_REQUEST_SAMPLE_INTERVAL_MS', 50) / 1000
+        self.max_statements = app.config.get('SLOW_REQUEST_MAX_STATEMENTS', 500)
+        self.records = collections.deque(maxlen=app.config.get('SLOW_REQUEST_BUFFER_SIZE', 100))
+        app.extensions['slowlog'] = self
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    # Sous le seuil, le coût se limite à l'inscription de la requête dans
+    # _active et à l'ajout d'un tuple par requête SQL (voir metrics), dans la
+    # limite de max_statements
+
+    def _before_request(self):
+        self._ensure_sampler()
+        g.sql_statements = []
+        g.sql_statements_limit = self.max_statements
+        g.slowlog_active = _ActiveRequest(threading.get_ident(), time.perf_counter())
+        self._active[g.slowlog_active.thread_id] = g.slowlog_active
+
+    def _after_request(self, response):
+        g.slowlog_status = response.status_code
+        return response
+
+    def _teardown_request(self, exc):
+        # Sous-requête de POST /api/batch (app/batch.py) : g est celui du lot
+        if 'fleet.batch_user' in request.environ:
+            return
+        active = g.get('slowlog_active')
+        if active is None:
+            return
+        self._active.pop(active.thread_id, None)
+        duration = time.perf_counter() - active.start
+        if duration >= self.threshold:
+            self.records.append(self._record(active, duration, exc))
+
+    def _record(self, active, duration, exc):
+        statements = g.get('sql_statements') or []
+        user = getattr(request, 'current_user', None)
+        return {
+            'id': next(self._ids),
+            'timestamp': datetime.utcnow(),
+            'endpoint': request.endpoint,
+            'method': request.method,
+            'path': request.path,
+            'args': _redact(request.args.to_dict()),
+            'view_args': request.view_args,
+            'body': _redact(request.get_json(silent=True)),
+            'user_id': user.id if user is not None else None,
+            'status': g.get('slowlog_status', 500),
+            'error': repr(exc) if exc is not None else None,
+            'duration_ms': round(duration * 1000, 2),
+            'sql_count': g.get('sql_count', len(statements)),
+            'sql_time_ms': round(g.get('sql_time', 0.0) * 1000, 2),
+            'sql': [{
+                'statement': statement,
+                'parameters': _truncate(parameters),
+                'duration_ms': round(elapsed * 1000, 3),
+            } for statement, parameters, elapsed in statements],
+            'sql_truncated': g.get('sql_count', 0) > len(statements),
+            'stacks': [{'count': count, 'stack': list(stack)}
+                       for stack, count in active.samples.most_common()],
+        }
+
+    # Échantillonnage des piles : un seul thread par worker, qui ne regarde
+    # que les requêtes ayant déjà dépassé le seuil
+
+    def _ensure_sampler(self):
+        if self._sampler is not None and self._sampler.is_alive():
+            return
+        with self._lock:
+            if self._sampler is not None and self._sampler.is_alive():
+                return
+            self._sampler = threading.Thread(target=self._sample_loop, name='slowlog-sampler',
+                                             daemon=True)
+            self._sampler.start()
+
+    def _sample_loop(self):
+        while True:
+            time.sleep(self.sample_interval)
+            if not self._active:
+                continue
+            now = time.perf_counter()
+            frames = None
+            for active in list(self._active.values()):
+                if now - active.start < self.threshold:
+                    continue
+                if sum(active.samples.values()) >= MAX_STACK_SAMPLES:
+                    continue
+                if frames is None:
+                    frames = sys._current_frames()
+                frame = frames.get(active.thread_id)
+                if frame is not None:
+                    stack = tuple(f"{f.filename}:{f.lineno} {f.name}"
+                                  for f in traceback.extract_stack(frame))
+                    active.samples[stack] += 1
+
+    def entries(self, limit=None):
+        records = list(reversed(self.records))
+        return records[:limit] if limit else records
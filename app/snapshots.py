@@ -0,0 +1,321 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import uuid
+import zlib
+from datetime import datetime
+
+from .backup import STEP_PAGES, STEP_SLEEP, BackupError, backup_database, verify_database
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou entre processus
+    fcntl = None
+
+try:
+    import zstandard
+except ImportError:  # blocs zstd optionnels, zlib par défaut
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Sauvegardes incrémentales : chaque fichier est découpé en blocs de taille fixe,
+# stockés une seule fois sous leur empreinte (chunks/ab/abcd...). Un instantané
+# n'est qu'un manifeste (snapshots/<id>.json) listant les blocs de chaque fichier.
+# Multiple de la taille de page SQLite : les pages inchangées de la base
+# retombent sur les mêmes blocs d'une sauvegarde à l'autre. Les exports, bruts,
+# sont découpés entre deux lignes, à des frontières choisies selon le contenu des
+# lignes : une ligne modifiée ou ajoutée ne change que son bloc. Chaque bloc est
+# compressé à part (un flux gzip change en entier dès la première différence).
+CHUNK_SIZE = 256 * 1024
+MIN_LINES_CHUNK = CHUNK_SIZE // 4
+MAX_LINES_CHUNK = CHUNK_SIZE * 4
+
+# Fichiers du projet inclus dans les instantanés (relatifs à la racine)
+PROJECT_PATHS = ('app', 'frontend-new', 'migrations', 'config.py', 'requirements.txt',
+                 'README.md', 'backup.py')
+EXCLUDED_DIRS = {'__pycache__', 'node_modules', 'dist', 'build', '.git'}
+# Déjà compressés : stockés tels quels
+COMPRESSED_SUFFIXES = ('.gz', '.zst', '.br', '.png', '.jpg', '.jpeg', '.woff2')
+
+KEEP_DAILY = 7
+KEEP_WEEKLY = 4
+
+
+class _Lock:
+    # Verrou exclusif sur le dépôt : le ramasse-miettes ne doit pas supprimer les
+    # blocs d'un instantané en cours d'écriture
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.path, 'a')
+        if fcntl is not None:
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+
+
+class ChunkStore:
+    def __init__(self, root):
+        self.root = root
+        self.chunks_dir = os.path.join(root, 'chunks')
+        self.snapshots_dir = os.path.join(root, 'snapshots')
+        os.makedirs(self.chunks_dir, exist_ok=True)
+        os.makedirs(self.snapshots_dir, exist_ok=True)
+        self.written = 0  # octets réellement écrits depuis l'ouverture
+
+    def lock(self):
+        return _Lock(os.path.join(self.root, '.lock'))
+
+    def _chunk_path(self, digest):
+        return os.path.join(self.chunks_dir, digest[:2], digest)
+
+    # Blocs
+
+    def put(self, data, codec='gzip'):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._chunk_path(digest)
+        if not os.path.exists(path):
+            # Premier octet : z = zlib, s = zstd, r = brut
+            if codec == 'gzip':
+                payload = b'z' + zlib.compress(data, 1)
+            elif codec == 'zstd':
+                if zstandard is None:
+                    raise BackupError("Blocs zstd : le paquet zstandard n'est pas installé")
+                payload = b's' + zstandard.ZstdCompressor(level=3).compress(data)
+            else:
+                payload = b'r' + data
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+            self.written += len(payload)
+        return digest
+
+    def get(self, digest):
+        with open(self._chunk_path(digest), 'rb') as f:
+            payload = f.read()
+        if payload[:1] == b'z':
+            data = zlib.decompress(payload[1:])
+        elif payload[:1] == b's':
+            if zstandard is None:
+                raise BackupError(f"Bloc zstd {digest} : le paquet zstandard n'est pas installé")
+            data = zstandard.ZstdDecompressor().decompress(payload[1:])
+        else:
+            data = payload[1:]
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise BackupError(f"Bloc corrompu : {digest}")
+        return data
+
+    def put_file(self, path):
+        codec = None if path.endswith(COMPRESSED_SUFFIXES) else 'gzip'
+        chunks = []
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(CHUNK_SIZE), b''):
+                chunks.append(self.put(block, codec))
+        return chunks
+
+    def put_lines(self, path, rows, codec='gzip'):
+        """Découpe un export NDJSON brut de rows lignes en blocs d'environ CHUNK_SIZE,
+        terminés par une ligne dont l'empreinte est multiple de period : les
+        frontières ne dépendent que des lignes, pas de leur position dans le fichier."""
+        size = os.path.getsize(path)
+        period = max(1, CHUNK_SIZE * rows // size) if size else 1
+        chunks = []
+        block, length = [], 0
+        with open(path, 'rb') as f:
+            for line in f:
+                block.append(line)
+                length += len(line)
+                if length >= MAX_LINES_CHUNK or (length >= MIN_LINES_CHUNK and zlib.crc32(line) % period == 0):
+                    chunks.append(self.put(b''.join(block), codec))
+                    block, length = [], 0
+        if block:
+            chunks.append(self.put(b''.join(block), codec))
+        return chunks
+
+    # Instantanés
+
+    def snapshots(self):
+        """Instantanés du plus ancien au plus récent."""
+        return sorted(name[:-5] for name in os.listdir(self.snapshots_dir) if name.endswith('.json'))
+
+    def load(self, snapshot_id):
+        path = os.path.join(self.snapshots_dir, f"{snapshot_id}.json")
+        if not os.path.exists(path):
+            raise BackupError(f"Instantané inconnu : {snapshot_id}")
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def save(self, manifest):
+        path = os.path.join(self.snapshots_dir, f"{manifest['id']}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, sort_keys=True)
+        os.replace(tmp_path, path)
+
+    def checkout(self, snapshot_id, target, prefix='', exclude=()):
+        """Reconstruit dans target les fichiers d'un instantané (ceux sous prefix)."""
+        manifest = self.load(snapshot_id)
+        for rel_path, entry in manifest['files'].items():
+            if not rel_path.startswith(prefix) or rel_path in exclude:
+                continue
+            path = os.path.join(target, *rel_path.split('/'))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                for digest in entry['chunks']:
+                    f.write(self.get(digest))
+        return manifest
+
+    # Rétention
+
+    def prune(self, keep_daily=KEEP_DAILY, keep_weekly=KEEP_WEEKLY):
+        """Garde le dernier instantané de chacun des keep_daily derniers jours et des
+        keep_weekly dernières semaines, puis supprime les blocs orphelins."""
+        with self.lock():
+            snapshots = self.snapshots()
+            keep = set(snapshots[-1:])
+            days, weeks = set(), set()
+            for snapshot_id in reversed(snapshots):
+                created = datetime.strptime(snapshot_id[:15], '%Y%m%d_%H%M%S')
+                day, week = created.date(), created.isocalendar()[:2]
+                if day not in days and len(days) < keep_daily:
+                    days.add(day)
+                    keep.add(snapshot_id)
+                if week not in weeks and len(weeks) < keep_weekly:
+                    weeks.add(week)
+                    keep.add(snapshot_id)
+            removed = [snapshot_id for snapshot_id in snapshots if snapshot_id not in keep]
+            for snapshot_id in removed:
+                os.remove(os.path.join(self.snapshots_dir, f"{snapshot_id}.json"))
+            freed = self._collect_garbage()
+        return removed, freed
+
+    def _collect_garbage(self):
+        referenced = set()
+        for snapshot_id in self.snapshots():
+            for entry in self.load(snapshot_id)['files'].values():
+                referenced.update(entry['chunks'])
+        freed = 0
+        for prefix in os.listdir(self.chunks_dir):
+            directory = os.path.join(self.chunks_dir, prefix)
+            for name in os.listdir(directory):
+                if name not in referenced:
+                    path = os.path.join(directory, name)
+                    freed += os.path.getsize(path)
+                    os.remove(path)
+        return freed
+
+
+def _project_files(project_root, paths):
+    for rel in paths:
+        path = os.path.join(project_root, rel)
+        if os.path.isfile(path):
+            yield rel.replace(os.sep, '/'), path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if d not in EXCLUDED_DIRS)
+            for name in sorted(files):
+                full = os.path.join(root, name)
+                yield os.path.relpath(full, project_root).replace(os.sep, '/'), full
+
+
+def create_snapshot(store, source, project_root=None, paths=PROJECT_PATHS, codec='gzip',
+                    keep_daily=KEEP_DAILY, keep_weekly=KEEP_WEEKLY, pages=STEP_PAGES, sleep=STEP_SLEEP):
+    """Sauvegarde incrémentale de la base (copie, export par table) et des fichiers du
+    projet ; retourne le manifeste de l'instantané. codec : compression des blocs des
+    exports (gzip ou zstd)."""
+    staging_root = tempfile.mkdtemp(prefix='staging-', dir=store.root)
+    try:
+        with store.lock():
+            written_before = store.written
+            # Exports bruts : compressés bloc par bloc par le dépôt
+            directory, backup = backup_database(source, staging_root, pages, sleep, 'none')
+            last = store.load(store.snapshots()[-1]) if store.snapshots() else {}
+            previous = last.get('files', {})
+            previous_tables = last.get('backup', {}).get('tables', {})
+            exports = {export['file']: (table, export) for table, export in backup['tables'].items()}
+            files = {}
+
+            # Copie de la base : blocs alignés sur les pages. Exports : blocs de lignes,
+            # ou ceux de l'instantané précédent si la table n'a pas changé
+            reused_tables = 0
+            for root, _, names in os.walk(directory):
+                for name in names:
+                    path = os.path.join(root, name)
+                    rel_path = os.path.relpath(path, directory).replace(os.sep, '/')
+                    rel = 'database/' + rel_path
+                    table, export = exports.get(rel_path, (None, None))
+                    if export is None:
+                        files[rel] = {'size': os.path.getsize(path), 'chunks': store.put_file(path)}
+                        continue
+                    old = previous_tables.get(table)
+                    if old and rel in previous and (old['file'], old['rows'], old['sha256']) == \
+                            (export['file'], export['rows'], export['sha256']):
+                        files[rel] = previous[rel]
+                        reused_tables += 1
+                    else:
+                        files[rel] = {'size': os.path.getsize(path),
+                                      'chunks': store.put_lines(path, export['rows'], codec)}
+
+            # Fichiers du projet : inchangés (taille et date) = blocs de l'instantané précédent
+            reused = 0
+            for rel, path in _project_files(project_root, paths) if project_root else ():
+                stat = os.stat(path)
+                rel = 'files/' + rel
+                entry = previous.get(rel)
+                if entry and entry.get('size') == stat.st_size and entry.get('mtime_ns') == stat.st_mtime_ns:
+                    reused += 1
+                else:
+                    entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                             'chunks': store.put_file(path)}
+                files[rel] = entry
+
+            snapshot_id = base_id = os.path.basename(directory)
+            suffix = 0
+            while os.path.exists(os.path.join(store.snapshots_dir, f"{snapshot_id}.json")):
+                suffix += 1
+                snapshot_id = f"{base_id}_{suffix}"
+            manifest = {
+                'id': snapshot_id,
+                'created_at': backup['created_at'],
+                'backup': backup,
+                'files': files,
+                'size': sum(entry['size'] for entry in files.values()),
+                'written': store.written - written_before,
+                'reused_files': reused,
+                'reused_tables': reused_tables,
+            }
+            store.save(manifest)
+    finally:
+        shutil.rmtree(staging_root, ignore_errors=True)
+
+    removed, freed = store.prune(keep_daily, keep_weekly)
+    manifest['pruned'] = removed
+    manifest['freed'] = freed
+    logger.info(f"Instantané {manifest['id']} : {manifest['size']} octets, "
+                f"{manifest['written']} écrits, {len(removed)} supprimés par la rétention")
+    return manifest
+
+
+def verify_snapshot(store, snapshot_id):
+    # Reconstruit l'instantané à part (les blocs sont vérifiés à la lecture) puis
+    # contrôle la base et les exports contre le manifeste de la sauvegarde
+    target = tempfile.mkdtemp(prefix='verify-', dir=store.root)
+    try:
+        store.checkout(snapshot_id, target)
+        return verify_database(os.path.join(target, 'database'))
+    except BackupError as e:
+        return [str(e)]
+    finally:
+        shutil.rmtree(target, ignore_errors=True)
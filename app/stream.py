@@ -0,0 +1,308 @@
+import collections
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import func
+
+from .serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+# Diffusion en direct de l'état de la flotte (GET /api/stream/fleet, SSE). Un seul
+# thread par worker lit les changements validés dans sync_change (quel que soit
+# le worker qui les a écrits) et les échéances atteintes, puis les distribue à
+# tous les abonnés : ceux-ci ne tiennent aucune connexion à la base, mais chacun
+# occupe un thread du worker ; leur nombre est borné pour en laisser à l'API.
+POLL_INTERVAL = 1.0
+HEARTBEAT = 15.0
+BUFFER_SIZE = 1000
+SUBSCRIBER_QUEUE = 256
+POLL_LIMIT = 1000
+IDLE_AFTER = 60.0  # secondes sans abonné avant l'arrêt des lectures
+MAX_SUBSCRIBERS = 24
+RETRY_AFTER = 30  # secondes avant une nouvelle tentative d'un abonné refusé
+
+
+def format_event(event):
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {dumps(event['data']).decode()}\n\n"
+
+
+def parse_event_id(value):
+    # Identifiant d'événement = curseur « seq-ms » : dernier seq de sync_change et
+    # instant (ms) de la dernière échéance diffusés, comparables d'un worker à l'autre
+    try:
+        seq, at = value.split('-')
+        return int(seq), int(at)
+    except (AttributeError, ValueError):
+        return None
+
+
+class _Subscriber:
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE)
+        self.overflowed = False
+
+
+class FleetStream:
+    def __init__(self, app=None):
+        self.poll_interval = POLL_INTERVAL
+        self.heartbeat = HEARTBEAT
+        self.max_subscribers = MAX_SUBSCRIBERS
+        self.idle_after = IDLE_AFTER
+        self._subscribers = set()
+        self._buffer = collections.deque(maxlen=BUFFER_SIZE)
+        self._floor = None  # curseur précédant le plus ancien événement du tampon
+        self._state = None  # None : lectures arrêtées faute d'abonnés
+        self._lock = threading.Lock()
+        self._poll_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pid = None
+        self._poller = None
+        self._worker_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.poll_interval = app.config.get('STREAM_POLL_INTERVAL', POLL_INTERVAL)
+        self.heartbeat = app.config.get('STREAM_HEARTBEAT', HEARTBEAT)
+        # STREAM_MAX_SUBSCRIBERS=0 : pas de limite (workers asynchrones)
+        self.max_subscribers = app.config.get('STREAM_MAX_SUBSCRIBERS', MAX_SUBSCRIBERS)
+        self.idle_after = app.config.get('STREAM_IDLE_AFTER', IDLE_AFTER)
+        self._buffer = collections.deque(maxlen=app.config.get('STREAM_BUFFER_SIZE', BUFFER_SIZE))
+        app.extensions['stream'] = self
+
+    # Abonnés
+
+    def subscribe(self, app, last_event_id=None):
+        """Nouvel abonné ; retourne (abonné, événements à rejouer). Les événements à
+        rejouer valent None si le tampon ne remonte pas jusqu'à last_event_id :
+        le client doit alors recharger l'état complet. Retourne (None, None) si le
+        worker a déjà max_subscribers abonnés."""
+        self._ensure_poller(app)
+        subscriber = _Subscriber()
+        with self._poll_lock:
+            if self.max_subscribers and len(self._subscribers) >= self.max_subscribers:
+                return None, None
+            if self._state is None:
+                # Lectures arrêtées : état rechargé et tampon repris à zéro. Ce qui
+                # s'est passé entre-temps n'est pas diffusé comme des événements en
+                # direct ; un client qui reprend d'avant reçoit reset
+                state = _PollState.load()
+                with self._lock:
+                    self._state = state
+                    self._buffer.clear()
+                    self._floor = state.cursor()
+            with self._lock:
+                replay = []
+                if last_event_id is not None:
+                    cursor = parse_event_id(last_event_id)
+                    floor = self._floor
+                    if cursor is None or cursor[0] < floor[0] or cursor[1] < floor[1]:
+                        replay = None
+                    else:
+                        replay = [event for event in self._buffer
+                                  if event['cursor'][0] > cursor[0] or event['cursor'][1] > cursor[1]]
+                self._subscribers.add(subscriber)
+        self._wakeup.set()
+        return subscriber, replay
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def events(self, subscriber, replay):
+        """Flux SSE d'un abonné : reprise, événements, puis battements de cœur."""
+        try:
+            yield "retry: 3000\n\n"
+            if replay is None:
+                yield format_event({'id': self.cursor_id(), 'event': 'reset', 'data': {}})
+            else:
+                for event in replay:
+                    yield format_event(event)
+            while True:
+                try:
+                    event = subscriber.queue.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    yield ': ping\n\n'
+                    continue
+                if subscriber.overflowed:
+                    # Abonné trop lent : il se reconnecte et reprend depuis son curseur
+                    return
+                yield format_event(event)
+        finally:
+            self.unsubscribe(subscriber)
+
+    def cursor_id(self):
+        cursor = self._buffer[-1]['cursor'] if self._buffer else self._floor
+        return '{}-{}'.format(*cursor) if cursor else '0-0'
+
+    def _publish(self, events):
+        with self._lock:
+            for event in events:
+                if len(self._buffer) == self._buffer.maxlen:
+                    self._floor = self._buffer[0]['cursor']
+                self._buffer.append(event)
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            for event in events:
+                try:
+                    subscriber.queue.put_nowait(event)
+                except queue.Full:
+                    subscriber.overflowed = True
+                    break
+
+    # Source unique des changements (un thread par worker)
+
+    def _ensure_poller(self, app):
+        if self._pid == os.getpid():
+            return
+        with self._worker_lock:
+            if self._pid == os.getpid():
+                return
+            self._subscribers = set()
+            self._buffer.clear()
+            self._floor = None
+            self._state = None
+            self._poller = threading.Thread(target=self._poll_loop, args=(app,), name='fleet-stream', daemon=True)
+            self._poller.start()
+            self._pid = os.getpid()
+
+    def _poll_loop(self, app):
+        from . import db
+
+        active = time.monotonic()
+        while True:
+            if self._subscribers:
+                active = time.monotonic()
+            elif time.monotonic() - active >= self.idle_after and self._stop_polling():
+                # Lectures reprises par le prochain abonné (subscribe recharge l'état)
+                self._wakeup.wait()
+                active = time.monotonic()
+                continue
+            try:
+                with app.app_context():
+                    try:
+                        # Publication sous le même verrou : pas d'événement d'avant
+                        # un rechargement par subscribe dans le nouveau tampon
+                        with self._poll_lock:
+                            events = self._state.poll() if self._state is not None else None
+                            if events:
+                                self._publish(events)
+                    finally:
+                        db.session.remove()
+            except Exception as e:
+                logger.error(f"Erreur du flux de la flotte : {e}")
+            time.sleep(self.poll_interval)
+
+    def _stop_polling(self):
+        # Personne à l'écoute depuis idle_after : plus de requêtes. Le tampon reste
+        # pour cursor_id, mais l'état (curseurs, statuts diffusés) est abandonné
+        with self._poll_lock:
+            if self._subscribers:
+                return False
+            self._state = None
+            self._wakeup.clear()
+            return True
+
+
+class _PollState:
+    def __init__(self, seq, at, vehicles):
+        self.seq = seq
+        self.at = at
+        self.vehicles = vehicles  # id -> (statut, place) déjà diffusés
+
+    @classmethod
+    def load(cls):
+        from . import db
+        from .models import SyncChange, Vehicle
+
+        seq = db.session.query(func.max(SyncChange.seq)).scalar() or 0
+        vehicles = {row.id: (row.status, row.parking_spot)
+                    for row in db.session.query(Vehicle.id, Vehicle.status, Vehicle.parking_spot)}
+        return cls(seq, datetime.utcnow(), vehicles)
+
+    def cursor(self, seq=None, at=None):
+        at = self.at if at is None else at
+        return (self.seq if seq is None else seq, int(at.replace(tzinfo=timezone.utc).timestamp() * 1000))
+
+    def _event(self, name, data, seq=None, at=None):
+        cursor = self.cursor(seq, at)
+        return {'id': '{}-{}'.format(*cursor), 'cursor': cursor, 'event': name, 'data': data}
+
+    def poll(self):
+        from . import db
+        from .models import SyncChange, Vehicle, Rental, Reminder
+
+        events = []
+        # Écritures validées : véhicules et locations modifiés depuis le curseur
+        top = db.session.query(func.max(SyncChange.seq)).scalar() or 0
+        changes = (SyncChange.query
+                   .filter(SyncChange.seq > self.seq, SyncChange.seq <= top,
+                           SyncChange.entity_type.in_(('vehicle', 'rental')))
+                   .order_by(SyncChange.seq).limit(POLL_LIMIT).all())
+        vehicle_ids = [c.entity_id for c in changes if c.entity_type == 'vehicle' and not c.deleted]
+        rental_ids = [c.entity_id for c in changes if c.entity_type == 'rental' and not c.deleted]
+        vehicles = {row.id: row for row in db.session.query(Vehicle.id, Vehicle.status, Vehicle.parking_spot)
+                    .filter(Vehicle.id.in_(vehicle_ids))} if vehicle_ids else {}
+        rentals = {rental.id: rental for rental in Rental.query.filter(Rental.id.in_(rental_ids))} if rental_ids else {}
+
+        for change in changes:
+            if change.entity_type == 'vehicle':
+                event = self._vehicle_event(change, vehicles.get(change.entity_id))
+                if event is not None:
+                    events.append(event)
+            else:
+                rental = rentals.get(change.entity_id)
+                data = _rental(rental) if rental is not None else {'id': change.entity_id, 'deleted': True}
+                events.append(self._event('rental', data, seq=change.seq))
+        self.seq = top if len(changes) < POLL_LIMIT else changes[-1].seq
+
+        # Échéances atteintes depuis le dernier passage
+        now = datetime.utcnow()
+        due = []
+        for rental in Rental.query.filter(Rental.start_date > self.at, Rental.start_date <= now,
+                                          Rental.status != 'cancelled'):
+            due.append((rental.start_date, 'rental_started', _rental(rental)))
+        for rental in Rental.query.filter(Rental.end_date > self.at, Rental.end_date <= now,
+                                          Rental.status != 'cancelled'):
+            due.append((rental.end_date, 'rental_ended', _rental(rental)))
+        for reminder in Reminder.query.filter(Reminder.due_date > self.at, Reminder.due_date <= now,
+                                              Reminder.status == 'pending'):
+            due.append((reminder.due_date, 'reminder_due', {
+                'id': reminder.id, 'vehicle_id': reminder.vehicle_id, 'type': reminder.type,
+                'description': reminder.description, 'due_date': reminder.due_date}))
+        for at, name, data in sorted(due, key=lambda item: item[0]):
+            events.append(self._event(name, data, at=at))
+        self.at = now
+        return events
+
+    def _vehicle_event(self, change, row):
+        # Un événement par écriture : statut et place, avec les valeurs précédentes
+        previous = self.vehicles.get(change.entity_id, (None, None))
+        if row is None:
+            self.vehicles.pop(change.entity_id, None)
+            return self._event('vehicle_deleted', {'id': change.entity_id}, seq=change.seq)
+        current = (row.status, row.parking_spot)
+        if current == previous:
+            return None  # autre champ modifié (marque, modèle...)
+        self.vehicles[row.id] = current
+        return self._event('vehicle', {
+            'id': row.id, 'status': row.status, 'parking_spot': row.parking_spot,
+            'previous': {'status': previous[0], 'parking_spot': previous[1]}}, seq=change.seq)
+
+
+def _rental(rental):
+    return {
+        'id': rental.id,
+        'vehicle_id': rental.vehicle_id,
+        'status': rental.status,
+        'start_date': rental.start_date,
+        'end_date': rental.end_date,
+    }
@@ -0,0 +1,246 @@
+import logging
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+
+from . import db
+from .models import Vehicle, Note, Maintenance, ActionHistory, IdempotencyKey
+from .serialization import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+# Synchronisation des actions mises en file hors ligne (POST /api/sync/batch) :
+# une seule transaction, un SAVEPOINT par action pour qu'une action en échec
+# (véhicule supprimé entre-temps...) n'annule pas les autres
+SYNC_BATCH_MAX = 500
+# Clés d'idempotence gardées KEY_RETENTION_DAYS jours (plus longtemps qu'un client
+# ne reste hors ligne) ; purge au plus une fois par PRUNE_INTERVAL et par worker
+KEY_RETENTION_DAYS = 30
+PRUNE_INTERVAL = 3600
+
+_last_prune = None
+
+VEHICLE_FIELDS = ('brand', 'model', 'year', 'license_plate', 'status', 'parking_spot')
+MAINTENANCE_FIELDS = ('vehicle_id', 'type', 'date', 'description', 'status')
+
+
+class SyncError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def maintenance_dict(maintenance):
+    return {
+        'id': maintenance.id,
+        'vehicle_id': maintenance.vehicle_id,
+        'type': maintenance.type,
+        'date': maintenance.date,
+        'description': maintenance.description,
+        'status': maintenance.status
+    }
+
+
+def _parse_date(value):
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        raise SyncError(f"Date invalide : {value}")
+
+
+def _get(model, entity_id):
+    entity = db.session.get(model, entity_id) if entity_id is not None else None
+    if entity is None:
+        raise SyncError(f"{model.__name__} {entity_id} introuvable", 404)
+    return entity
+
+
+def _audit(user, action_type, entity_type, entity_id, changes):
+    # Même format que log_action, sans commit intermédiaire
+    db.session.add(ActionHistory(user_id=user.id, action_type=action_type, entity_type=entity_type,
+                                 entity_id=entity_id, changes=changes))
+
+
+def _update_fields(entity, data, fields):
+    changes = {}
+    for field in fields:
+        if field in data:
+            value = _parse_date(data[field]) if field == 'date' else data[field]
+            if value != getattr(entity, field):
+                changes[field] = {'old': str(getattr(entity, field)), 'new': str(value)}
+                setattr(entity, field, value)
+    return changes
+
+
+def _apply_vehicle(user, action, data):
+    if action['type'] == 'create':
+        if not all(data.get(field) is not None for field in ('brand', 'model', 'year', 'license_plate')):
+            raise SyncError('Tous les champs requis doivent être remplis')
+        vehicle = Vehicle(brand=data['brand'], model=data['model'], year=data['year'],
+                          license_plate=data['license_plate'], status=data.get('status', 'available'),
+                          parking_spot=data.get('parking_spot'))
+        db.session.add(vehicle)
+        db.session.flush()
+        _audit(user, 'create', 'vehicle', vehicle.id, {field: getattr(vehicle, field) for field in VEHICLE_FIELDS})
+        return 201, vehicle.to_dict()
+    vehicle = _get(Vehicle, action.get('id'))
+    if action['type'] == 'update':
+        changes = _update_fields(vehicle, data, VEHICLE_FIELDS)
+        if changes:
+            _audit(user, 'update', 'vehicle', vehicle.id, changes)
+        return 200, vehicle.to_dict()
+    info = {field: getattr(vehicle, field) for field in VEHICLE_FIELDS[:5]}
+    db.session.delete(vehicle)
+    db.session.flush()
+    _audit(user, 'delete', 'vehicle', action['id'], info)
+    return 200, {'id': action['id']}
+
+
+def _apply_note(user, action, data):
+    if action['type'] == 'create':
+        if not data.get('content'):
+            raise SyncError('Le contenu de la note est requis')
+        _get(Vehicle, action.get('vehicle_id'))
+        note = Note(vehicle_id=action['vehicle_id'], content=data['content'])
+        db.session.add(note)
+        db.session.flush()
+        _audit(user, 'create', 'note', note.id, {'content': note.content})
+        return 201, note.to_dict()
+    note = _get(Note, action.get('id'))
+    if action['type'] == 'update':
+        if not data.get('content'):
+            raise SyncError('Le contenu de la note est requis')
+        if data['content'] != note.content:
+            _audit(user, 'update', 'note', note.id, {'content': {'old': note.content, 'new': data['content']}})
+            note.content = data['content']
+            db.session.flush()
+        return 200, note.to_dict()
+    _audit(user, 'delete', 'note', note.id, {'content': note.content})
+    db.session.delete(note)
+    db.session.flush()
+    return 200, {'id': action['id']}
+
+
+def _apply_maintenance(user, action, data):
+    if action['type'] == 'create':
+        if not all(data.get(field) is not None for field in ('vehicle_id', 'type', 'date')):
+            raise SyncError('Tous les champs requis doivent être remplis')
+        _get(Vehicle, data['vehicle_id'])
+        maintenance = Maintenance(vehicle_id=data['vehicle_id'], type=data['type'], date=_parse_date(data['date']),
+                                  description=data.get('description', ''), status=data.get('status', 'scheduled'))
+        db.session.add(maintenance)
+        db.session.flush()
+        _audit(user, 'create', 'maintenance', maintenance.id,
+               {field: str(getattr(maintenance, field)) for field in MAINTENANCE_FIELDS})
+        return 201, maintenance_dict(maintenance)
+    maintenance = _get(Maintenance, action.get('id'))
+    if action['type'] == 'update':
+        if 'vehicle_id' in data:
+            _get(Vehicle, data['vehicle_id'])
+        changes = _update_fields(maintenance, data, MAINTENANCE_FIELDS)
+        if changes:
+            _audit(user, 'update', 'maintenance', maintenance.id, changes)
+        return 200, maintenance_dict(maintenance)
+    _audit(user, 'delete', 'maintenance', maintenance.id, {'type': maintenance.type})
+    db.session.delete(maintenance)
+    db.session.flush()
+    return 200, {'id': action['id']}
+
+
+HANDLERS = {
+    'vehicle': _apply_vehicle,
+    'note': _apply_note,
+    'maintenance': _apply_maintenance,
+}
+
+
+def _prefetch(actions):
+    # Entités visées chargées en une requête par type : les actions les trouvent
+    # ensuite dans la session (db.session.get sans requête)
+    ids = {'vehicle': set(), 'note': set(), 'maintenance': set()}
+    for action in actions:
+        if not isinstance(action, dict) or action.get('entity') not in ids:
+            continue
+        data = action.get('data') if isinstance(action.get('data'), dict) else {}
+        if isinstance(action.get('id'), int):
+            ids[action['entity']].add(action['id'])
+        for vehicle_id in (action.get('vehicle_id'), data.get('vehicle_id')):
+            if isinstance(vehicle_id, int):
+                ids['vehicle'].add(vehicle_id)
+    if ids['vehicle']:
+        Vehicle.query.options(selectinload(Vehicle.notes)).filter(Vehicle.id.in_(ids['vehicle'])).all()
+    if ids['note']:
+        Note.query.filter(Note.id.in_(ids['note'])).all()
+    if ids['maintenance']:
+        Maintenance.query.filter(Maintenance.id.in_(ids['maintenance'])).all()
+
+
+def apply_actions(user, actions):
+    """Applique dans l'ordre des actions {key, type, entity, id, vehicle_id, data} ;
+    retourne un résultat par action. Une clé déjà traitée pour cet utilisateur
+    renvoie le résultat enregistré sans rien réappliquer."""
+    keys = [action.get('key') for action in actions if isinstance(action, dict) and action.get('key')]
+    done = {row.key: row for row in IdempotencyKey.query.filter(
+        IdempotencyKey.user_id == user.id, IdempotencyKey.key.in_(keys))} if keys else {}
+    _prefetch(actions)
+
+    results = []
+    for action in actions:
+        key = action.get('key') if isinstance(action, dict) else None
+        if not key or not isinstance(key, str) or len(key) > 64:
+            results.append({'key': key, 'status': 400, 'error': "Clé d'idempotence manquante ou invalide"})
+            continue
+        if key in done:
+            row = done[key]
+            results.append({'key': key, 'status': row.status_code, 'data': row.response, 'replayed': True})
+            continue
+        handler = HANDLERS.get(action.get('entity'))
+        if handler is None or action.get('type') not in ('create', 'update', 'delete'):
+            results.append({'key': key, 'status': 400, 'error': 'Action inconnue'})
+            continue
+        try:
+            with db.session.begin_nested():
+                status, data = handler(user, action, action.get('data') or {})
+                # Résultat enregistré tel qu'il sera renvoyé (dates en ISO 8601)
+                data = loads(dumps(data))
+                row = IdempotencyKey(user_id=user.id, key=key, status_code=status, response=data)
+                db.session.add(row)
+                db.session.flush()
+            done[key] = row
+            results.append({'key': key, 'status': status, 'data': data})
+        except SyncError as e:
+            results.append({'key': key, 'status': e.status, 'error': e.message})
+        except IntegrityError as e:
+            logger.warning(f"Action {key} refusée par la base : {e.orig}")
+            results.append({'key': key, 'status': 409, 'error': 'Conflit avec les données existantes'})
+    db.session.commit()
+    _maybe_prune()
+    return results
+
+
+def prune_idempotency_keys(days=KEY_RETENTION_DAYS):
+    """Supprime les clés d'idempotence de plus de days jours (index sur created_at) ;
+    retourne le nombre de clés supprimées."""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    deleted = IdempotencyKey.query.filter(IdempotencyKey.created_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+def _maybe_prune():
+    global _last_prune
+    now = time.monotonic()
+    if _last_prune is not None and now - _last_prune < PRUNE_INTERVAL:
+        return
+    _last_prune = now
+    try:
+        deleted = prune_idempotency_keys(current_app.config.get('IDEMPOTENCY_KEY_DAYS', KEY_RETENTION_DAYS))
+        if deleted:
+            logger.info(f"{deleted} clé(s) d'idempotence expirée(s) supprimée(s)")
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Purge des clés d'idempotence impossible : {e}")
@@ -0,0 +1,368 @@
+import hashlib
+import inspect
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+# Bases modèles pré-remplies, construites une fois par révision du schéma et
+# spécification de données, puis clonées pour chaque test ou banc d'essai :
+#   - SQLite : copie par l'API de sauvegarde, vers un fichier ou en mémoire
+#   - PostgreSQL : CREATE DATABASE ... TEMPLATE
+
+DEFAULT_DIRECTORY = os.path.join(tempfile.gettempdir(), 'fleet-templates')
+
+
+def schema_revision():
+    # Empreinte du DDL des modèles et du code du générateur : toute modification
+    # de l'un ou de l'autre invalide les modèles existants
+    from . import db, seed
+    from sqlalchemy.dialects import sqlite
+
+    digest = hashlib.sha256()
+    for table in db.metadata.sorted_tables:
+        digest.update(str(CreateTable(table).compile(dialect=sqlite.dialect())).encode())
+        for index in sorted(table.indexes, key=lambda i: i.name or ''):
+            digest.update(str(CreateIndex(index).compile(dialect=sqlite.dialect())).encode())
+    digest.update(inspect.getsource(seed).encode())
+    return digest.hexdigest()[:16]
+
+
+class DatabaseTemplate:
+    def __init__(self, spec, url=None, directory=None):
+        """spec : arguments de app.seed.seed_database (vehicles, years, seed, now...)."""
+        self.spec = dict(spec)
+        self.url = make_url(url) if url else None
+        self.directory = directory or DEFAULT_DIRECTORY
+        payload = json.dumps({'schema': schema_revision(), 'spec': self.spec},
+                             sort_keys=True, default=str)
+        self.key = hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+    @property
+    def is_postgres(self):
+        return self.url is not None and self.url.get_backend_name() == 'postgresql'
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, f"template-{self.key}.db")
+
+    @property
+    def name(self):
+        return f"fleet_tpl_{self.key}"
+
+    def _seed(self, url):
+        from .seed import seed_database
+
+        engine = create_engine(url)
+        try:
+            seed_database(engine, reset=True, **self.spec)
+        finally:
+            engine.dispose()
+
+    # Construction
+
+    def ensure(self):
+        if self.is_postgres:
+            return self._ensure_postgres()
+        if not os.path.exists(self.path):
+            os.makedirs(self.directory, exist_ok=True)
+            # Construit à côté puis renommé : un autre processus ne voit jamais
+            # de modèle incomplet
+            tmp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+            try:
+                self._seed(f"sqlite:///{tmp_path}")
+                os.replace(tmp_path, self.path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        return self.path
+
+    def _admin_engine(self):
+        return create_engine(self.url, isolation_level='AUTOCOMMIT')
+
+    def _ensure_postgres(self):
+        engine = self._admin_engine()
+        try:
+            with engine.connect() as conn:
+                exists = conn.execute(text("SELECT 1 FROM pg_database WHERE datname = :name"),
+                                      {'name': self.name}).scalar()
+                if exists:
+                    return self.name
+                building = f"{self.name}_build"
+                conn.execute(text(f'DROP DATABASE IF EXISTS "{building}"'))
+                conn.execute(text(f'CREATE DATABASE "{building}"'))
+            self._seed(self.url.set(database=building))
+            with engine.connect() as conn:
+                conn.execute(text(f'ALTER DATABASE "{building}" RENAME TO "{self.name}"'))
+        finally:
+            engine.dispose()
+        return self.name
+
+    # Clonage
+
+    def clone(self, target=None):
+        """Copie du modèle ; retourne l'URL SQLAlchemy de la copie."""
+        self.ensure()
+        if self.is_postgres:
+            name = target or f"fleet_clone_{uuid.uuid4().hex[:12]}"
+            engine = self._admin_engine()
+            try:
+                with engine.connect() as conn:
+                    conn.execute(text(f'CREATE DATABASE "{name}" TEMPLATE "{self.name}"'))
+            finally:
+                engine.dispose()
+            return str(self.url.set(database=name))
+
+        target = target or os.path.join(self.directory, f"clone-{uuid.uuid4().hex[:12]}.db")
+        source = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        destination = sqlite3.connect(target)
+        try:
+            source.backup(destination)
+        finally:
+            destination.close()
+            source.close()
+        return f"sqlite:///{target}"
+
+    def clone_memory(self):
+        """Copie en mémoire ; retourne la connexion sqlite3 (partageable entre threads)."""
+        source = sqlite3.connect(f"file:{self.ensure()}?mode=ro", uri=True)
+        connection = sqlite3.connect(':memory:', check_same_thread=False)
+        try:
+            source.backup(connection)
+        finally:
+            source.close()
+        return connection
+
+    def drop(self, url):
+        url = make_url(url)
+        if url.get_backend_name() == 'postgresql':
+            engine = self._admin_engine()
+            try:
+                with engine.connect() as conn:
+                    conn.execute(text(f'DROP DATABASE IF EXISTS "{url.database}"'))
+            finally:
+                engine.dispose()
+        elif url.database and os.path.exists(url.database):
+            os.remove(url.database)
+
+
+@contextmanager
+def template_app(spec, memory=True, url=None, directory=None, **config):
+    """Application Flask sur une copie fraîche du modèle correspondant à spec.
+
+    Pour un test : with template_app({'vehicles': 1000}) as app: ...
+    """
+    from . import create_app, db
+
+    template = DatabaseTemplate(spec, url=url, directory=directory)
+    clone_url = None
+    if memory and not template.is_postgres:
+        connection = template.clone_memory()
+        config.update({
+            'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+            'SQLALCHEMY_ENGINE_OPTIONS': {'creator': lambda: connection, 'poolclass': StaticPool},
+        })
+    else:
+        clone_url = template.clone()
+        config['SQLALCHEMY_DATABASE_URI'] = clone_url
+
+    app = create_app(config)
+    try:
+        yield app
+    finally:
+        with app.app_context():
+            db.session.remove()
+            db.get_engine(app).dispose()
+        if clone_url is not None:
+            template.drop(clone_url)
+        else:
+            connection.close()
+
+
+def time_clone(spec, repeat=5, **kwargs):
+    # Durée moyenne d'un clonage (modèle déjà construit), pour vérification rapide
+    template = DatabaseTemplate(spec, **kwargs)
+    template.ensure()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        template.clone_memory().close()
+    return (time.perf_counter() - started) / repeat
+
+
+# Détection des N+1 : requêtes SQL regroupées par forme normalisée
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN \((?:\?, )*\?\)", re.IGNORECASE)
+_VALUES_ROWS = re.compile(r"(\((?:\?, )*\?\))(?:, \1)+")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_sql(statement):
+    # Littéraux et listes de paramètres remplacés : deux requêtes de même forme
+    # ne diffèrent plus que par leurs paramètres
+    statement = _SPACES.sub(' ', statement).strip()
+    statement = _STRING.sub('?', statement)
+    statement = _NUMBER.sub('?', statement)
+    statement = _IN_LIST.sub('IN (?)', statement)
+    return _VALUES_ROWS.sub(r'\1', statement)
+
+
+class QueryPatternError(AssertionError):
+    pass
+
+
+class QueryRecorder:
+    """Enregistre les requêtes SQL exécutées dans le thread courant.
+
+    with QueryRecorder() as queries:
+        client.get('/api/vehicles')
+    queries.assert_max_repeats(3)
+    """
+
+    def __init__(self, label=None):
+        self.label = label
+        self.statements = []
+        self._thread = None
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == self._thread:
+            self.statements.append(statement)
+
+    def __enter__(self):
+        self._thread = threading.get_ident()
+        event.listen(Engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(Engine, 'before_cursor_execute', self._record)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def shapes(self):
+        return Counter(normalize_sql(statement) for statement in self.statements)
+
+    def max_repeats(self):
+        return max(self.shapes().values(), default=0)
+
+    def assert_max_repeats(self, limit):
+        repeated = [(shape, count) for shape, count in self.shapes().most_common() if count > limit]
+        if repeated:
+            lines = [f"  {count} x {shape}" for shape, count in repeated]
+            raise QueryPatternError(
+                f"{self.label or 'Requête'} : même requête SQL répétée plus de {limit} fois "
+                f"(N+1 probable)\n" + '\n'.join(lines))
+
+
+def _check_subresponses(state, data):
+    # Capture des cas de POST /api/batch : chaque sous-requête doit aboutir
+    failed = [f"{index} ({response['status']})" for index, response in enumerate(data['responses'])
+              if response['status'] >= 400]
+    if failed:
+        raise QueryPatternError(f"Sous-requêtes en échec : {', '.join(failed)}")
+
+
+# Un cas par route de api_bp, exécutés dans l'ordre : (endpoint, méthode, URL,
+# corps JSON, capture). Les URL utilisent les identifiants capturés par les cas
+# précédents ({vehicle}, {note}) ; une capture peut lever QueryPatternError
+ROUTE_CASES = [
+    ('api.login', 'POST', '/api/auth/login', lambda s: {'username': s['username'], 'password': s['password']},
+     lambda s, data: s.update(token=data['token'])),
+    ('api.register', 'POST', '/api/auth/register',
+     lambda s: {'username': 'check-queries', 'email': 'check-queries@fleet.example', 'password': 'secret'}, None),
+    ('api.get_current_user', 'GET', '/api/user', None, None),
+    ('api.get_bootstrap', 'GET', '/api/bootstrap', None, None),
+    ('api.get_vehicles', 'GET', '/api/vehicles', None, None),
+    ('api.create_vehicle', 'POST', '/api/vehicles',
+     lambda s: {'brand': 'Tesla', 'model': 'Model 3', 'year': 2024, 'license_plate': 'CHECK-001'},
+     lambda s, data: s.update(vehicle=data['vehicle']['id'])),
+    ('api.create_vehicles', 'POST', '/api/vehicles/bulk', lambda s: {'partial': True, 'vehicles': [
+        {'brand': 'Renault', 'model': 'Zoe', 'year': 2023, 'license_plate': f'CHECK-B{i}'} for i in range(3)]
+        + [{'brand': 'Renault', 'model': 'Zoe', 'year': 'x', 'license_plate': 'CHECK-B0'}]}, None),
+    ('api.get_vehicle', 'GET', '/api/vehicles/{vehicle}', None, None),
+    ('api.update_vehicle', 'PUT', '/api/vehicles/{vehicle}',
+     lambda s: {'status': 'maintenance', 'parking_spot': 'Z1'}, None),
+    ('api.update_vehicles', 'PATCH', '/api/vehicles', lambda s: [
+        {'id': 2, 'status': 'needs_cleaning'}, {'id': 3, 'status': 'needs_cleaning'},
+        {'id': 4, 'status': 'available', 'parking_spot': 'A4'}], None),
+    ('api.add_vehicle_note', 'POST', '/api/vehicles/{vehicle}/notes', lambda s: {'content': 'Note'},
+     lambda s, data: s.update(note=data['note']['id'])),
+    ('api.get_vehicle_notes', 'GET', '/api/vehicles/{vehicle}/notes', None, None),
+    ('api.update_vehicle_note', 'PUT', '/api/vehicles/{vehicle}/notes/{note}',
+     lambda s: {'content': 'Note modifiée'}, None),
+    ('api.delete_vehicle_note', 'DELETE', '/api/vehicles/{vehicle}/notes/{note}', None, None),
+    ('api.get_maintenances', 'GET', '/api/maintenances', None, None),
+    # Sur un véhicule existant : un véhicule ayant des entretiens ne peut pas être supprimé
+    ('api.create_maintenance', 'POST', '/api/maintenances',
+     lambda s: {'vehicle_id': 1, 'type': 'Révision', 'date': '2025-01-15T09:00:00Z'}, None),
+    ('api.get_rentals', 'GET', '/api/rentals', None, None),
+    ('api.get_reminders', 'GET', '/api/reminders', None, None),
+    ('api.get_dashboard_stats', 'GET', '/api/dashboard/stats', None, None),
+    ('api.delete_vehicle', 'DELETE', '/api/vehicles/{vehicle}', None, None),
+    ('api.sync_batch', 'POST', '/api/sync/batch', lambda s: {'actions': [
+        {'key': 'check-1', 'type': 'update', 'entity': 'vehicle', 'id': 2, 'data': {'status': 'available'}},
+        {'key': 'check-2', 'type': 'create', 'entity': 'note', 'vehicle_id': 2, 'data': {'content': 'Note'}},
+        {'key': 'check-3', 'type': 'update', 'entity': 'maintenance', 'id': 1, 'data': {'status': 'completed'}}]},
+     None),
+    ('api.batch', 'POST', '/api/batch', lambda s: {'requests': [
+        {'method': 'GET', 'path': '/api/vehicles/1/notes'},
+        {'method': 'GET', 'path': '/api/vehicles/2/notes'},
+        {'method': 'PUT', 'path': '/api/vehicles/3', 'body': {'status': 'available'}},
+        {'method': 'GET', 'path': '/api/dashboard/stats'}]}, _check_subresponses),
+    # Lectures parallèles après une écriture : l'utilisateur du lot, expiré par le
+    # commit, est rechargé dans la session de chaque thread
+    ('api.batch', 'POST', '/api/batch', lambda s: {'parallel': True, 'requests': [
+        {'method': 'POST', 'path': '/api/vehicles/1/notes', 'body': {'content': 'Note du lot'}},
+        {'method': 'GET', 'path': '/api/user'},
+        {'method': 'GET', 'path': '/api/user'},
+        {'method': 'GET', 'path': '/api/reminders'}]}, _check_subresponses),
+    ('api.get_sync_changes', 'GET', '/api/sync/changes?since=0&limit=200', None, None),
+    ('api.stream_fleet', 'GET', '/api/stream/fleet', None, None),
+    ('api.get_history', 'GET', '/api/history', None, None),
+    ('api.clear_history', 'POST', '/api/history/clear', None, None),
+    ('api.get_metrics', 'GET', '/api/_metrics', None, None),
+    ('api.get_slow_requests', 'GET', '/api/_debug/slow', None, None),
+]
+
+
+def check_routes(app, username, password, max_repeats=3):
+    """Exécute ROUTE_CASES ; retourne [(endpoint, statut, nb requêtes SQL, erreur ou None)]."""
+    covered = {case[0] for case in ROUTE_CASES}
+    missing = sorted(rule.endpoint for rule in app.url_map.iter_rules()
+                     if rule.endpoint.startswith('api.') and rule.endpoint not in covered)
+    if missing:
+        raise QueryPatternError(f"Routes sans cas de vérification : {', '.join(missing)}")
+
+    client = app.test_client()
+    state = {'username': username, 'password': password}
+    results = []
+    for endpoint, method, url, body, capture in ROUTE_CASES:
+        headers = {'Authorization': f"Bearer {state['token']}"} if 'token' in state else {}
+        with QueryRecorder(endpoint) as queries:
+            response = client.open(url.format(**state), method=method, headers=headers,
+                                   json=body(state) if body else None)
+        error = None
+        if response.status_code >= 400:
+            error = f"statut HTTP {response.status_code}"
+        else:
+            try:
+                queries.assert_max_repeats(max_repeats)
+                if capture is not None:
+                    capture(state, response.get_json())
+            except QueryPatternError as e:
+                error = str(e)
+        results.append((endpoint, response.status_code, queries.count, error))
+    return results
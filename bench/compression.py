@@ -0,0 +1,101 @@
+"""Gain en octets et coût CPU de la compression des réponses JSON de l'API.
+
+    python -m bench.compression --rows 2000
+"""
+import argparse
+import gzip
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATUSES = ['available', 'rented', 'maintenance', 'needs_repair', 'needs_cleaning']
+
+
+def vehicles_payload(rows, rng):
+    now = datetime(2024, 12, 1)
+    return [{
+        'id': i,
+        'brand': rng.choice(['Tesla', 'BMW', 'Audi', 'Mercedes', 'Porsche']),
+        'model': rng.choice(['Model 3', 'X5', 'Q7', 'C300', '911']),
+        'year': rng.randint(2018, 2024),
+        'license_plate': f"AB-{i:05d}",
+        'status': rng.choice(STATUSES),
+        'parking_spot': f"{rng.choice('ABCDE')}{rng.randint(1, 40)}",
+        'notes': [{
+            'id': i * 10 + n,
+            'vehicle_id': i,
+            'content': 'Nettoyage complet nécessaire après dernière location',
+            'created_at': (now - timedelta(days=n)).isoformat(),
+            'updated_at': (now - timedelta(days=n)).isoformat(),
+        } for n in range(rng.randint(0, 3))],
+    } for i in range(rows)]
+
+
+def history_payload(rows, rng):
+    now = datetime(2024, 12, 1)
+    return [{
+        'id': i,
+        'action_type': rng.choice(['create', 'update', 'delete']),
+        'entity_type': rng.choice(['vehicle', 'note']),
+        'entity_id': rng.randint(1, 5000),
+        'changes': {'status': {'old': rng.choice(STATUSES), 'new': rng.choice(STATUSES)}},
+        'timestamp': (now - timedelta(minutes=i)).isoformat(),
+    } for i in range(rows)]
+
+
+def rentals_payload(rows, rng):
+    now = datetime(2024, 12, 1)
+    return [{
+        'id': i,
+        'vehicle_id': rng.randint(1, 5000),
+        'start_date': (now + timedelta(days=i % 300)).isoformat(),
+        'end_date': (now + timedelta(days=i % 300 + 3)).isoformat(),
+        'status': rng.choice(['upcoming', 'active', 'completed', 'cancelled']),
+    } for i in range(rows)]
+
+
+def measure(data, compress, repeat):
+    start = time.process_time()
+    for _ in range(repeat):
+        out = compress(data)
+    cpu = (time.process_time() - start) / repeat
+    return len(out), cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    payloads = {
+        '/api/vehicles': vehicles_payload(args.rows, rng),
+        '/api/history': history_payload(args.rows, rng),
+        '/api/rentals': rentals_payload(args.rows, rng),
+    }
+
+    codecs = [(f"gzip-{level}", lambda d, l=level: gzip.compress(d, compresslevel=l, mtime=0))
+              for level in (1, 6, 9)]
+    if brotli is not None:
+        codecs += [(f"br-{q}", lambda d, q=q: brotli.compress(d, quality=q)) for q in (2, 5, 11)]
+
+    print(f"{'endpoint':<16}{'codec':<10}{'octets':>12}{'ratio':>8}{'CPU ms':>10}{'Mo/s':>9}")
+    for endpoint, payload in payloads.items():
+        data = json.dumps(payload).encode('utf-8')
+        print(f"{endpoint:<16}{'identity':<10}{len(data):>12}{1:>8.2f}{0:>10.2f}{'-':>9}")
+        for name, codec in codecs:
+            size, cpu = measure(data, codec, args.repeat)
+            throughput = len(data) / cpu / 1e6 if cpu else float('inf')
+            print(f"{'':<16}{name:<10}{size:>12}{len(data) / size:>8.2f}"
+                  f"{cpu * 1000:>10.2f}{throughput:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
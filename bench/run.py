@@ -0,0 +1,351 @@
+"""Banc d'essai HTTP de bout en bout de l'API.
+
+Démarre l'application sur une base pré-remplie (ou cible un serveur existant avec
+--url), rejoue un mélange réaliste de requêtes à concurrence fixe et enregistre
+débit, latences p50/p95/p99 et nombre de requêtes SQL dans un fichier JSON.
+
+    python -m bench.run run --scale 10k --concurrency 8 --duration 30 -o results.json
+    python -m bench.run compare baseline.json results.json
+"""
+import argparse
+import gzip
+import http.client
+import json
+import logging
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+
+from .seed import BENCH_PASSWORD, BENCH_USER, SCALES, seeded_database
+
+# scénario: (poids, endpoint Flask utilisé pour compter les requêtes SQL)
+MIX = {
+    'vehicles_list': (15, 'api.get_vehicles'),
+    'vehicle_get': (15, 'api.get_vehicle'),
+    'dashboard_stats': (20, 'api.get_dashboard_stats'),
+    'notes_list': (15, 'api.get_vehicle_notes'),
+    'note_create': (8, 'api.add_vehicle_note'),
+    'note_update': (5, 'api.update_vehicle_note'),
+    'note_delete': (5, 'api.delete_vehicle_note'),
+    'history': (10, 'api.get_history'),
+    'login': (2, 'api.login'),
+}
+
+# Seuils de régression du mode compare (variation relative)
+DEFAULT_THRESHOLDS = {'p95_ms': 0.10, 'p99_ms': 0.20, 'throughput': 0.10, 'sql_per_request': 0.0}
+
+_METRIC_RE = re.compile(r'^(fleet_sql_statements_total|fleet_http_requests_total)\{(.*)\} ([0-9.e+-]+)$')
+_ENDPOINT_RE = re.compile(r'endpoint="([^"]*)"')
+
+
+class Client:
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=120)
+        self.token = None
+
+    def request(self, method, path, body=None):
+        headers = {'Accept-Encoding': 'gzip'}
+        if self.token:
+            headers['Authorization'] = f"Bearer {self.token}"
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        try:
+            self.conn.request(method, path, payload, headers)
+            response = self.conn.getresponse()
+            data = response.read()
+            if response.getheader('Content-Encoding') == 'gzip':
+                data = gzip.decompress(data)
+        except (http.client.HTTPException, OSError):
+            self.conn.close()
+            raise
+        return response.status, data
+
+    def login(self):
+        status, data = self.request('POST', '/api/auth/login',
+                                    {'username': BENCH_USER, 'password': BENCH_PASSWORD})
+        if status != 200:
+            raise RuntimeError(f"Connexion impossible ({status}): {data[:200]}")
+        self.token = json.loads(data)['token']
+
+
+class Worker(threading.Thread):
+    def __init__(self, base_url, vehicles, deadline, rng):
+        super().__init__(daemon=True)
+        self.client = Client(base_url)
+        self.vehicles = vehicles
+        self.deadline = deadline
+        self.rng = rng
+        self.samples = {name: [] for name in MIX}
+        self.errors = {name: 0 for name in MIX}
+        self.notes = []
+        self.error = None
+        self.scenarios = [name for name in MIX]
+        self.weights = [MIX[name][0] for name in MIX]
+
+    def _call(self, scenario):
+        vehicle_id = self.rng.randint(1, self.vehicles)
+        if scenario == 'vehicles_list':
+            return self.client.request('GET', '/api/vehicles')
+        if scenario == 'vehicle_get':
+            return self.client.request('GET', f"/api/vehicles/{vehicle_id}")
+        if scenario == 'dashboard_stats':
+            return self.client.request('GET', '/api/dashboard/stats')
+        if scenario == 'notes_list':
+            return self.client.request('GET', f"/api/vehicles/{vehicle_id}/notes")
+        if scenario == 'note_create':
+            status, data = self.client.request('POST', f"/api/vehicles/{vehicle_id}/notes",
+                                               {'content': 'Note du banc d\'essai'})
+            if status == 201:
+                self.notes.append(json.loads(data)['note'])
+            return status, data
+        if scenario in ('note_update', 'note_delete'):
+            if not self.notes:
+                return None
+            note = self.notes.pop(self.rng.randrange(len(self.notes)))
+            path = f"/api/vehicles/{note['vehicle_id']}/notes/{note['id']}"
+            if scenario == 'note_update':
+                self.notes.append(note)
+                return self.client.request('PUT', path, {'content': 'Note modifiée'})
+            return self.client.request('DELETE', path)
+        if scenario == 'history':
+            return self.client.request('GET', '/api/history')
+        if scenario == 'login':
+            token = self.client.token
+            self.client.token = None
+            try:
+                return self.client.request('POST', '/api/auth/login',
+                                           {'username': BENCH_USER, 'password': BENCH_PASSWORD})
+            finally:
+                self.client.token = token
+        raise ValueError(scenario)
+
+    def run(self):
+        try:
+            self.client.login()
+        except Exception as e:
+            self.error = e
+            return
+        while time.perf_counter() < self.deadline:
+            scenario = self.rng.choices(self.scenarios, self.weights)[0]
+            start = time.perf_counter()
+            try:
+                result = self._call(scenario)
+            except (http.client.HTTPException, OSError):
+                self.errors[scenario] += 1
+                continue
+            if result is None:
+                continue
+            elapsed = time.perf_counter() - start
+            if result[0] >= 400:
+                self.errors[scenario] += 1
+            else:
+                self.samples[scenario].append(elapsed)
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def scrape_sql_counts(base_url):
+    # Compteurs par endpoint lus sur /api/_metrics : (requêtes SQL, requêtes HTTP)
+    status, data = Client(base_url).request('GET', '/api/_metrics')
+    counts = {}
+    if status != 200:
+        return counts
+    for line in data.decode('utf-8').splitlines():
+        match = _METRIC_RE.match(line)
+        if not match:
+            continue
+        endpoint = _ENDPOINT_RE.search(match.group(2)).group(1)
+        sql, http_count = counts.get(endpoint, (0, 0))
+        if match.group(1) == 'fleet_sql_statements_total':
+            sql += float(match.group(3))
+        else:
+            http_count += float(match.group(3))
+        counts[endpoint] = (sql, http_count)
+    return counts
+
+
+def start_server(database_url):
+    from werkzeug.serving import make_server
+    from app import create_app
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': database_url})
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    server = template = database_url = None
+    vehicles = SCALES[args.scale]['vehicles']
+    if args.url:
+        base_url = args.url.rstrip('/')
+    else:
+        # Copie fraîche du modèle : les écritures d'une exécution ne faussent pas la suivante
+        template = seeded_database(args.scale, refresh=args.reseed)
+        database_url = template.clone()
+        server, base_url = start_server(database_url)
+
+    try:
+        before = scrape_sql_counts(base_url)
+        deadline = time.perf_counter() + args.duration
+        workers = [Worker(base_url, vehicles, deadline, random.Random(args.seed + i))
+                   for i in range(args.concurrency)]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+            if worker.error is not None:
+                raise worker.error
+        elapsed = time.perf_counter() - started
+        after = scrape_sql_counts(base_url)
+    finally:
+        if server is not None:
+            server.shutdown()
+            template.drop(database_url)
+
+    scenarios = {}
+    for name, (_, endpoint) in MIX.items():
+        samples = [s for worker in workers for s in worker.samples[name]]
+        errors = sum(worker.errors[name] for worker in workers)
+        sql_before, http_before = before.get(endpoint, (0, 0))
+        sql_after, http_after = after.get(endpoint, (0, 0))
+        requests = http_after - http_before
+        scenarios[name] = {
+            'requests': len(samples),
+            'errors': errors,
+            'throughput': round(len(samples) / elapsed, 2),
+            'mean_ms': round(sum(samples) / len(samples) * 1000, 3) if samples else None,
+            'p50_ms': _ms(percentile(samples, 50)),
+            'p95_ms': _ms(percentile(samples, 95)),
+            'p99_ms': _ms(percentile(samples, 99)),
+            'sql_per_request': round((sql_after - sql_before) / requests, 2) if requests else None,
+        }
+
+    total = sum(s['requests'] for s in scenarios.values())
+    results = {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(),
+            'revision': git_revision(),
+            'scale': args.scale,
+            'target': args.url or 'in-process',
+            'concurrency': args.concurrency,
+            'duration_s': round(elapsed, 2),
+            'python': sys.version.split()[0],
+        },
+        'total': {'requests': total, 'throughput': round(total / elapsed, 2)},
+        'scenarios': scenarios,
+    }
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print_results(results)
+    print(f"\nRésultats écrits dans {args.output}")
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3) if seconds is not None else None
+
+
+def print_results(results):
+    print(f"{'scénario':<18}{'req':>8}{'err':>6}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'SQL/req':>9}")
+    for name, s in results['scenarios'].items():
+        print(f"{name:<18}{s['requests']:>8}{s['errors']:>6}{s['throughput']:>9}"
+              f"{_fmt(s['p50_ms']):>9}{_fmt(s['p95_ms']):>9}{_fmt(s['p99_ms']):>9}"
+              f"{_fmt(s['sql_per_request']):>9}")
+    print(f"{'total':<18}{results['total']['requests']:>8}{'':>6}{results['total']['throughput']:>9}")
+
+
+def _fmt(value):
+    return '-' if value is None else f"{value:.1f}"
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    if args.threshold is not None:
+        thresholds.update({'p95_ms': args.threshold, 'p99_ms': args.threshold * 2,
+                           'throughput': args.threshold})
+
+    regressions = []
+    print(f"{'scénario':<18}{'mesure':<17}{'référence':>11}{'actuel':>11}{'écart':>9}")
+    for name, base in baseline['scenarios'].items():
+        cur = current['scenarios'].get(name)
+        if cur is None:
+            continue
+        for metric, limit in thresholds.items():
+            old, new = base.get(metric), cur.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            # Le débit régresse quand il baisse, les autres mesures quand elles montent
+            worse = -change if metric == 'throughput' else change
+            flag = ''
+            if worse > limit:
+                flag = '  RÉGRESSION'
+                regressions.append((name, metric, old, new))
+            print(f"{name:<18}{metric:<17}{old:>11.2f}{new:>11.2f}{change:>+9.1%}{flag}")
+
+    if regressions:
+        print(f"\n{len(regressions)} régression(s) détectée(s)")
+        sys.exit(1)
+    print("\nAucune régression")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = sub.add_parser('run', help="Exécute le banc d'essai")
+    run_parser.add_argument('--scale', choices=SCALES, default='1k')
+    run_parser.add_argument('--concurrency', type=int, default=8)
+    run_parser.add_argument('--duration', type=float, default=30)
+    run_parser.add_argument('--seed', type=int, default=42)
+    run_parser.add_argument('--url', help="Serveur déjà démarré (sinon serveur intégré)")
+    run_parser.add_argument('--reseed', action='store_true', help="Régénère la base de test")
+    run_parser.add_argument('-o', '--output', default=os.path.join('bench', 'results.json'))
+    run_parser.set_defaults(func=run)
+
+    compare_parser = sub.add_parser('compare', help="Compare deux fichiers de résultats")
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float,
+                                help="Écart relatif toléré sur latence et débit (défaut 0.10)")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
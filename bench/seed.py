@@ -0,0 +1,31 @@
+"""Bases pré-remplies pour les bancs d'essai : un modèle par échelle, cloné à chaque exécution."""
+import os
+from datetime import datetime
+
+from app.seed import DEFAULT_PASSWORD
+from app.testing import DatabaseTemplate
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.data')
+
+# Échelles sélectionnables ; environ 44 locations par véhicule et par an
+SCALES = {
+    '1k': {'vehicles': 1000, 'years': 1.0},
+    '10k': {'vehicles': 10000, 'years': 1.0},
+    '100k': {'vehicles': 100000, 'years': 0.25},  # ~1M de locations
+}
+
+# Date de référence fixe : deux générations à la même échelle sont identiques
+REFERENCE_NOW = datetime(2024, 12, 1)
+
+BENCH_USER = 'user1'
+BENCH_PASSWORD = DEFAULT_PASSWORD
+
+
+def seeded_database(scale, refresh=False):
+    # Modèle à l'échelle demandée, généré au premier appel puis à chaque
+    # changement du schéma ou du générateur
+    template = DatabaseTemplate(dict(SCALES[scale], now=REFERENCE_NOW), directory=DATA_DIR)
+    if refresh and os.path.exists(template.path):
+        os.remove(template.path)
+    template.ensure()
+    return template
@@ -0,0 +1,106 @@
+"""Temps de sérialisation JSON d'une charge de 10k lignes.
+
+Compare l'encodeur par défaut de Flask (dates converties à la main dans chaque
+route) à l'encodeur de app.serialization, avec orjson et avec le repli stdlib.
+
+    python -m bench.serialization --rows 10000
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from flask import Flask
+from flask.json import dumps as flask_dumps
+
+from app import serialization
+from app.models import Note, Vehicle
+
+STATUSES = ['available', 'rented', 'maintenance', 'needs_repair', 'needs_cleaning']
+
+
+def rental_rows(rows):
+    now = datetime(2024, 12, 1, 9, 30)
+    return [{
+        'id': i,
+        'vehicle_id': i % 5000,
+        'start_date': now + timedelta(hours=i),
+        'end_date': now + timedelta(hours=i + 72),
+        'daily_rate': Decimal('89.99'),
+        'status': STATUSES[i % len(STATUSES)],
+    } for i in range(rows)]
+
+
+def flask_manual_dumps(rows):
+    # Ce que faisaient les routes : isoformat() et str() à la main, puis flask.json
+    return flask_dumps([dict(row, start_date=row['start_date'].isoformat(),
+                             end_date=row['end_date'].isoformat(),
+                             daily_rate=str(row['daily_rate']))
+                        for row in rows])
+
+
+def flask_to_dict_dumps(vehicles):
+    return flask_dumps([vehicle.to_dict() for vehicle in vehicles])
+
+
+def vehicle_rows(rows):
+    now = datetime(2024, 12, 1, 9, 30)
+    vehicles = []
+    for i in range(rows):
+        vehicle = Vehicle(id=i, brand='Tesla', model='Model 3', year=2023,
+                          license_plate=f"AB-{i:05d}", status=STATUSES[i % 5],
+                          parking_spot=f"A{i % 40}")
+        vehicle.notes = [Note(id=i, vehicle_id=i, content='Excellent état général',
+                              created_at=now, updated_at=now)]
+        vehicles.append(vehicle)
+    return vehicles
+
+
+def stdlib_dumps(obj):
+    return json.dumps(obj, default=serialization.to_json_compatible, ensure_ascii=False,
+                      separators=(',', ':')).encode('utf-8')
+
+
+def timed(fn, payload, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn(payload)
+        best = min(best, time.perf_counter() - start)
+    return best, len(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    serialization.init_app(app)
+
+    cases = [
+        ('rentals', 'flask (isoformat manuel)', flask_manual_dumps, rental_rows(args.rows)),
+        ('rentals', 'stdlib + to_json_compatible', stdlib_dumps, rental_rows(args.rows)),
+    ]
+    if serialization.orjson is not None:
+        cases.append(('rentals', 'orjson', serialization.dumps, rental_rows(args.rows)))
+
+    with app.app_context():
+        vehicles = vehicle_rows(args.rows)
+        cases += [
+            ('vehicles', 'flask (to_dict)', flask_to_dict_dumps, vehicles),
+            ('vehicles', 'stdlib (lignes de modèle)', stdlib_dumps, vehicles),
+        ]
+        if serialization.orjson is not None:
+            cases.append(('vehicles', 'orjson (lignes de modèle)', serialization.dumps, vehicles))
+
+        print(f"{'charge':<10}{'encodeur':<30}{'ms':>10}{'octets':>12}")
+        for name, label, fn, payload in cases:
+            seconds, size = timed(fn, payload, args.repeat)
+            print(f"{name:<10}{label:<30}{seconds * 1000:>10.2f}{size:>12}")
+
+
+if __name__ == '__main__':
+    main()
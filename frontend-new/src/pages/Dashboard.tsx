@@ -13,6 +13,7 @@ import CleaningServicesIcon from '@mui/icons-material/CleaningServices';
 import WarningIcon from '@mui/icons-material/Warning';
 import TimeToLeaveIcon from '@mui/icons-material/TimeToLeave';
 import axios from 'axios';
+import { subscribeFleet } from '../services/fleetStream';
 
 interface DashboardStats {
   total_vehicles: number;
@@ -52,9 +53,17 @@ const Dashboard: React.FC = () => {
     };
 
     fetchStats();
-    // Rafraîchir les stats toutes les 30 secondes
-    const interval = setInterval(fetchStats, 30000);
-    return () => clearInterval(interval);
+    // Rafraîchir les stats quand la flotte change (flux SSE), en regroupant les
+    // événements rapprochés en un seul appel
+    let timer: ReturnType<typeof setTimeout> | undefined;
+    const unsubscribe = subscribeFleet(() => {
+      clearTimeout(timer);
+      timer = setTimeout(fetchStats, 500);
+    });
+    return () => {
+      clearTimeout(timer);
+      unsubscribe();
+    };
   }, []);
 
   const cards = [
@@ -2,6 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { Container, Paper } from '@mui/material';
 import ParkingMap from '../components/ParkingMap/ParkingMap';
 import axios from 'axios';
+import { subscribeFleet } from '../services/fleetStream';
 
 interface Vehicle {
   id: number;
@@ -26,6 +27,18 @@ const Parking: React.FC = () => {
 
   useEffect(() => {
     fetchVehicles();
+    // Statut et place mis à jour en direct ; liste rechargée après une coupure trop longue
+    return subscribeFleet((name, data) => {
+      if (name === 'vehicle') {
+        setVehicles((current) => current.map((vehicle) => (
+          vehicle.id === data.id ? { ...vehicle, status: data.status, parking_spot: data.parking_spot } : vehicle
+        )));
+      } else if (name === 'vehicle_deleted') {
+        setVehicles((current) => current.filter((vehicle) => vehicle.id !== data.id));
+      } else if (name === 'reset') {
+        fetchVehicles();
+      }
+    });
   }, []);
 
   return (
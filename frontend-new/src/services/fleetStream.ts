@@ -0,0 +1,65 @@
+import axios from 'axios';
+
+// Live fleet events pushed by GET /api/stream/fleet (server-sent events)
+export type FleetEventName =
+  | 'vehicle'
+  | 'vehicle_deleted'
+  | 'rental'
+  | 'rental_started'
+  | 'rental_ended'
+  | 'reminder_due'
+  | 'reset';
+
+const EVENT_NAMES: FleetEventName[] = [
+  'vehicle',
+  'vehicle_deleted',
+  'rental',
+  'rental_started',
+  'rental_ended',
+  'reminder_due',
+  'reset',
+];
+
+const LAST_EVENT_ID_KEY = 'fleetStream:lastEventId';
+
+// Delay before reconnecting after the server refused the stream (503 when a worker already
+// has its maximum of subscribers): EventSource gives up on any non-200 response.
+const REFUSED_RETRY_MS = 30000;
+
+// EventSource cannot send an Authorization header: the token goes in the query string.
+// The browser resends Last-Event-ID itself on reconnect; the stored one covers page reloads
+// and reconnections after a refusal.
+export function subscribeFleet(onEvent: (name: FleetEventName, data: any) => void): () => void {
+  let source: EventSource | null = null;
+  let retryTimer: ReturnType<typeof setTimeout> | null = null;
+  let closed = false;
+
+  const connect = () => {
+    const token = localStorage.getItem('token');
+    const params = new URLSearchParams();
+    if (token) params.set('token', token);
+    const lastEventId = sessionStorage.getItem(LAST_EVENT_ID_KEY);
+    if (lastEventId) params.set('last_event_id', lastEventId);
+
+    const current = new EventSource(`${axios.defaults.baseURL ?? ''}/api/stream/fleet?${params}`);
+    EVENT_NAMES.forEach((name) => {
+      current.addEventListener(name, ((event: MessageEvent) => {
+        if (event.lastEventId) sessionStorage.setItem(LAST_EVENT_ID_KEY, event.lastEventId);
+        onEvent(name, JSON.parse(event.data));
+      }) as EventListener);
+    });
+    current.onerror = () => {
+      if (current.readyState !== EventSource.CLOSED || closed) return;
+      // Jitter spreads the reconnections of tabs refused at the same time
+      retryTimer = setTimeout(connect, REFUSED_RETRY_MS * (0.5 + Math.random()));
+    };
+    source = current;
+  };
+
+  connect();
+  return () => {
+    closed = true;
+    if (retryTimer) clearTimeout(retryTimer);
+    source?.close();
+  };
+}
@@ -22,6 +22,12 @@ const cacheStore = localforage.createInstance({
   storeName: "cache"
 });
 
+// Other synced entities (rentals, maintenances...), keyed "<entity>:<id>"
+const recordsStore = localforage.createInstance({
+  name: "turo-fleet-manager",
+  storeName: "records"
+});
+
 interface PendingAction {
   id: string;
   url: string;
@@ -30,6 +36,103 @@ interface PendingAction {
   timestamp: number;
 }
 
+interface SyncAction {
+  key: string;
+  type: 'create' | 'update' | 'delete';
+  entity: 'vehicle' | 'note' | 'maintenance';
+  id?: number;
+  vehicle_id?: number;
+  data?: any;
+}
+
+interface SyncResult {
+  key: string | null;
+  status: number;
+  data?: any;
+  error?: string;
+  replayed?: boolean;
+}
+
+interface Change {
+  seq: number;
+  entity: string;
+  id: number;
+  deleted: boolean;
+  data?: any;
+}
+
+// Same limit as SYNC_BATCH_MAX on the server
+const SYNC_BATCH_SIZE = 500;
+const CHANGES_PAGE_SIZE = 1000;
+const SYNC_CURSOR_KEY = 'sync:cursor';
+
+function authHeaders(): Record<string, string> {
+  const token = localStorage.getItem('token');
+  return token ? { Authorization: `Bearer ${token}` } : {};
+}
+
+// Vehicles are stored with their notes embedded, as returned by /api/vehicles
+async function applyChange(change: Change) {
+  if (change.entity === 'vehicle') {
+    if (change.deleted) {
+      await vehiclesStore.removeItem(String(change.id));
+    } else {
+      const existing: any = await vehiclesStore.getItem(String(change.id));
+      await vehiclesStore.setItem(String(change.id), { ...change.data, notes: existing?.notes ?? [] });
+    }
+  } else if (change.entity === 'note') {
+    const updates: any[] = [];
+    await vehiclesStore.iterate((vehicle: any) => {
+      const notes = (vehicle.notes ?? []).filter((note: any) => note.id !== change.id);
+      const owner = !change.deleted && vehicle.id === change.data.vehicle_id;
+      if (owner) {
+        notes.push(change.data);
+      }
+      if (owner || notes.length !== (vehicle.notes ?? []).length) {
+        updates.push({ ...vehicle, notes });
+      }
+    });
+    for (const vehicle of updates) {
+      await vehiclesStore.setItem(String(vehicle.id), vehicle);
+    }
+  } else if (change.deleted) {
+    await recordsStore.removeItem(`${change.entity}:${change.id}`);
+  } else {
+    await recordsStore.setItem(`${change.entity}:${change.id}`, change.data);
+  }
+}
+
+const ACTION_TYPES: Record<string, SyncAction['type']> = {
+  POST: 'create',
+  PUT: 'update',
+  PATCH: 'update',
+  DELETE: 'delete',
+};
+
+// Pending actions are stored as the REST call they replace; the batch endpoint
+// takes the entity and ids instead of the URL
+function toSyncAction(action: PendingAction): SyncAction {
+  const type = ACTION_TYPES[action.method.toUpperCase()];
+  const path = action.url.replace(/^.*\/api\//, '').split('?')[0].split('/');
+  let entity: SyncAction['entity'];
+  let id: number | undefined;
+  let vehicleId: number | undefined;
+
+  if (path[0] === 'vehicles' && path[2] === 'notes') {
+    entity = 'note';
+    vehicleId = Number(path[1]);
+    id = path[3] ? Number(path[3]) : undefined;
+  } else if (path[0] === 'vehicles') {
+    entity = 'vehicle';
+    id = path[1] ? Number(path[1]) : undefined;
+  } else {
+    entity = 'maintenance';
+    id = path[1] ? Number(path[1]) : undefined;
+  }
+
+  return { key: action.id, type, entity, id, vehicle_id: vehicleId, data: action.data ?? undefined };
+}
+
 export const offlineSync = {
   // Cache API response
   async cacheApiResponse(url: string, data: any) {
@@ -77,27 +180,73 @@ export const offlineSync = {
     await pendingActionsStore.removeItem(id);
   },
 
-  // Sync pending actions when online
+  // Sync pending actions when online: one POST /api/sync/batch per chunk,
+  // the pending action id is the idempotency key so a retried chunk is not applied twice
   async syncPendingActions() {
     if (!navigator.onLine) return;
 
-    const actions = await this.getPendingActions();
-    
-    for (const action of actions) {
+    const actions = (await this.getPendingActions()).sort((a, b) => a.timestamp - b.timestamp);
+
+    for (let start = 0; start < actions.length; start += SYNC_BATCH_SIZE) {
+      const chunk = actions.slice(start, start + SYNC_BATCH_SIZE);
       try {
-        const response = await fetch(action.url, {
-          method: action.method,
+        const response = await fetch('/api/sync/batch', {
+          method: 'POST',
           headers: {
             'Content-Type': 'application/json',
+            ...authHeaders(),
           },
-          body: JSON.stringify(action.data),
+          body: JSON.stringify({ actions: chunk.map(toSyncAction) }),
         });
+        if (!response.ok) {
+          console.error('Error syncing actions:', response.status);
+          return;
+        }
+
+        const { results } = await response.json();
+        for (const result of results as SyncResult[]) {
+          // 5xx: kept for the next sync; success or client error: nothing left to retry
+          if (result.key && result.status < 500) {
+            await this.removePendingAction(result.key);
+          }
+          if (result.status >= 400) {
+            console.warn(`Action ${result.key} rejected:`, result.error);
+          }
+        }
+      } catch (error) {
+        console.error('Error syncing actions:', error);
+        return;
+      }
+    }
+  },
 
-        if (response.ok) {
-          await this.removePendingAction(action.id);
+  // Pull what changed on the server since the last sync (GET /api/sync/changes)
+  // into the local stores, instead of downloading the whole vehicle list again
+  async pullChanges() {
+    if (!navigator.onLine) return;
+
+    let cursor = Number((await cacheStore.getItem(SYNC_CURSOR_KEY)) ?? 0);
+    let hasMore = true;
+    while (hasMore) {
+      try {
+        const response = await fetch(`/api/sync/changes?since=${cursor}&limit=${CHANGES_PAGE_SIZE}`, {
+          headers: authHeaders(),
+        });
+        if (!response.ok) {
+          console.error('Error pulling changes:', response.status);
+          return;
+        }
+        const page = await response.json();
+        for (const change of page.changes as Change[]) {
+          await applyChange(change);
         }
+        // Saved after each page: an interrupted pull resumes where it stopped
+        cursor = page.cursor;
+        hasMore = page.has_more;
+        await cacheStore.setItem(SYNC_CURSOR_KEY, cursor);
       } catch (error) {
-        console.error('Error syncing action:', error);
+        console.error('Error pulling changes:', error);
+        return;
       }
     }
   },
@@ -107,13 +256,15 @@ export const offlineSync = {
     await vehiclesStore.clear();
     await pendingActionsStore.clear();
     await cacheStore.clear();
+    await recordsStore.clear();
   }
 };
 
 // Listen for online/offline events
 window.addEventListener('online', () => {
   console.log('Back online');
-  offlineSync.syncPendingActions();
+  // Local actions first, then the server changes (including their results)
+  offlineSync.syncPendingActions().then(() => offlineSync.pullChanges());
 });
 
 window.addEventListener('offline', () => {
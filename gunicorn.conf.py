@@ -0,0 +1,32 @@
+import os
+import tempfile
+
+# Dossier partagé par les workers pour agréger les métriques (/api/_metrics)
+os.environ.setdefault('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'fleet-metrics'))
+# Anneau en mémoire partagée du bus d'invalidation des caches entre workers
+os.environ.setdefault('INVALIDATION_DIR', os.path.join(tempfile.gettempdir(), 'fleet-invalidation'))
+# Journal des modifications archivé en continu (flask fleet recover)
+os.environ.setdefault('CHANGELOG_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                    'backups', 'changes'))
+
+# Threads : chaque abonné au flux /api/stream/fleet occupe un thread (mais aucune
+# connexion à la base) ; avec des workers synchrones il bloquerait un worker entier.
+# Les abonnés au-delà de STREAM_MAX_SUBSCRIBERS par worker reçoivent un 503 : au
+# moins STREAM_RESERVED_THREADS threads restent libres pour l'API
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 32))
+os.environ.setdefault('STREAM_MAX_SUBSCRIBERS',
+                      str(max(threads - int(os.environ.get('STREAM_RESERVED_THREADS', 8)), 1)))
+
+
+def on_starting(server):
+    from app.metrics import clear_directory
+
+    os.makedirs(os.environ['METRICS_DIR'], exist_ok=True)
+    clear_directory(os.environ['METRICS_DIR'])
+
+
+def child_exit(server, worker):
+    from app.metrics import mark_process_dead
+
+    mark_process_dead(os.environ['METRICS_DIR'], worker.pid)
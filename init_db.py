@@ -1,7 +1,9 @@
-from app import app, db
+from app import create_app, db
 from app.models import Vehicle, Maintenance, Cleaning, Rental, Note
 from datetime import datetime, timedelta
 
+app = create_app()
+
 def init_db():
     with app.app_context():
         # Supprime toutes les tables existantes
@@ -18,8 +20,7 @@ def init_db():
                 year=2023,
                 license_plate='ABC123',
                 status='available',
-                parking_spot='A1',
-                daily_rate=89.99
+                parking_spot='A1'
             ),
             Vehicle(
                 brand='BMW',
@@ -27,8 +28,7 @@ def init_db():
                 year=2022,
                 license_plate='XYZ789',
                 status='rented',
-                parking_spot='B2',
-                daily_rate=129.99
+                parking_spot='B2'
             ),
             Vehicle(
                 brand='Mercedes',
@@ -36,8 +36,7 @@ def init_db():
                 year=2023,
                 license_plate='DEF456',
                 status='maintenance',
-                parking_spot='C3',
-                daily_rate=99.99
+                parking_spot='C3'
             ),
             Vehicle(
                 brand='Porsche',
@@ -45,8 +44,7 @@ def init_db():
                 year=2022,
                 license_plate='GHI789',
                 status='needs_repair',
-                parking_spot='D4',
-                daily_rate=199.99
+                parking_spot='D4'
             ),
             Vehicle(
                 brand='Audi',
@@ -54,8 +52,7 @@ def init_db():
                 year=2023,
                 license_plate='JKL012',
                 status='needs_cleaning',
-                parking_spot='E5',
-                daily_rate=149.99
+                parking_spot='E5'
             )
         ]
 
@@ -0,0 +1,42 @@
+"""offline sync change feed
+
+Revision ID: 2c6d9e83a042
+Revises: 7a1e4c2b9041
+Create Date: 2026-10-19 19:00:00.000000
+
+"""
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2c6d9e83a042'
+down_revision = '7a1e4c2b9041'
+branch_labels = None
+depends_on = None
+
+
+def _exists(table):
+    # Bases où db.create_all a déjà créé la table au démarrage de l'application
+    return not context.is_offline_mode() and table in sa.inspect(op.get_bind()).get_table_names()
+
+
+def upgrade():
+    if _exists('sync_change'):
+        return
+    # AUTOINCREMENT : un seq servi n'est jamais réattribué après suppression de la dernière
+    # ligne. Le flux des lignes existantes se remplit ensuite par `flask fleet sync-backfill`.
+    op.create_table('sync_change',
+        sa.Column('seq', sa.Integer(), nullable=False),
+        sa.Column('entity_type', sa.String(length=20), nullable=False),
+        sa.Column('entity_id', sa.Integer(), nullable=False),
+        sa.Column('deleted', sa.Boolean(), nullable=False),
+        sa.Column('changed_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('seq'),
+        sa.UniqueConstraint('entity_type', 'entity_id'),
+        sqlite_autoincrement=True
+    )
+
+
+def downgrade():
+    op.drop_table('sync_change')
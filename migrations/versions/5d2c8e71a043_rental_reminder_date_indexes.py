@@ -0,0 +1,33 @@
+"""rental and reminder date indexes
+
+Revision ID: 5d2c8e71a043
+Revises: 159870efd385
+Create Date: 2026-10-19 18:20:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5d2c8e71a043'
+down_revision = '159870efd385'
+branch_labels = None
+depends_on = None
+
+
+# Bases créées par db.create_all après l'ajout des index : ils existent déjà
+INDEXES = (
+    ('ix_rental_start_date', 'rental', 'start_date'),
+    ('ix_rental_end_date', 'rental', 'end_date'),
+    ('ix_reminder_due_date', 'reminder', 'due_date'),
+)
+
+
+def upgrade():
+    for name, table, column in INDEXES:
+        op.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({column})')
+
+
+def downgrade():
+    for name, _, _ in INDEXES:
+        op.execute(f'DROP INDEX IF EXISTS {name}')
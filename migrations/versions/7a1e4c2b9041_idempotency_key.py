@@ -0,0 +1,43 @@
+"""idempotency keys of offline sync actions
+
+Revision ID: 7a1e4c2b9041
+Revises: 5d2c8e71a043
+Create Date: 2026-10-19 18:40:00.000000
+
+"""
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a1e4c2b9041'
+down_revision = '5d2c8e71a043'
+branch_labels = None
+depends_on = None
+
+
+def _exists(table):
+    # Bases où db.create_all a déjà créé la table au démarrage de l'application
+    return not context.is_offline_mode() and table in sa.inspect(op.get_bind()).get_table_names()
+
+
+def upgrade():
+    if _exists('idempotency_key'):
+        return
+    op.create_table('idempotency_key',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('key', sa.String(length=64), nullable=False),
+        sa.Column('status_code', sa.Integer(), nullable=False),
+        sa.Column('response', sa.JSON(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'key')
+    )
+    op.create_index(op.f('ix_idempotency_key_created_at'), 'idempotency_key', ['created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_idempotency_key_created_at'), table_name='idempotency_key')
+    op.drop_table('idempotency_key')